@@ -26,6 +26,8 @@
 import logging
 logger = logging.getLogger(__name__)
 
+import bisect
+
 import gi
 gi.require_version('Gtk', '3.0')
 from gi.repository import Gtk, Gdk, GLib
@@ -45,10 +47,8 @@ class Overview(builder.Builder):
 
     #: :class:`~Gtk.Viewport` that replaces normal panes when deck is shown
     deck_viewport = None
-    #: :class:`~Gtk.Grid` that displays all the slides of the overview
-    deck_grid = None
-    #: The :class:`~Gtk.DrawingArea` for the first slide
-    deck0 = None
+    #: The :class:`~Gtk.DrawingArea` on which all the slides of the overview are drawn
+    deck_da = None
 
     #: A :class:`~Gtk.OffscreenWindow` where we render the deck interface when it's not shown
     deck_off_render = None
@@ -65,6 +65,8 @@ class Overview(builder.Builder):
     resize_cache = lambda *args: None
     #: callback, to be connected to :func:`~pympress.ui.UI.goto_page`
     goto_page = lambda *args: None
+    #: callback, to be connected to :func:`~pympress.ui.UI.get_current_page`
+    get_current_page = lambda *args: 0
     #: :class:`~pympress.surfacecache.SurfaceCache` instance.
     cache = None
 
@@ -75,6 +77,22 @@ class Overview(builder.Builder):
     #: `int` How large (at most) to make rows
     max_row_size = 6
 
+    #: `list` of the page numbers displayed in the grid
+    pages = []
+    #: `tuple` of the width and height of each slide in the grid
+    tile_size = (0, 0)
+    #: `int` horizontal offset of the first column, to center the grid
+    grid_offset = 0
+    #: `int` space between slides in the grid
+    spacing = 5
+    #: `int` index in :attr:`pages` of the slide under the pointer, or `None`
+    hovered = None
+
+    #: `list` of indexes in :attr:`pages` of the slides to render, in order of priority
+    render_queue = []
+    #: `int` id of the :func:`~GLib.idle_add` source rendering the slides in :attr:`render_queue`, or `None`
+    render_source = None
+
     #: The :class:`~Gtk.DrawingArea` in the content window
     c_da = None
 
@@ -84,11 +102,12 @@ class Overview(builder.Builder):
         self.cache = builder.cache
         self.load_ui('deck')
         builder.load_widgets(self)
-        self.deck_da_list = [self.deck0]
         self.get_application().add_window(self.deck_off_render)
 
         self.load_layout = builder.get_callback_handler('load_layout')
         self.goto_page = builder.get_callback_handler('goto_page')
+        self.get_current_page = builder.get_callback_handler('get_current_page')
+        self.cache.subscribe('deck', self.on_page_rendered)
         self.compute_frame_grid = builder.get_callback_handler('compute_frame_grid')
         self.setup_doc_callbacks(builder.doc)
 
@@ -104,11 +123,19 @@ class Overview(builder.Builder):
 
 
     def on_deck_hover(self, widget, event):
-        """ Track when each deck in the slide is hovered
+        """ Track which slide of the deck is hovered
+
+        Args:
+            widget (:class:`~Gtk.Widget`):  the widget which has received the event
+            event (:class:`~Gdk.Event`):  the GTK event, which contains the pointer position
         """
-        ctx = widget.get_style_context()
-        ctx.set_state(Gtk.StateFlags.PRELIGHT if event.type == Gdk.EventType.ENTER_NOTIFY else Gtk.StateFlags.NORMAL)
-        widget.queue_draw()
+        hovered = self.tile_at(event.x, event.y) if event.type == Gdk.EventType.MOTION_NOTIFY else None
+        if hovered == self.hovered:
+            return
+
+        for index in {self.hovered, hovered} - {None}:
+            widget.queue_draw_area(*self.tile_rect(index))
+        self.hovered = hovered
 
 
     def setup_doc_callbacks(self, doc):
@@ -121,7 +148,7 @@ class Overview(builder.Builder):
         self.has_labels           = doc.has_labels
         self.get_last_label_pages = doc.get_last_label_pages
 
-        self.create_drawing_areas()
+        self.update_pages()
 
 
     def try_cancel(self):
@@ -137,148 +164,208 @@ class Overview(builder.Builder):
         return True
 
 
-    def create_drawing_areas(self):
-        """ Build DrawingArea and AspectFrame elements to display later on
+    def update_pages(self):
+        """ Build the list of pages to display in the grid
         """
         pages = self.get_last_label_pages() if not self.all_pages and self.has_labels() else range(self.pages_number())
-        self.grid_size = (len(pages), 1)
-
-        # Always keep the first drawing area as it is used to provide surfaces in the cache
-        for row in range(1, self.grid_size[0]):
-            self.deck_grid.remove_row(row)
-        for col in range(1, self.grid_size[1]):
-            self.deck_grid.remove_row(col)
-
-        # Set drawing areas
-        for num, da in enumerate(self.deck_da_list[1:], 1):
-            self.deck_grid.attach(da.get_parent(), 1, num, 1, 1)
-
-        for num in range(len(self.deck_da_list), len(pages)):
-            da = Gtk.DrawingArea()
-            da.add_events(Gdk.EventMask.TOUCH_MASK | Gdk.EventMask.ENTER_NOTIFY_MASK | Gdk.EventMask.LEAVE_NOTIFY_MASK |
-                          Gdk.EventMask.BUTTON_PRESS_MASK | Gdk.EventMask.BUTTON_RELEASE_MASK)
-            da.connect('draw', self.on_deck_draw)
-            da.connect('button-release-event', self.on_deck_click)
-            da.connect('touch-event', self.on_deck_click)
-            da.connect('enter-notify-event', self.on_deck_hover)
-            da.connect('leave-notify-event', self.on_deck_hover)
-            self.deck_da_list.append(da)
-
-            frame = Gtk.AspectFrame()
-            frame.get_style_context().add_class('grid-frame')
-            frame.set_shadow_type(Gtk.ShadowType.NONE)
-            frame.add(da)
-
-            self.deck_grid.attach(frame, 1, num, 1, 1)
+        self.pages = list(pages)
+        self.hovered = None
 
-        ratio = self.c_da.get_allocated_width() / self.c_da.get_allocated_height()
-        for page, da in zip(pages, self.deck_da_list):
-            da.get_parent().set(.5, .5, ratio, False)
-            da.set_name('deck{}'.format(page))
+        if self.deck_mode:
+            self.reset_grid()
+
+
+    def tile_rect(self, index):
+        """ Get the position of a slide in the grid
+
+        Args:
+            index (`int`):  the index of the slide in :attr:`pages`
+
+        Returns:
+            `tuple`: the x and y position, width and height of the slide in the drawing area
+        """
+        tw, th = self.tile_size
+        row, col = divmod(index, self.grid_size[1])
+        return self.grid_offset + col * (tw + self.spacing), row * (th + self.spacing), tw, th
+
+
+    def tile_at(self, x, y):
+        """ Find the slide at a position in the grid
+
+        Args:
+            x (`float`):  the horizontal position in the drawing area
+            y (`float`):  the vertical position in the drawing area
+
+        Returns:
+            `int`: the index of the slide in :attr:`pages`, or `None` if there is no slide at that position
+        """
+        tw, th = self.tile_size
+        if not tw or not th:
+            return None
+
+        col, dx = divmod(x - self.grid_offset, tw + self.spacing)
+        row, dy = divmod(y, th + self.spacing)
+        index = int(row) * self.grid_size[1] + int(col)
+        if dx >= tw or dy >= th or not 0 <= col < self.grid_size[1] or not 0 <= index < len(self.pages):
+            return None
+        return index
 
 
     def reset_grid(self, *args):
         """ Set the slides configuration and size in the grid
         """
         # Gather info about slides to display
-        num_pages = self.pages_number() if self.all_pages or not self.has_labels() else len(self.get_last_label_pages())
+        num_pages = len(self.pages)
         ratio = self.c_da.get_allocated_width() / self.c_da.get_allocated_height()
 
-        ww, wh = self.deck_grid.get_allocated_width(), self.deck_grid.get_allocated_height()
-        sw, sh = self.deck_grid.get_row_spacing(), self.deck_grid.get_column_spacing()
+        viewport = self.deck_da.get_parent()
+        ww, wh = viewport.get_allocated_width(), viewport.get_allocated_height()
+        if not ww or not wh:
+            return
+
+        sp = self.spacing
         rows, cols = self.compute_frame_grid(ww / wh, num_pages)
-        window = self.deck_viewport.get_window()
-        scale = window.get_scale_factor()
+        scale = self.deck_da.get_scale_factor()
 
         if not rows or not cols:
             rows, cols = 1, 1
 
-        dw, dh = (ww + sw) / cols - sw, (wh + sh) / rows - sh
+        dw, dh = (ww + sp) / cols - sp, (wh + sp) / rows - sp
         dw, dh = min(dw, dh * ratio), min(dw / ratio, dh)
 
         if cols > self.max_row_size:
             cols = self.max_row_size
             rows = (num_pages + cols - 1) // cols
 
-            dw = (ww + sw) / cols - sw
+            dw = (ww + sp) / cols - sp
             dh = dw / ratio
 
-        self.cache.resize_widget('deck', int(dw * scale), int(dh * scale))
+        self.grid_size = rows, cols
+        self.tile_size = int(dw), int(dh)
+        self.grid_offset = max(0, int(ww - cols * (int(dw) + sp) + sp) // 2)
 
-        frames = [da.get_parent() for da in self.deck_da_list]
-        for frame in frames:
-            frame.set(.5, .5, ratio, False)
-            frame.set_size_request(dw / scale, dh / scale)
+        self.cache.resize_widget('deck', int(dw), int(dh), scale)
+        self.deck_da.set_size_request(-1, rows * (int(dh) + sp) - sp)
+        self.deck_da.queue_draw()
 
-        if self.grid_size != (rows, cols):
-            for frame in frames[1:]:
-                self.deck_grid.remove(frame)
+        self.schedule_renders(range(num_pages))
 
-            # Always keep the first drawing area as it is used to provide surfaces in the cache
-            for row in range(rows, self.grid_size[0]):
-                self.deck_grid.remove_row(row)
-            for col in range(cols, self.grid_size[1]):
-                self.deck_grid.remove_row(col)
 
-            for num, frame in enumerate(frames[1:], 1):
-                self.deck_grid.attach(frame, num % cols, num // cols, 1, 1)
+    def schedule_renders(self, indexes):
+        """ Queue slides for rendering, visible slides first, then by distance to the current page.
 
-            # resize grid and cache
-            self.grid_size = rows, cols
+        Args:
+            indexes (`iterable`):  the indexes in :attr:`pages` of the slides to render
+        """
+        th, sp = self.tile_size[1], self.spacing
+        if not th:
+            return
+
+        adjustment = self.deck_viewport.get_vadjustment()
+        first_row = int(adjustment.get_value() // (th + sp))
+        last_row = int((adjustment.get_value() + adjustment.get_page_size()) // (th + sp))
+        visible = range(first_row * self.grid_size[1], (last_row + 1) * self.grid_size[1])
+        current = bisect.bisect_left(self.pages, self.get_current_page())
 
-        for da in self.deck_da_list:
-            GLib.idle_add(self.prerender, da)
+        self.render_queue = sorted(indexes, key=lambda index: (index not in visible, abs(index - current)))
 
-        self.deck_grid.show_all()
+        if self.render_queue and self.render_source is None:
+            self.render_source = GLib.idle_add(self.render_next)
+
+
+    def cancel_renders(self):
+        """ Cancel all pending slide renderings.
+        """
+        if self.render_source is not None:
+            GLib.Source.remove(self.render_source)
+            self.render_source = None
+        self.render_queue = []
 
 
-    def prerender(self, da):
-        """ Perform in-cache rendering
+    def on_deck_scroll(self, adjustment):
+        """ Reprioritize the pending slide renderings when the viewport scrolls.
 
         Args:
-            da (:class:`~Gtk.DrawingArea`):  the widget for which we’re rendering
+            adjustment (:class:`~Gtk.Adjustment`):  the vertical adjustment of the viewport
         """
-        self.cache.renderer('deck', int(da.get_name()[4:]))
-        da.queue_draw()
-        return GLib.SOURCE_REMOVE
+        if self.deck_mode and self.render_queue:
+            self.schedule_renders(self.render_queue)
+
+
+    def render_next(self):
+        """ Perform in-cache rendering of the next slide in the queue
+
+        Returns:
+            `bool`: whether there are more slides to render (:func:`~GLib.idle_add` convention)
+        """
+        if not self.render_queue:
+            self.render_source = None
+            return GLib.SOURCE_REMOVE
+
+        index = self.render_queue.pop(0)
+        # Prefer downscaling a page already rendered for another widget to rendering it again
+        if index < len(self.pages) and not self.cache.derive('deck', self.pages[index]):
+            self.cache.renderer('deck', self.pages[index])
+        return GLib.SOURCE_CONTINUE
+
+
+    def on_page_rendered(self, widget_name, page_nb):
+        """ Redraw a slide of the grid once it is available in the cache.
+
+        Args:
+            widget_name (`str`):  name of the widget for which the page was rendered
+            page_nb (`int`):  number of the page that was rendered
+        """
+        index = bisect.bisect_left(self.pages, page_nb)
+        if self.deck_mode and index < len(self.pages) and self.pages[index] == page_nb:
+            self.deck_da.queue_draw_area(*self.tile_rect(index))
 
 
     def on_deck_draw(self, widget, cairo_context):
-        """ Actually draw the deck slide -- only do this from cache, to limit overhead
+        """ Actually draw the visible deck slides -- only do this from cache, to limit overhead
 
         Args:
             widget (:class:`~Gtk.Widget`):  the widget to update
             cairo_context (:class:`~cairo.Context`):  the Cairo context (or `None` if called directly)
         """
-        page_num = int(widget.get_name()[4:])
-        pb = self.cache.get('deck', page_num)
-        if pb is None:
-            # We’ll redraw later
-            widget.queue_draw()
+        tw, th = self.tile_size
+        rows, cols = self.grid_size
+        if not tw or not th:
             return
 
-        window = widget.get_window()
-        scale = window.get_scale_factor()
-        cairo_context.scale(1. / scale, 1. / scale)
-        cairo_context.set_source_surface(pb, 0, 0)
-        cairo_context.paint()
+        # Only draw the rows that intersect the area to redraw, i.e. the part of the grid visible in the viewport
+        x1, y1, x2, y2 = cairo_context.clip_extents()
+        first_row = max(0, int(y1 // (th + self.spacing)))
+        last_row = min(rows - 1, int(y2 // (th + self.spacing)))
 
-        ctx = widget.get_style_context()
-        if ctx.get_state() != Gtk.StateFlags.PRELIGHT:
+        window = widget.get_window()
+        for index in range(first_row * cols, min(len(self.pages), (last_row + 1) * cols)):
+            pb = self.cache.get_device('deck', self.pages[index], window)
+            if pb is None:
+                # We’ll redraw when it is rendered
+                continue
+
+            x, y, w, h = self.tile_rect(index)
+            cairo_context.set_source_surface(pb, x, y)
+            cairo_context.rectangle(x, y, w, h)
+            cairo_context.fill()
+
+        if self.hovered is None or not first_row * cols <= self.hovered < (last_row + 1) * cols:
             return
 
         # Draw a hover border manually
+        ctx = widget.get_style_context()
+        ctx.save()
+        ctx.set_state(Gtk.StateFlags.PRELIGHT)
         color = ctx.get_property('border-color', Gtk.StateFlags.PRELIGHT)
+        ctx.restore()
+
         width = 2
         cairo_context.set_source_rgba(*color)
         cairo_context.set_line_width(width)
 
-        ww, wh = widget.get_allocated_width(), widget.get_allocated_height()
-        cairo_context.move_to(width / 2, width / 2)
-        cairo_context.line_to(width / 2, wh - width / 2)
-        cairo_context.line_to(ww - width / 2, wh - width / 2)
-        cairo_context.line_to(ww - width / 2, width / 2)
-        cairo_context.close_path()
+        x, y, w, h = self.tile_rect(self.hovered)
+        cairo_context.rectangle(x + width / 2, y + width / 2, w - width, h - width)
         cairo_context.stroke()
 
 
@@ -289,8 +376,11 @@ class Overview(builder.Builder):
             widget (:class:`~Gtk.Widget`):  the widget which has received the key stroke
             event (:class:`~Gdk.Event`):  the GTK event, which contains the key stroke details
         """
-        page_num = int(widget.get_name()[4:])
-        self.goto_page(page_num, False)
+        index = self.tile_at(event.x, event.y)
+        if index is None:
+            return
+
+        self.goto_page(self.pages[index], False)
         self.disable_deck_overview()
 
 
@@ -346,6 +436,7 @@ class Overview(builder.Builder):
             return False
 
         self.deck_mode = False
+        self.cancel_renders()
 
         self.load_layout(None)
         self.deck_off_render.add(self.deck_viewport)
@@ -48,7 +48,7 @@ from urllib.parse import urlsplit
 
 import gi
 gi.require_version('Poppler', '0.18')
-from gi.repository import Poppler
+from gi.repository import Poppler, GLib
 
 from pympress.util import fileopen
 
@@ -275,6 +275,8 @@ class Page(object):
     ph = 0.
     #: All text annotations
     annotations = []
+    #: Ink annotations to add to the page when saving, e.g. from highlights
+    ink_annotations = []
     #: Instance of :class:`~pympress.document.Document` that contains this page.
     parent = None
 
@@ -285,6 +287,7 @@ class Page(object):
         self.links = []
         self.medias = []
         self.annotations = []
+        self.ink_annotations = []
 
         if self.page is None:
             return
@@ -650,6 +653,51 @@ class Page(object):
         del self.annotations[pos]
 
 
+    def new_ink_annotation(self, paths, color, width, dtype=PdfPage.FULL):
+        """ Add an ink annotation, i.e. free-hand drawing, to this page
+
+        Args:
+            paths (`list`): The `list` of points of each path, in coordinates 0..1 of the visible part of the page
+            color (`tuple`): The red, green, blue and alpha components of the color, each between 0 and 1
+            width (`float`): The width of the drawing, relative to the visible part of the page
+            dtype (:class:`~pympress.document.PdfPage`): The visible part of the page
+
+        Returns:
+            `bool`: whether the annotation could be created
+        """
+        if self.parent.doc is None or not hasattr(Poppler, 'AnnotInk'):
+            return False
+
+        # PDF coordinates start at the bottom of the page
+        ink_list = [[dtype.from_screen(x, y) for x, y in path] for path in paths]
+        ink_list = [[(x * self.pw, (1 - y) * self.ph) for x, y in path] for path in ink_list]
+        width = width * max(*self.get_size(dtype))
+
+        rect = Poppler.Rectangle()
+        rect.x1 = min(x for path in ink_list for x, y in path) - width
+        rect.x2 = max(x for path in ink_list for x, y in path) + width
+        rect.y1 = min(y for path in ink_list for x, y in path) - width
+        rect.y2 = max(y for path in ink_list for x, y in path) + width
+
+        pop_color = Poppler.Color()
+        pop_color.red, pop_color.green, pop_color.blue = (int(c * 65535) for c in color[:3])
+
+        try:
+            new_annot = Poppler.AnnotInk.new(self.parent.doc, rect)
+            new_annot.set_ink_list([Poppler.Path.new_from_array([Poppler.Point(x=x, y=y) for x, y in path])
+                                    for path in ink_list])
+            new_annot.set_color(pop_color)
+            new_annot.set_opacity(color[3])
+            new_annot.set_border_width(width)
+        except (AttributeError, TypeError):
+            logger.warning('Pympress can not create ink annotations with this version of Poppler', exc_info=True)
+            return False
+
+        self.ink_annotations.append(new_annot)
+        self.parent.made_changes()
+        return True
+
+
     def get_media(self):
         """ Get the list of medias this page might want to play.
 
@@ -659,7 +707,7 @@ class Page(object):
         return self.medias
 
 
-    def render_cairo(self, cr, ww, wh, dtype=PdfPage.FULL):
+    def render_cairo(self, cr, ww, wh, dtype=PdfPage.FULL, raster=None):
         """ Render the page on a Cairo surface.
 
         Args:
@@ -667,7 +715,18 @@ class Page(object):
             ww (`int`):  target width in pixels
             wh (`int`):  target height in pixels
             dtype (:class:`~pympress.document.PdfPage`):  the type of document that should be rendered
+            raster (:class:`~cairo.Surface`):  the pixels of the page as they would be rendered on the target,
+                                               to paint without resampling instead of rendering the page again
         """
+        if raster is not None:
+            # Paint in device pixels at the origin, so that the raster is copied as is
+            x_scale, y_scale = cr.get_target().get_device_scale()
+            cr.identity_matrix()
+            cr.scale(1 / x_scale, 1 / y_scale)
+            cr.set_source_surface(raster, 0, 0)
+            cr.paint()
+            return
+
         pw, ph = self.get_size(dtype)
 
         cr.set_source_rgb(1, 1, 1)
@@ -886,32 +945,64 @@ class Document(object):
     def save_changes(self, dest_uri=None):
         """ Save the changes
 
+        Annotations are attached to the pages, the document is saved, and the annotations removed, all in one step on
+        the main thread, as Poppler is not thread-safe and renders must not see the temporary annotations.
+        Pending ink annotations are discarded in any case, whether the save succeeded or not.
+
         Args:
             dest_uri (`str` or `None`): The URI where to save the file, or None to save in-place
+
+        Returns:
+            `bool`: whether the file was saved
         """
         if self.doc is None:
-            return
+            return False
 
-        for page in self.pages_cache.values():
-            for annot in page.get_annotations():
-                page.page.add_annot(annot)
+        added = []
+        saved = False
+        try:
+            for page in list(self.pages_cache.values()):
+                for annot in page.get_annotations() + page.ink_annotations:
+                    page.page.add_annot(annot)
+                    added.append((page, annot))
 
-        if dest_uri is not None and dest_uri != self.uri:
-            if self.doc.save(dest_uri):
-                self.changes = False
-        else:
-            # We can’t overwrite the current file directly, so create a temporary file and then overwrite
-            with tempfile.NamedTemporaryFile('wb', suffix=self.path.suffix, prefix=self.path.stem, dir=self.path.parent,
-                                             delete=False) as f:
-                temp_path = pathlib.Path(f.name)
+            if dest_uri is not None and dest_uri != self.uri:
+                saved = self.doc.save(dest_uri)
+            else:
+                # We can’t overwrite the current file directly, so create a temporary file and then overwrite
+                with tempfile.NamedTemporaryFile('wb', suffix=self.path.suffix, prefix=self.path.stem,
+                                                 dir=self.path.parent, delete=False) as f:
+                    temp_path = pathlib.Path(f.name)
 
-            if self.doc.save(temp_path.as_uri()):
-                self.changes = False
-                temp_path.replace(self.path)
+                try:
+                    saved = self.doc.save(temp_path.as_uri())
+                    if saved:
+                        temp_path.replace(self.path)
+                finally:
+                    if temp_path.exists():
+                        temp_path.unlink()
+
+        except (GLib.Error, OSError):
+            logger.error(_('Failed to save document to {}').format(dest_uri or self.uri), exc_info=True)
+            saved = False
+
+        finally:
+            for page, annot in added:
+                page.page.remove_annot(annot)
+
+            # Ink annotations are exported once, they are not edited in pympress
+            self.clear_ink_annotations()
+
+        if saved:
+            self.changes = False
+        return saved
 
+
+    def clear_ink_annotations(self):
+        """ Discard the ink annotations that are pending until the next save
+        """
         for page in self.pages_cache.values():
-            for annot in page.get_annotations():
-                page.page.remove_annot(annot)
+            page.ink_annotations.clear()
 
 
     def guess_notes(self, horizontal, vertical, current_page=0):
@@ -1254,7 +1345,7 @@ class EmptyPage(Page):
         self.pw, self.ph = 1.3, 1.0
 
 
-    def render_cairo(self, cr, ww, wh, dtype=PdfPage.FULL):
+    def render_cairo(self, cr, ww, wh, dtype=PdfPage.FULL, raster=None):
         """ Overriding this purely for safety: make sure we do not accidentally try to render.
 
         Args:
@@ -1262,6 +1353,7 @@ class EmptyPage(Page):
             ww (`int`):  target width in pixels
             wh (`int`):  target height in pixels
             dtype (:class:`~pympress.document.PdfPage`):  the type of document that should be rendered
+            raster (:class:`~cairo.Surface`):  the pixels of the page, ignored
         """
         pass
 
@@ -27,8 +27,10 @@ import logging
 logger = logging.getLogger(__name__)
 
 import pathlib
+import math
 import mimetypes
 import functools
+import collections
 from urllib.request import url2pathname
 
 import gi
@@ -198,6 +200,12 @@ class Media(object):
     """
     #: `dict` of :class:`~pympress.media_overlays.base.VideoOverlay` ready to be added on top of the slides
     _media_overlays = {}
+    #: :class:`~collections.OrderedDict` whose keys are the ids of medias with prerolled players, least recent first
+    _prerolled = collections.OrderedDict()
+    #: `int` maximum number of medias whose players are prerolled at the same time
+    max_prerolled = 4
+    #: `int` number of pages after the current one for which medias are prerolled
+    preroll_pages = 2
 
     #: :class:`~Gtk.Overlay` for the Content window.
     c_overlay = None
@@ -262,9 +270,97 @@ class Media(object):
     def purge_media_overlays(self):
         """ Remove current media overlays.
         """
+        self.release_prerolled()
         self.remove_media_overlays()
         self._media_overlays.clear()
 
+        for backend in self._backends.values():
+            backend.purge_shared()
+
+
+    def get_media_overlays(self, media, page_type):
+        """ Get the overlays of a media, creating them if necessary.
+
+        Args:
+            media (:class:`~pympress.document.Media`): The media for which to get the overlays
+            page_type (:class:`~pympress.document.PdfPage`): The part of the page to consider
+
+        Returns:
+            `tuple`: The content and presenter :class:`~pympress.media_overlays.base.VideoOverlay`, or `None`
+        """
+        media_id = hash(media)
+
+        if media_id not in self._media_overlays:
+            mime_type, enc = mimetypes.guess_type(media.filename)
+            factory = self.get_factory(mime_type)
+
+            if not factory:
+                logger.warning('No available overlay for mime type {}, ignoring media {}'
+                               .format(mime_type, media.filename))
+                return None
+
+            action_group = Gio.SimpleActionGroup.new()
+            builder.Builder.setup_actions({
+                'play':     dict(activate=functools.partial(self.play, media_id)),
+                'stop':     dict(activate=functools.partial(self.hide, media_id)),
+                'pause':    dict(activate=functools.partial(self.play_pause, media_id)),
+                'set_time': dict(activate=functools.partial(self.set_time, media_id), parameter_type=float)
+            }, action_group)
+
+            v_da_c = factory(self.c_overlay, page_type, action_group, media)
+            v_da_p = factory(self.p_overlay, page_type, action_group, media._replace(show_controls=True))
+
+            self._media_overlays[media_id] = (v_da_c, v_da_p)
+
+        return self._media_overlays[media_id]
+
+
+    def preroll_media_overlays(self, pages, page_type):
+        """ Prepare the players of the medias of upcoming pages, so they start playing without delay.
+
+        At most :attr:`max_prerolled` medias are prerolled, the ones from the pages that were prerolled least
+        recently are released.
+
+        Args:
+            pages (`list`): The upcoming :class:`~pympress.document.Page`, nearest first, or `None` after the end
+            page_type (:class:`~pympress.document.PdfPage`): The part of the page to consider
+        """
+        if page_type == document.PdfPage.NONE:
+            return
+
+        # Go from the furthest page, so that the nearest medias are the most recently prerolled
+        for page in reversed(pages):
+            for media in page.get_media() if page is not None else []:
+                media_id = hash(media)
+                if media_id in self._prerolled:
+                    self._prerolled.move_to_end(media_id)
+                    continue
+
+                overlays = self.get_media_overlays(media, page_type)
+                if overlays is None or any(overlay.is_shown() for overlay in overlays):
+                    continue
+
+                self._prerolled[media_id] = True
+                for overlay in overlays:
+                    GLib.idle_add(overlay.do_preroll)
+
+        while len(self._prerolled) > self.max_prerolled:
+            media_id, _ = self._prerolled.popitem(False)
+            self.release_prerolled(media_id)
+
+
+    def release_prerolled(self, media_id=None):
+        """ Release the players of prerolled medias that are not shown.
+
+        Args:
+            media_id (`int`): A unique identifier of the media to release, or `None` for all prerolled medias
+        """
+        for media_id in [media_id] if media_id is not None else list(self._prerolled):
+            self._prerolled.pop(media_id, None)
+            for overlay in self._media_overlays.get(media_id, ()):
+                if not overlay.is_shown():
+                    GLib.idle_add(overlay.do_release)
+
 
     def replace_media_overlays(self, current_page, page_type):
         """ Remove current media overlays, add new ones if page contains media.
@@ -280,28 +376,8 @@ class Media(object):
 
         for media in current_page.get_media():
             media_id = hash(media)
-
-            if media_id not in self._media_overlays:
-                mime_type, enc = mimetypes.guess_type(media.filename)
-                factory = self.get_factory(mime_type)
-
-                if not factory:
-                    logger.warning('No available overlay for mime type {}, ignoring media {}'
-                                   .format(mime_type, media.filename))
-                    continue
-
-                action_group = Gio.SimpleActionGroup.new()
-                builder.Builder.setup_actions({
-                    'play':     dict(activate=functools.partial(self.play, media_id)),
-                    'stop':     dict(activate=functools.partial(self.hide, media_id)),
-                    'pause':    dict(activate=functools.partial(self.play_pause, media_id)),
-                    'set_time': dict(activate=functools.partial(self.set_time, media_id), parameter_type=float)
-                }, action_group)
-
-                v_da_c = factory(self.c_overlay, page_type, action_group, media)
-                v_da_p = factory(self.p_overlay, page_type, action_group, media._replace(show_controls=True))
-
-                self._media_overlays[media_id] = (v_da_c, v_da_p)
+            if self.get_media_overlays(media, page_type) is None:
+                continue
 
             self._media_overlays[media_id][0].mute(True)
             self._media_overlays[media_id][1].mute(False)
@@ -340,6 +416,7 @@ class Media(object):
             param (:class:`~GLib.Variant`): the parameter as a variant, or None
         """
         if media_id in self._media_overlays:
+            self._prerolled.pop(media_id, None)
             c, p = self._media_overlays[media_id]
             p.show()
             c.show()
@@ -363,6 +440,7 @@ class Media(object):
     def hide_all(self):
         """ Stops all playing medias and hides the players. Used before exit.
         """
+        self.release_prerolled()
         for c, p in self._media_overlays.values():
             if c.is_shown(): GLib.idle_add(c.do_hide)
             if p.is_shown(): GLib.idle_add(p.do_hide)
@@ -505,6 +583,23 @@ class Zoom(object):
     scale = 1.
     shift = (0, 0)
 
+    #: `tuple` of the animation start time (in µs, or `None` before the first frame), and the starting and target
+    #: `(scale, shift)` of the zoom, or `None` when the zoom is not animated
+    animation = None
+    #: `float` duration of the zoom animation, in seconds
+    animation_duration = .25
+    #: `int` the id of the tick callback that animates the zoom, or `None`
+    tick_id = None
+
+    #: `bool` whether the magnifier lens follows the pointer on the current slides
+    magnifying = False
+    #: `(float, float)` position of the center of the lens relative to the slide, or `None` before the pointer moves
+    lens_pos = None
+    #: `float` radius of the lens, in ratio to the widget height
+    lens_radius = .15
+    #: `float` magnification of the lens, relative to the (possibly zoomed) slide
+    magnification = 3.
+
     #: :class:`~Gtk.Box` in the Presenter window, used to reliably set cursors.
     p_central = None
     #: callback, to be connected to :meth:`~pympress.app.Pympress.set_action_enabled`
@@ -512,20 +607,27 @@ class Zoom(object):
 
     #: callback, to be connected to :func:`~pympress.ui.UI.redraw_current_slide`
     redraw_current_slide = lambda *args: None
+    #: callback, to be connected to :func:`~pympress.ui.UI.redraw_layers`
+    redraw_layers = lambda *args: None
     #: callback, to be connected to :func:`~pympress.ui.UI.clear_cache`
     clear_cache = lambda *args: None
+    #: callback, to be connected to :func:`~pympress.ui.UI.prerender_zoom`
+    prerender_zoom = lambda *args: None
 
     def __init__(self, builder):
         super(Zoom, self).__init__()
         builder.load_widgets(self)
 
         self.redraw_current_slide = builder.get_callback_handler('redraw_current_slide')
+        self.redraw_layers = builder.get_callback_handler('redraw_layers')
         self.clear_cache = builder.get_callback_handler('clear_zoom_cache')
+        self.prerender_zoom = builder.get_callback_handler('prerender_zoom')
         self.set_action_enabled = builder.get_callback_handler('app.set_action_enabled')
 
         builder.setup_actions({
-            'zoom':   dict(activate=self.start_zooming),
-            'unzoom': dict(activate=self.stop_zooming),
+            'zoom':    dict(activate=self.start_zooming),
+            'unzoom':  dict(activate=self.stop_zooming),
+            'magnify': dict(activate=self.toggle_magnifier, state=self.magnifying),
         })
 
 
@@ -541,25 +643,112 @@ class Zoom(object):
         return True
 
 
-    def stop_zooming(self, *args):
+    def stop_zooming(self, *args, animate=True):
         """ Cancel the zooming, reset the zoom level to full page.
 
+        Args:
+            animate (`bool`): whether to animate the zoom out, or return to the full page immediately
+
         Returns:
             `bool`: whether the event was consumed
         """
         Cursor.set_cursor(self.p_central)
         self.zoom_selecting = False
         self.zoom_points = None
-        self.scale = 1.
-        self.shift = (0, 0)
         self.set_action_enabled('unzoom', False)
 
-        self.redraw_current_slide()
-        self.clear_cache()
+        self.animate_to(1., (0, 0), animate)
 
         return True
 
 
+    def get_target(self):
+        """ Get the zoom that is displayed, or that will be once the animation is done.
+
+        Returns:
+            `tuple`: the `float` scale and `(float, float)` shift of the zoom
+        """
+        if self.animation is not None:
+            return self.animation[2]
+        return self.scale, self.shift
+
+
+    def animating(self):
+        """ Returns whether the zoom is currently being animated.
+
+        Returns:
+            `bool`: `True` iff the zoom is changing
+        """
+        return self.animation is not None
+
+
+    def animate_to(self, scale, shift, animate=True):
+        """ Start animating the zoom from its current value to the given one.
+
+        The zoomed slides are rendered at idle time meanwhile, and the unzoomed slides are scaled to draw the
+        intermediate frames.
+
+        Args:
+            scale (`float`): the target scale of the zoom
+            shift (`(float, float)`): the target shift of the zoom
+            animate (`bool`): whether to animate the zoom, or change it immediately
+        """
+        self.clear_cache()
+        if scale != 1.:
+            self.prerender_zoom()
+
+        if not animate or not self.p_central.get_mapped() or (scale, shift) == (self.scale, self.shift):
+            self.animation = None
+            self.scale, self.shift = scale, shift
+        else:
+            self.animation = (None, (self.scale, self.shift), (scale, shift))
+            if self.tick_id is None:
+                self.tick_id = self.p_central.add_tick_callback(self.animate)
+
+        self.redraw_current_slide()
+
+
+    def animate(self, widget, frame_clock):
+        """ Update the zoom at each frame of the animation, connected through :meth:`~Gtk.Widget.add_tick_callback`.
+
+        The visible part of the slide is interpolated with an ease-out curve, so that its edges move in straight lines.
+
+        Args:
+            widget (:class:`~Gtk.Widget`): the widget whose frame clock drives the animation
+            frame_clock (:class:`~Gdk.FrameClock`): the frame clock
+
+        Returns:
+            `bool`: whether the animation should continue
+        """
+        if self.animation is None:
+            self.tick_id = None
+            return GLib.SOURCE_REMOVE
+
+        start, (scale0, shift0), (scale1, shift1) = self.animation
+        now = frame_clock.get_frame_time()
+        if start is None:
+            start = now
+            self.animation = (start, (scale0, shift0), (scale1, shift1))
+
+        progress = min(1., (now - start) / (self.animation_duration * 1e6))
+        ease = 1. - (1. - progress) ** 3
+
+        # interpolate the visible rectangle of the slide: its size is 1 / scale and its origin -shift / scale
+        size = (1 - ease) / scale0 + ease / scale1
+        self.scale = 1. / size
+        self.shift = tuple(-self.scale * ((1 - ease) * -s0 / scale0 + ease * -s1 / scale1)
+                           for s0, s1 in zip(shift0, shift1))
+        self.redraw_current_slide()
+
+        if progress < 1.:
+            return GLib.SOURCE_CONTINUE
+
+        self.scale, self.shift = scale1, shift1
+        self.animation = None
+        self.tick_id = None
+        return GLib.SOURCE_REMOVE
+
+
     def try_cancel(self):
         """ Cancel the zoom selection, if it was enabled.
 
@@ -584,18 +773,20 @@ class Zoom(object):
         return ((ex / ww - self.shift[0]) / self.scale, (ey / wh - self.shift[1]) / self.scale)
 
 
-    def get_matrix(self, ww, wh):
+    def get_matrix(self, ww, wh, target=False):
         """ Returns the :class:`~cairo.Matrix` used to perform the zoom for the widget of size ww x wh.
 
         Args:
             ww (`float`):  widget width
             wh (`float`):  widget height
+            target (`bool`):  whether to get the zoom at the end of the animation instead of the current one
 
         Returns:
             :class:`~cairo.Matrix`: the zoom transformation matrix
         """
-        return cairo.Matrix(xx = self.scale, x0 = ww * self.shift[0],
-                            yy = self.scale, y0 = wh * self.shift[1])
+        scale, shift = self.get_target() if target else (self.scale, self.shift)
+        return cairo.Matrix(xx = scale, x0 = ww * shift[0],
+                            yy = scale, y0 = wh * shift[1])
 
 
     def track_zoom_target(self, widget, event):
@@ -611,7 +802,7 @@ class Zoom(object):
         if self.zoom_selecting and self.zoom_points:
             self.zoom_points[1] = self.get_slide_point(widget, event)
 
-            self.redraw_current_slide()
+            self.redraw_layers()
             return True
 
         return False
@@ -645,28 +836,126 @@ class Zoom(object):
 
             try:
                 # zoom by dimension less zoomed, to fit box while maintaining aspect ratio
-                self.scale = 1. / max(ymax - ymin, xmax - xmin)
+                scale = 1. / max(ymax - ymin, xmax - xmin)
 
                 # make center of drawn rectangle the center of the zoomed slide
-                self.shift = (.5 - self.scale * (xmin + xmax) / 2,
-                              .5 - self.scale * (ymin + ymax) / 2)
+                shift = (.5 - scale * (xmin + xmax) / 2,
+                         .5 - scale * (ymin + ymax) / 2)
             except ZeroDivisionError:
-                self.scale = 1.
-                self.shift = (0, 0)
+                scale = 1.
+                shift = (0, 0)
 
             # stop drawing rectangles and reset cursor (NB don't use window, this bugs)
             Cursor.set_cursor(self.p_central)
 
             self.zoom_selecting = False
-            self.clear_cache()
-            self.redraw_current_slide()
             self.set_action_enabled('unzoom', True)
+            self.animate_to(scale, shift)
 
             return True
 
         return False
 
 
+    def toggle_magnifier(self, gaction, param=None):
+        """ Show or hide the magnifier lens, that follows the pointer over the current slides.
+
+        Args:
+            gaction (:class:`~Gio.Action`): the action triggering the call
+            param (:class:`~GLib.Variant`): the parameter as a variant, or None
+
+        Returns:
+            `bool`: whether the event was consumed
+        """
+        self.magnifying = not self.magnifying
+        self.redraw_layers()
+        self.lens_pos = None
+        gaction.change_state(GLib.Variant.new_boolean(self.magnifying))
+        return True
+
+
+    def track_lens(self, widget, event):
+        """ Move the magnifier lens at the mouse location.
+
+        Args:
+            widget (:class:`~Gtk.Widget`):  the widget which has received the event.
+            event (:class:`~Gdk.Event`):  the GTK event.
+
+        Returns:
+            `bool`: whether the event was consumed
+        """
+        if not self.magnifying:
+            return False
+
+        self.lens_pos = self.get_slide_point(widget, event)
+        self.redraw_layers()
+        return True
+
+
+    def get_lens(self, ww, wh):
+        """ Get the position and transformation of the magnifier lens in a widget.
+
+        Args:
+            ww (`int`): The widget width
+            wh (`int`): The widget height
+
+        Returns:
+            `tuple`: The `float` x and y of the lens center and its radius, and the :class:`~cairo.Matrix` that
+            transforms the unzoomed widget into the lens, or `None` if there is no lens to draw.
+        """
+        if not self.magnifying or self.lens_pos is None:
+            return None
+
+        zoom_matrix = self.get_matrix(ww, wh)
+        cx, cy = zoom_matrix.transform_point(self.lens_pos[0] * ww, self.lens_pos[1] * wh)
+        mag = self.magnification
+        return cx, cy, self.lens_radius * wh, zoom_matrix.multiply(
+            cairo.Matrix(xx = mag, x0 = cx * (1 - mag), yy = mag, y0 = cy * (1 - mag))
+        )
+
+
+    def get_lens_extents(self, ww, wh):
+        """ Get the area covered by the magnifier lens on screen.
+
+        Args:
+            ww (`int`): The widget width
+            wh (`int`): The widget height
+
+        Returns:
+            `tuple`: The (x, y, width, height) rectangle in pixels where the lens is drawn, or `None` if hidden
+        """
+        lens = self.get_lens(ww, wh)
+        if lens is None:
+            return None
+
+        cx, cy, radius, matrix = lens
+        # margin for the rim and antialiasing
+        x, y = math.floor(cx - radius - 2), math.floor(cy - radius - 2)
+        return x, y, math.ceil(cx + radius + 2) - x, math.ceil(cy + radius + 2) - y
+
+
+    def get_extents(self, ww, wh):
+        """ Get the area covered by the zoom's target rectangle on screen.
+
+        Args:
+            ww (`int`): The widget width
+            wh (`int`): The widget height
+
+        Returns:
+            `tuple`: The (x, y, width, height) rectangle in pixels where the target is drawn, or `None` if hidden
+        """
+        if not self.zoom_selecting or not self.zoom_points:
+            return None
+
+        matrix = self.get_matrix(ww, wh)
+        (x0, y0), (x1, y1) = (matrix.transform_point(x * ww, y * wh) for x, y in self.zoom_points)
+        # margin for the line width (3 before zooming), its square caps and antialiasing
+        margin = 3 * self.scale + 2
+
+        x, y = math.floor(min(x0, x1) - margin), math.floor(min(y0, y1) - margin)
+        return x, y, math.ceil(max(x0, x1) + margin) - x, math.ceil(max(y0, y1) + margin) - y
+
+
     def draw_zoom_target(self, widget, cairo_context):
         """ Perform the drawings by user.
 
@@ -292,6 +292,37 @@ class VideoOverlay(builder.Builder):
         raise NotImplementedError
 
 
+    def do_preroll(self):
+        """ Prepare the media to be played, before it is shown, so that playing it starts without delay.
+
+        Does nothing by default. Should run on the main thread to ensure we avoid reentrency problems.
+
+        Returns:
+            `bool`: `True` iff this function should be run again (:meth:`~GLib.idle_add` convention)
+        """
+        return False
+
+
+    def do_release(self):
+        """ Release the resources held by a media that was prerolled but is not played.
+
+        Does nothing by default. Should run on the main thread to ensure we avoid reentrency problems.
+
+        Returns:
+            `bool`: `True` iff this function should be run again (:meth:`~GLib.idle_add` convention)
+        """
+        return False
+
+
+    @classmethod
+    def purge_shared(cls):
+        """ Forget the resources shared between the overlays of a document, e.g. when the document changes.
+
+        Does nothing by default.
+        """
+        pass
+
+
     def do_play_pause(self):
         """ Toggle pause mode of the media.
 
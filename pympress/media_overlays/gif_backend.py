@@ -26,6 +26,9 @@
 import logging
 logger = logging.getLogger(__name__)
 
+import bisect
+import collections
+
 import gi
 import cairo
 gi.require_version('Gtk', '3.0')
@@ -35,28 +38,266 @@ from gi.repository import Gdk, GLib, GdkPixbuf
 from pympress.media_overlays import base
 
 
+class GifFrames(object):
+    """ The frames of an animation, decoded once and shared by all the overlays that display it.
+
+    The file is read and decoded incrementally during idle time, showing its first frame as soon as it is available.
+    Frames are scaled to the sizes at which they are displayed the first time they are drawn, and kept in a cache
+    bounded by its total number of pixels, shared by all animations.
+
+    Args:
+        filepath (`pathlib.Path`): the path to the animation to decode
+        size (`tuple`): the `int` width and height of the animation
+        callback (`function`): called with this object when the first frame, and then all frames, are decoded
+    """
+    #: `int` maximum number of pixels of the frames decoded for a single animation
+    max_decoded_pixels = 3840 * 2160 * 8
+    #: `int` minimum number of frames that must repeat the first ones to detect a loop, besides a whole period
+    min_repeats = 10
+    #: `int` number of bytes of the file read at once
+    chunk_size = 1 << 16
+    #: `int` maximum number of pixels of all the scaled frames kept in :attr:`scaled_frames`
+    max_pixels = 3840 * 2160 * 8
+
+    #: :class:`~collections.OrderedDict` whose keys are `(GifFrames, width, height, scale)` tuples, and values `dict`s
+    #: mapping frame indexes to :class:`~cairo.ImageSurface`, least recently used first
+    scaled_frames = collections.OrderedDict()
+    #: `int` total number of pixels in :attr:`scaled_frames`
+    scaled_pixels = 0
+
+    #: `tuple` of the `int` width and height of the animation
+    size = (0, 0)
+    #: `list` of the frames as :class:`~GdkPixbuf.Pixbuf`
+    frames = []
+    #: `list` of the `int` times in ms at which each frame ends, or `None` for a frame displayed indefinitely
+    end_times = []
+    #: `int` id of the :func:`~GLib.idle_add` source decoding the frames, or 0 once they are all decoded
+    decoding = 0
+    #: `set` of the :class:`~pympress.media_overlays.gif_backend.GifOverlay` that hold these frames
+    holders = set()
+
+    def __init__(self, filepath, size, callback):
+        super(GifFrames, self).__init__()
+
+        self.size = size
+        self.frames, self.end_times = [], []
+        self.holders = set()
+        self.decoding = GLib.idle_add(next, self.decode(filepath, callback), False)
+
+
+    def decode(self, filepath, callback):
+        """ Read the file and step through the animation to get its frames, one file chunk or frame at a time.
+
+        Until all the frames are decoded, only the first one is made available and shown indefinitely. Animations
+        whose frames exceed :attr:`max_decoded_pixels` are cut, and the frames decoded until then are looped.
+
+        Args:
+            filepath (`pathlib.Path`): the path to the animation to decode
+            callback (`function`): called with this object when the first frame, and then all frames, are decoded
+
+        Returns:
+            generator: yields `True` while there is decoding left to do (:func:`~GLib.idle_add` convention)
+        """
+        loader = GdkPixbuf.PixbufLoader()
+        try:
+            with open(filepath, 'rb') as f:
+                for chunk in iter(lambda: f.read(self.chunk_size), b''):
+                    loader.write(chunk)
+                    yield True
+            loader.close()
+        except (GLib.Error, OSError):
+            logger.error(_('Can not load gif {}').format(filepath), exc_info = True)
+            self.decoding = 0
+            return
+
+        anim = loader.get_animation()
+        if anim.is_static_image():
+            self.frames, self.end_times = [anim.get_static_image()], [None]
+            self.decoding = 0
+            callback(self)
+            return
+
+        # Step through the animation with a fake clock, until it stops on its last frame or we find its period:
+        # the first frames repeat after it. A frame equal to the first one is only a candidate period, since frames
+        # may be reused within an animation, confirmed once a whole period (and at least min_repeats frames) repeat.
+        clock = GLib.TimeVal()
+        anim_iter = anim.get_iter(clock)
+        elapsed, period, first = 0, None, 1
+        frames, end_times, signatures = [], [], []
+
+        def repeats(index, offset):
+            return signatures[index] == signatures[index - offset] and \
+                frames[index].read_pixel_bytes().equal(frames[index - offset].read_pixel_bytes())
+
+        while True:
+            pixbuf, delay = anim_iter.get_pixbuf().copy(), anim_iter.get_delay_time()
+            frames.append(pixbuf)
+            signatures.append((delay, pixbuf.read_pixel_bytes().hash()))
+            index = len(frames) - 1
+
+            if not index:
+                self.frames, self.end_times = [pixbuf], [None]
+                callback(self)
+            elif period is None or not repeats(index, period):
+                period = next((offset for offset in range(first, index + 1)
+                               if all(repeats(i, offset) for i in range(offset, index + 1))), None)
+                first = index + 1 if period is None else period
+            if period is not None and index + 1 >= period + max(period, self.min_repeats):
+                break
+
+            if delay < 0:
+                end_times.append(None)
+                period = None
+                break
+
+            elapsed += delay
+            end_times.append(elapsed)
+
+            if len(frames) * pixbuf.get_width() * pixbuf.get_height() >= self.max_decoded_pixels:
+                logger.warning(_('Gif {} is too long to decode all its frames, looping its first {} frames')
+                               .format(filepath, len(frames)))
+                period = None
+                break
+
+            clock.add(delay * 1000)
+            anim_iter.advance(clock)
+            yield True
+
+        if period is not None:
+            del frames[period:], end_times[period:]
+
+        if elapsed:
+            self.frames, self.end_times = frames, end_times
+        # Otherwise only frames with no duration, keep showing the first one
+
+        self.decoding = 0
+        callback(self)
+
+
+    def cancel(self):
+        """ Stop decoding the frames, if they are not all decoded yet.
+        """
+        if self.decoding:
+            GLib.source_remove(self.decoding)
+            self.decoding = 0
+
+
+    def get_pixels(self):
+        """ Get the memory used by the decoded frames.
+
+        Returns:
+            `int`: the number of pixels of all the frames
+        """
+        return self.size[0] * self.size[1] * len(self.frames)
+
+
+    def get_size(self):
+        """ Get the size of the animation.
+
+        Returns:
+            `tuple`: the `int` width and height of the frames
+        """
+        return self.size
+
+
+    def frame_at(self, time):
+        """ Get the frame displayed at a given time since the start of the animation.
+
+        Args:
+            time (`float`): the time in ms
+
+        Returns:
+            `tuple`: the `int` index of the frame, and the `float` time in ms until the next frame or `None`
+        """
+        if not self.end_times:
+            return 0, None
+        elif self.end_times[-1] is not None:
+            # looping animation
+            time %= self.end_times[-1]
+        elif len(self.end_times) == 1 or time >= self.end_times[-2]:
+            return len(self.frames) - 1, None
+
+        index = bisect.bisect_right(self.end_times[:-1] if self.end_times[-1] is None else self.end_times, time)
+        return index, self.end_times[index] - time
+
+
+    def get_frame(self, index, width, height, scale):
+        """ Get a frame scaled to the given size, scaling it if it is not in the cache yet.
+
+        Args:
+            index (`int`): the index of the frame
+            width (`int`): the width at which the frame is drawn, in logical pixels
+            height (`int`): the height at which the frame is drawn, in logical pixels
+            scale (`int`): the scale factor of the display
+
+        Returns:
+            :class:`~cairo.ImageSurface`: the scaled frame
+        """
+        key = (self, width, height, scale)
+        cls = type(self)
+        frames = cls.scaled_frames.setdefault(key, {})
+        cls.scaled_frames.move_to_end(key)
+
+        if index in frames:
+            return frames[index]
+
+        surface = cairo.ImageSurface(cairo.Format.ARGB32, max(1, width * scale), max(1, height * scale))
+        surface.set_device_scale(scale, scale)
+
+        pixbuf = self.frames[index]
+        ctx = cairo.Context(surface)
+        ctx.scale(width / pixbuf.get_width(), height / pixbuf.get_height())
+        Gdk.cairo_set_source_pixbuf(ctx, pixbuf, 0, 0)
+        ctx.paint()
+        del ctx
+
+        frames[index] = surface
+        cls.scaled_pixels += surface.get_width() * surface.get_height()
+        while cls.scaled_pixels > cls.max_pixels and len(cls.scaled_frames) > 1:
+            old_key, old_frames = cls.scaled_frames.popitem(False)
+            cls.scaled_pixels -= sum(frame.get_width() * frame.get_height() for frame in old_frames.values())
+
+        return surface
+
+
+
 class GifOverlay(base.VideoOverlay):
     """ A simple overlay mimicking the functionality of showing videos, but showing gifs instead.
+
+    Frames are decoded once per file during idle time, shared between the overlays of both windows and kept for a
+    few recently shown files, and all the playing gifs are animated by a single timer that only runs while some are
+    shown.
     """
-    #: A :class:`~GdkPixbuf.PixbufAnimation` containing all the frames and their timing for the displayed gif
-    anim = None
-    #: A :class:`~GdkPixbuf.PixbufAnimationIter` which will provide the timely access to the frames in `~anim`
-    anim_iter = None
+    #: The :class:`~pympress.media_overlays.gif_backend.GifFrames` of the displayed gif, or `None` before decoding
+    gif = None
     #: A `tuple` of (`int`, `int`) indicating the size of the bounding box of the gif
     base_size = None
-    #: The :class:`~cairo.Matrix` defining the zoom & shift to scale the gif
-    transform = None
+    #: The `pathlib.Path` of the gif
+    filepath = None
+    #: `int` index of the frame currently displayed
+    frame = 0
+    #: `int` monotonic time in µs at which the animation started
+    start_time = 0
+
+    #: :class:`~collections.OrderedDict` mapping file paths to the shared
+    #: :class:`~pympress.media_overlays.gif_backend.GifFrames`, least recently used first
+    _decoded = collections.OrderedDict()
+    #: `int` maximum number of pixels of the frames kept in :attr:`_decoded`
+    max_decoded_pixels = 3840 * 2160 * 16
+    #: `set` of the :class:`~pympress.media_overlays.gif_backend.GifOverlay` that are currently playing
+    _playing = set()
+    #: `int` id of the GLib timeout advancing all playing gifs, or 0 when none is scheduled
+    _ticker = 0
 
     def __init__(self, *args, **kwargs):
         super(GifOverlay, self).__init__(*args, **kwargs)
 
-        # override: no toolbar or interactive stuff for a gif, replace the whole widget area with a GdkPixbuf
+        # override: no toolbar or interactive stuff for a gif, replace the whole widget area with the frames
         self.autoplay = True
         self.toolbar.set_visible(False)
 
         # we'll manually draw on the movie zone
         self.movie_zone.connect('draw', self.draw)
-        self.movie_zone.connect('configure-event', self.set_transform)
 
 
     def _set_file(self, filepath):
@@ -65,48 +306,125 @@ class GifOverlay(base.VideoOverlay):
         Args:
             filepath (`pathlib.Path`): The path to the media file path
         """
-        self.anim = GdkPixbuf.PixbufAnimation.new_from_file(str(filepath))
-        self.base_size = (self.anim.get_width(), self.anim.get_height())
-        self.anim_iter = self.anim.get_iter(None)
+        self.filepath = filepath
+        self.gif = self._decoded.get(filepath)
+        if self.gif is not None:
+            self.base_size = self.gif.get_size()
+            self.gif.holders.add(self)
+            return
+
+        # Only read the header of the file for now, frames are decoded when needed
+        file_format, width, height = GdkPixbuf.Pixbuf.get_file_info(str(filepath))
+        if file_format is None:
+            raise ValueError('Unrecognized image format for {}'.format(filepath))
+        self.base_size = (width, height)
+
+
+    def load_frames(self):
+        """ Get the frames of the gif, shared with the other overlays showing the same file, or start decoding them.
+
+        Returns:
+            :class:`~pympress.media_overlays.gif_backend.GifFrames`: the frames, possibly not all decoded yet
+        """
+        cls = type(self)
+        if self.gif is None:
+            self.gif = cls._decoded.get(self.filepath)
+        if self.gif is None:
+            self.gif = GifFrames(self.filepath, self.base_size, cls.frames_decoded)
+
+        self.gif.holders.add(self)
+        cls._decoded[self.filepath] = self.gif
+        cls._decoded.move_to_end(self.filepath)
+        return self.gif
 
-        self.set_transform()
-        self.advance_gif()
 
+    @classmethod
+    def frames_decoded(cls, gif):
+        """ Show newly decoded frames, and forget the least recently used gifs if there are too many decoded frames.
 
-    def set_transform(self, *args):
-        """ Compute the transform to scale (not stretch nor crop) the gif.
+        Args:
+            gif (:class:`~pympress.media_overlays.gif_backend.GifFrames`): The frames that were decoded
         """
-        widget_size = (self.movie_zone.get_allocated_width(), self.movie_zone.get_allocated_height())
-        scale = min(widget_size[0] / self.base_size[0], widget_size[1] / self.base_size[1])
-        dx = widget_size[0] - scale * self.base_size[0]
-        dy = widget_size[1] - scale * self.base_size[1]
+        for overlay in cls._playing:
+            if overlay.gif is gif:
+                overlay.movie_zone.queue_draw()
+        cls.restart_ticker()
 
-        self.transform = cairo.Matrix(xx = scale, yy = scale, x0 = dx / 2, y0 = dy / 2)
+        # Overlays still showing a forgotten gif keep their reference to it
+        while len(cls._decoded) > 1 and sum(frames.get_pixels() for frames in cls._decoded.values()) > \
+                cls.max_decoded_pixels:
+            cls._decoded.popitem(False)
+
+
+    @classmethod
+    def purge_shared(cls):
+        """ Forget all the decoded gifs, e.g. when the document changes.
+        """
+        for gif in cls._decoded.values():
+            gif.cancel()
+        cls._decoded.clear()
+        GifFrames.scaled_frames.clear()
+        GifFrames.scaled_pixels = 0
 
 
     def draw(self, widget, ctx):
-        """ Simple resized drawing: get the pixbuf, set the transform, draw the image.
+        """ Simple resized drawing: get the frame scaled to fit (not stretch nor crop) the widget, and draw it.
         """
-        if self.anim_iter is None:
+        ww, wh = widget.get_allocated_width(), widget.get_allocated_height()
+        scale = min(ww / self.base_size[0], wh / self.base_size[1])
+        width, height = round(scale * self.base_size[0]), round(scale * self.base_size[1])
+        if width <= 0 or height <= 0:
+            return False
+
+        gif = self.load_frames()
+        if not gif.frames:
             return False
 
         try:
-            ctx.transform(self.transform)
-            Gdk.cairo_set_source_pixbuf(ctx, self.anim_iter.get_pixbuf(), 0, 0)
+            surface = gif.get_frame(self.frame, width, height, widget.get_scale_factor())
+            ctx.set_source_surface(surface, (ww - width) // 2, (wh - height) // 2)
             ctx.paint()
         except cairo.Error:
             logger.error(_('Cairo can not draw gif'), exc_info = True)
 
 
-    def advance_gif(self):
-        """ Advance the gif, queue redrawing if the frame changed, and schedule the next frame.
+    def advance(self, now):
+        """ Update the displayed frame and queue redrawing if it changed.
+
+        Args:
+            now (`int`): the current monotonic time, in µs
+
+        Returns:
+            `float`: the time in ms until the next frame, or `None` if the frame does not change anymore
         """
-        if self.anim_iter.advance():
+        index, wait = self.load_frames().frame_at((now - self.start_time) / 1000)
+        if index != self.frame:
+            self.frame = index
             self.movie_zone.queue_draw()
+        return wait
 
-        delay = self.anim_iter.get_delay_time()
-        if delay >= 0:
-            GLib.timeout_add(delay, self.advance_gif)
+
+    @classmethod
+    def tick(cls):
+        """ Advance all the playing gifs, and schedule the next time one of them changes frame.
+
+        Returns:
+            `bool`: `True` iff this function should be run again (:func:`~GLib.timeout_add` convention)
+        """
+        now = GLib.get_monotonic_time()
+        waits = [wait for wait in (overlay.advance(now) for overlay in cls._playing) if wait is not None]
+
+        cls._ticker = GLib.timeout_add(max(1, int(min(waits))), cls.tick) if waits else 0
+        return GLib.SOURCE_REMOVE
+
+
+    @classmethod
+    def restart_ticker(cls):
+        """ Reschedule the timer after the playing gifs changed.
+        """
+        if cls._ticker:
+            GLib.source_remove(cls._ticker)
+        cls.tick()
 
 
     def do_set_time(self, t):
@@ -115,24 +433,67 @@ class GifOverlay(base.VideoOverlay):
         Should run on the main thread to ensure we avoid reentrency problems.
 
         Args:
-            t (`int`): the timestamp, in ms
+            t (`float`): the timestamp, in s
+
+        Returns:
+            `bool`: `True` iff this function should be run again (:meth:`~GLib.idle_add` convention)
+        """
+        self.start_time = GLib.get_monotonic_time() - int(t * 1e6)
+        self.restart_ticker()
+        return False
+
+
+    def do_play(self):
+        """ Start animating the gif from its first frame.
+
+        Returns:
+            `bool`: `True` iff this function should be run again (:meth:`~GLib.idle_add` convention)
+        """
+        self.frame = 0
+        self._playing.add(self)
+        return self.do_set_time(0)
+
+
+    def do_stop(self):
+        """ Stop animating the gif.
+        """
+        self._playing.discard(self)
+        self.restart_ticker()
+
+
+    def do_preroll(self):
+        """ Start decoding the frames ahead of time.
 
         Returns:
             `bool`: `True` iff this function should be run again (:meth:`~GLib.idle_add` convention)
         """
-        start = GLib.TimeVal()
-        GLib.DateTime.new_now_local().to_timeval(start)
-        start.add(-t)
-        self.anim_iter = self.anim.get_iter(start)
-        self.advance_gif()
+        self.load_frames()
+        return False
+
+
+    def do_release(self):
+        """ Forget the frames decoded ahead of time, unless another overlay holds them.
+
+        Returns:
+            `bool`: `True` iff this function should be run again (:meth:`~GLib.idle_add` convention)
+        """
+        gif, self.gif = self.gif, None
+        if gif is None:
+            return False
+
+        gif.holders.discard(self)
+        if gif.holders:
+            return False
+
+        gif.cancel()
+        if self._decoded.get(self.filepath) is gif:
+            del self._decoded[self.filepath]
         return False
 
 
     # a bunch of inherited functions that do nothing, for gifs
     def mute(self, *args): pass
     def is_playing(self): return True
-    def do_stop(self): pass
-    def do_play(self): return False
     def do_play_pause(self): return False
 
     @classmethod
@@ -50,6 +50,9 @@ class GstOverlay(base.VideoOverlay):
     #: `int` number of milliseconds between updates
     update_freq = 200
 
+    #: `bool` whether the playbin is paused on its first frame, waiting to be played
+    prerolling = False
+
     def __init__(self, *args, **kwargs):
         # Create GStreamer playbin
         self.playbin = Gst.ElementFactory.make('playbin', None)
@@ -121,15 +124,23 @@ class GstOverlay(base.VideoOverlay):
             # ignore the playbin's children
             return
         old, new, pending = msg.parse_state_changed()
-        if old == Gst.State.READY and new == Gst.State.PAUSED:
+        if old == Gst.State.READY and new == Gst.State.PAUSED and self.prerolling:
+            # the playbin is prerolled: wait on the starting position until it is played
+            if self.start_pos:
+                self.do_set_time(self.start_pos)
+        elif old == Gst.State.READY and new == Gst.State.PAUSED:
             # the playbin goes from READY (= stopped) to PLAYING (via PAUSED)
             self.on_initial_play()
 
 
-    def on_initial_play(self):
-        """ Set starting position, start scrollbar updates, unhide overlay. """
+    def on_initial_play(self, seek=True):
+        """ Set starting position, start scrollbar updates, unhide overlay.
+
+        Args:
+            seek (`bool`): whether to set the starting position, i.e. unless the playbin already is there
+        """
         # set starting position, if needed
-        if self.start_pos:
+        if seek and self.start_pos:
             self.do_set_time(self.start_pos)
         # ensure the scroll bar is updated
         GLib.idle_add(self.do_update_duration)
@@ -167,11 +178,41 @@ class GstOverlay(base.VideoOverlay):
         Returns:
             `bool`: `True` iff this function should be run again (:func:`~GLib.idle_add` convention)
         """
+        if self.prerolling and self.playbin.get_state(0).state == Gst.State.PAUSED:
+            # Already paused at the starting position, otherwise handled when reaching PAUSED
+            self.on_initial_play(seek=False)
+        self.prerolling = False
         self.playbin.set_state(Gst.State.PLAYING)
 
         return False
 
 
+    def do_preroll(self):
+        """ Preroll the playbin, i.e. pause it on its first frame, so that playing it starts immediately.
+
+        Returns:
+            `bool`: `True` iff this function should be run again (:func:`~GLib.idle_add` convention)
+        """
+        if self.playbin.get_state(0).state == Gst.State.READY and not self.is_shown():
+            self.prerolling = True
+            self.playbin.set_state(Gst.State.PAUSED)
+
+        return False
+
+
+    def do_release(self):
+        """ Bring a prerolled playbin back to READY, to release its decoders and buffers.
+
+        Returns:
+            `bool`: `True` iff this function should be run again (:func:`~GLib.idle_add` convention)
+        """
+        if self.prerolling:
+            self.prerolling = False
+            self.playbin.set_state(Gst.State.READY)
+
+        return False
+
+
     def do_play_pause(self):
         """ Toggle pause mode of the media.
 
@@ -188,6 +229,7 @@ class GstOverlay(base.VideoOverlay):
     def do_stop(self):
         """ Stops playing in the backend player.
         """
+        self.prerolling = False
         self.playbin.set_state(Gst.State.NULL)
         self.playbin.set_state(Gst.State.READY)
         self.sink.props.widget.hide()
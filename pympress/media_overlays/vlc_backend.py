@@ -163,6 +163,26 @@ class VlcOverlay(base.VideoOverlay):
         return False
 
 
+    def do_preroll(self):
+        """ Parse the media ahead of playing it.
+
+        VLC only decodes frames once it is embedded in a window, so prerolling is limited to reading the media.
+
+        Returns:
+            `bool`: `True` iff this function should be run again (:func:`~GLib.idle_add` convention)
+        """
+        media = self.player.get_media()
+        if media is None:
+            return False
+
+        try:
+            media.parse_with_options(vlc.MediaParseFlag.local, 0)
+        except AttributeError:
+            # libvlc < 3
+            media.parse_async()
+        return False
+
+
     def paint_backdrop(self, widget, context):
         """ Draw behind/around the video, aka the black bars
 
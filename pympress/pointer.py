@@ -27,12 +27,14 @@ import logging
 logger = logging.getLogger(__name__)
 
 import enum
+import collections
 
 import gi
+import cairo
 gi.require_version('Gtk', '3.0')
-from gi.repository import Gdk, GdkPixbuf, GLib
+from gi.repository import Gdk, GLib, GdkPixbuf
 
-from pympress import util, extras
+from pympress import extras, util
 
 
 class PointerMode(enum.Enum):
@@ -56,8 +58,13 @@ class Pointer(object):
         config (:class:`~pympress.config.Config`): A config object containing preferences
         builder (:class:`~pympress.builder.Builder`): A builder from which to load widgets
     """
-    #: A `dict` of the :class:`~GdkPixbuf.Pixbuf` to read XML descriptions of GUIs and load them.
-    pointers = {}
+    #: :class:`~collections.OrderedDict` of pre-rendered pointers as :class:`~cairo.ImageSurface`, keyed by color,
+    #: size and scale factor, least recently used first
+    pointers = collections.OrderedDict()
+    #: `int` maximum number of pre-rendered pointers kept in :attr:`~pointers`
+    max_pointers = 8
+    #: `int` granularity in pixels of pointer sizes, so that slightly different widget heights share a surface
+    size_bucket = 4
     #: `(float, float)` of position relative to slide, where the pointer should appear
     pointer_pos = (.5, .5)
     #: A `float` of drawing size of the pointer in ratio to the screen height
@@ -81,8 +88,8 @@ class Pointer(object):
     #: a `dict` of the :class:`~Gtk.RadioMenuItem` selecting the pointer mode
     pointermode_radios = {}
 
-    #: callback, to be connected to :func:`~pympress.ui.UI.redraw_current_slide`
-    redraw_current_slide = lambda *args: None
+    #: callback, to be connected to :func:`~pympress.ui.UI.redraw_layers`
+    redraw_layers = lambda *args: None
     #: callback, to be connected to :meth:`~pympress.app.Pympress.set_action_state`
     set_action_state = None
 
@@ -92,7 +99,7 @@ class Pointer(object):
 
         builder.load_widgets(self)
 
-        self.redraw_current_slide = builder.get_callback_handler('redraw_current_slide')
+        self.redraw_layers = builder.get_callback_handler('redraw_layers')
         self.set_action_state = builder.get_callback_handler('app.set_action_state')
 
         default_mode = config.get('presenter', 'pointer_mode')
@@ -112,29 +119,62 @@ class Pointer(object):
         })
 
 
-    def load_pointer(self, name, base_size):
-        """ Perform the change of pointer using its size and widget name where to draw.
+    def pointer_size(self, base_size):
+        """ Get the size at which the pointer is drawn, rounded to the size buckets.
 
         Args:
-            name (`str`): The widget name which associated with the loaded pointer for caching
             base_size (`int`): The basis of pointer size in pixels
 
         Returns:
-            :class:`~GdkPixbuf.Pixbuf`: A pointer from the source image
+            `int`: The size of the pointer in pixels
+        """
+        return self.size_bucket * max(1, round(base_size * self.size / self.size_bucket))
+
+
+    def load_pointer(self, base_size, scale=1):
+        """ Get the pointer surface for the current color, drawn at a size relative to the widget size.
+
+        The surface is rendered from the pointer image the first time it is needed, already premultiplied and at the
+        device scale, so drawing it is a simple blit.
+
+        Args:
+            base_size (`int`): The basis of pointer size in pixels
+            scale (`int`): The scale factor of the widget on which the pointer is drawn
+
+        Returns:
+            :class:`~cairo.ImageSurface`: A pointer of the current color, or `None` if it could not be loaded
         """
         if self.color not in ['red', 'green', 'blue']:
             raise ValueError('Wrong color name')
-        size = round(base_size * self.size)  # in pixels
-        pointer = self.pointers.get(name)
-        if pointer is None or pointer.get_height() != size:
-            path = util.get_icon_path('pointer_' + self.color + '.png')
-            try:
-                pointer = GdkPixbuf.Pixbuf.new_from_file_at_size(path, size, size)
-            except Exception:
-                logger.exception(_('Failed loading pixbuf for pointer "{}" from: {}'.format(name, path)))
-            self.pointers[name] = pointer
+        size = self.pointer_size(base_size)
+        key = (self.color, size, scale)
+        pointer = self.pointers.get(key)
+        if pointer is not None:
+            self.pointers.move_to_end(key)
+            return pointer
+
+        path = util.get_icon_path('pointer_' + self.color + '.png')
+        try:
+            pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_size(path, size * scale, size * scale)
+        except Exception:
+            logger.exception(_('Failed loading pixbuf for pointer "{}" from: {}'.format(self.color, path)))
+            return None
+
+        pointer = cairo.ImageSurface(cairo.FORMAT_ARGB32, size * scale, size * scale)
+        ctx = cairo.Context(pointer)
+        Gdk.cairo_set_source_pixbuf(ctx, pixbuf, (size * scale - pixbuf.get_width()) / 2,
+                                    (size * scale - pixbuf.get_height()) / 2)
+        ctx.paint()
+        del ctx
+        pointer.flush()
+        pointer.set_device_scale(scale, scale)
+
+        self.pointers[key] = pointer
+        while len(self.pointers) > self.max_pointers:
+            self.pointers.popitem(False)
         return pointer
 
+
     def change_pointercolor(self, action, target):
         """ Callback for a radio item selection as pointer mode (continuous, manual, none).
 
@@ -186,7 +226,7 @@ class Pointer(object):
             else:
                 extras.Cursor.set_cursor(slide_widget, 'parent')
 
-        self.redraw_current_slide()
+        self.redraw_layers()
 
 
     def change_pointermode(self, action, target):
@@ -205,6 +245,26 @@ class Pointer(object):
         action.change_state(GLib.Variant.new_string(mode.name.lower()))
 
 
+    def get_extents(self, ww, wh):
+        """ Get the area covered by the laser pointer on screen.
+
+        Args:
+            ww (`int`): The widget width
+            wh (`int`): The widget height
+
+        Returns:
+            `tuple`: The (x, y, width, height) rectangle in pixels where the pointer is drawn, or `None` if hidden
+        """
+        if not self.show_pointer:
+            return None
+
+        size = self.pointer_size(wh)
+        # Align on whole pixels, so that cairo copies the surface without resampling it
+        x = round(ww * self.pointer_pos[0] - size / 2)
+        y = round(wh * self.pointer_pos[1] - size / 2)
+        return x, y, size, size
+
+
     def render_pointer(self, cairo_context, widget, ww, wh):
         """ Draw the laser pointer on screen.
 
@@ -214,12 +274,15 @@ class Pointer(object):
             ww (`int`): The widget width
             wh (`int`): The widget height
         """
-        if self.show_pointer:
-            pointer = self.load_pointer(widget.get_name(), wh)
-            x = ww * self.pointer_pos[0] - pointer.get_width() / 2
-            y = wh * self.pointer_pos[1] - pointer.get_height() / 2
-            Gdk.cairo_set_source_pixbuf(cairo_context, pointer, x, y)
-            cairo_context.paint()
+        extents = self.get_extents(ww, wh)
+        if extents is not None:
+            pointer = self.load_pointer(wh, widget.get_scale_factor())
+            if pointer is None:
+                return
+            x, y, width, height = extents
+            cairo_context.set_source_surface(pointer, x, y)
+            cairo_context.rectangle(x, y, width, height)
+            cairo_context.fill()
 
 
     def track_pointer(self, widget, event):
@@ -236,7 +299,7 @@ class Pointer(object):
             ww, wh = widget.get_allocated_width(), widget.get_allocated_height()
             ex, ey = event.get_coords()
             self.pointer_pos = (ex / ww, ey / wh)
-            self.redraw_current_slide()
+            self.redraw_layers()
             return True
 
         else:
@@ -269,7 +332,7 @@ class Pointer(object):
             self.show_pointer = False
             extras.Cursor.set_cursor(widget, 'parent')
 
-        self.redraw_current_slide()
+        self.redraw_layers()
         return True
 
 
@@ -298,7 +361,7 @@ class Pointer(object):
         elif self.show_pointer and event.type == Gdk.EventType.BUTTON_RELEASE:
             self.show_pointer = False
             extras.Cursor.set_cursor(widget, 'parent')
-            self.redraw_current_slide()
+            self.redraw_layers()
             return True
 
         else:
@@ -27,13 +27,185 @@ import logging
 logger = logging.getLogger(__name__)
 
 import math
+import collections
 
 import gi
 import cairo
 gi.require_version('Gtk', '3.0')
 from gi.repository import Gtk, Gdk, GLib
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 from pympress import builder, extras, util
+from pympress.strokes import Stroke, StrokeIndex, ScribbleStore
+
+
+class TiledLayer(object):
+    """ A sparse transparent layer, only allocating the square tiles that are drawn upon.
+
+    It exposes the same size methods as a :class:`~cairo.ImageSurface`, and coordinates in the contexts it provides
+    are scaled by the device scale, just as with a surface.
+
+    Args:
+        width (`int`): The width of the layer, in device pixels
+        height (`int`): The height of the layer, in device pixels
+        scale (`int`): The device scale of the layer
+    """
+    #: `int` size of the side of each tile, in device pixels
+    tile_size = 256
+    #: `dict` mapping the (column, row) of allocated tiles to their :class:`~cairo.ImageSurface`
+    tiles = {}
+
+    def __init__(self, width, height, scale):
+        self.width = width
+        self.height = height
+        self.scale = scale
+        self.tiles = {}
+
+
+    def get_width(self):
+        """ Get the width of the layer.
+
+        Returns:
+            `int`: the width in device pixels
+        """
+        return self.width
+
+
+    def get_height(self):
+        """ Get the height of the layer.
+
+        Returns:
+            `int`: the height in device pixels
+        """
+        return self.height
+
+
+    def get_device_scale(self):
+        """ Get the device scale of the layer.
+
+        Returns:
+            `tuple`: the horizontal and vertical device scales
+        """
+        return (self.scale, self.scale)
+
+
+    def get_pixels(self):
+        """ Get the memory used by the layer.
+
+        Returns:
+            `int`: the number of pixels in allocated tiles
+        """
+        return len(self.tiles) * self.tile_size * self.tile_size
+
+
+    def get_extents(self):
+        """ Get the bounding box of the allocated tiles.
+
+        Returns:
+            `tuple`: the left, top, right and bottom coordinates of the bounding box, or `None` if the layer is empty
+        """
+        if not self.tiles:
+            return None
+
+        step = self.tile_size / self.scale
+        cols, rows = [col for col, row in self.tiles], [row for col, row in self.tiles]
+        return (min(cols) * step, min(rows) * step, (max(cols) + 1) * step, (max(rows) + 1) * step)
+
+
+    def get_contexts(self, extents, allocate=True):
+        """ Get cairo contexts to draw on the tiles within a region.
+
+        Args:
+            extents (`tuple`): The left, top, right and bottom coordinates of the region
+            allocate (`bool`): Whether to allocate the missing tiles, or only return contexts for existing ones
+
+        Returns:
+            `list`: a :class:`~cairo.Context` for each tile, translated such that all contexts share coordinates
+        """
+        step = self.tile_size / self.scale
+        x0, y0, x1, y1 = extents
+        cols = range(max(0, int(x0 // step)), min(math.ceil(self.width / self.tile_size), int(x1 // step) + 1))
+        rows = range(max(0, int(y0 // step)), min(math.ceil(self.height / self.tile_size), int(y1 // step) + 1))
+
+        contexts = []
+        for col in cols:
+            for row in rows:
+                tile = self.tiles.get((col, row))
+                if tile is None and allocate:
+                    try:
+                        tile = cairo.ImageSurface(cairo.Format.ARGB32, self.tile_size, self.tile_size)
+                    except cairo.Error:
+                        logger.warning('Failed creating a tile for the highlight cache', exc_info=True)
+                        continue
+                    tile.set_device_scale(self.scale, self.scale)
+                    self.tiles[(col, row)] = tile
+                elif tile is None:
+                    continue
+
+                cairo_context = cairo.Context(tile)
+                cairo_context.translate(-col * step, -row * step)
+                contexts.append(cairo_context)
+
+        return contexts
+
+
+    def paint(self, cairo_context):
+        """ Draw the allocated tiles, skipping those outside of the clip region.
+
+        Tile edges are not antialiased, so that under a fractional transform (e.g. while zooming) each pixel on the
+        border between two tiles is painted once, by one of them, instead of being blended twice with partial coverage.
+        Tiles are padded rather than fading to transparent at their borders when filtered.
+
+        Args:
+            cairo_context (:class:`~cairo.Context`): The canvas on which to draw the layer
+        """
+        step = self.tile_size / self.scale
+        x0, y0, x1, y1 = cairo_context.clip_extents()
+
+        cairo_context.save()
+        cairo_context.set_antialias(cairo.Antialias.NONE)
+
+        for (col, row), tile in self.tiles.items():
+            if col * step > x1 or (col + 1) * step < x0 or row * step > y1 or (row + 1) * step < y0:
+                continue
+
+            cairo_context.set_source_surface(tile, col * step, row * step)
+            cairo_context.get_source().set_extend(cairo.Extend.PAD)
+            cairo_context.rectangle(col * step, row * step, step, step)
+            cairo_context.fill()
+
+        cairo_context.restore()
+
+
+    def copy(self):
+        """ Make an independent copy of the layer, e.g. to restore it later.
+
+        Returns:
+            :class:`~pympress.scribble.TiledLayer`: the copy, with copies of all allocated tiles
+        """
+        layer = TiledLayer(self.width, self.height, self.scale)
+        for key, tile in self.tiles.items():
+            try:
+                copy = cairo.ImageSurface(cairo.Format.ARGB32, self.tile_size, self.tile_size)
+            except cairo.Error:
+                logger.warning('Failed copying a tile of the highlight cache', exc_info=True)
+                return None
+            copy.set_device_scale(self.scale, self.scale)
+
+            cairo_context = cairo.Context(copy)
+            cairo_context.set_operator(cairo.OPERATOR_SOURCE)
+            cairo_context.set_source_surface(tile)
+            cairo_context.paint()
+            del cairo_context
+
+            layer.tiles[key] = copy
+
+        return layer
+
 
 
 class Scribbler(builder.Builder):
@@ -46,13 +218,18 @@ class Scribbler(builder.Builder):
     """
     #: Whether we are displaying the interface to scribble on screen and the overlays containing said scribbles
     scribbling_mode = False
-    #: `list` of scribbles to be drawn, as tuples of color :class:`~Gdk.RGBA`, width `int`, a `list` of points,
-    #: and a `list` of pressure values.
+    #: `list` of scribbles to be drawn, as :class:`~pympress.strokes.Stroke`
     scribble_list = []
-    #: `list` of undone scribbles to possibly redo
+    #: `list` of undone scribbles to possibly redo, or `tuple` of scribble lists before and after an undone erasure
     scribble_redo_list = []
+    #: `list` of `tuple` of scribble lists before and after each erasure, that can be undone
+    scribble_erasures = []
+    #: :class:`~pympress.strokes.StrokeIndex` of the scribbles in :attr:`scribble_list`, to find those to erase
+    stroke_index = None
     #: Whether the current mouse movements are drawing strokes or should be ignored
     scribble_drawing = False
+    #: `list` of the scribbles before the current erasure, or `None` if the current mouse movements are not erasing
+    scribble_erasing = None
     #: :class:`~Gdk.RGBA` current color of the scribbling tool
     scribble_color = Gdk.RGBA()
     #: `int` current stroke width of the scribbling tool
@@ -62,6 +239,8 @@ class Scribbler(builder.Builder):
     scribble_overlay = None
     #: :class:`~Gtk.DrawingArea` for the scribbles in the Presenter window. Actually redraws the slide.
     scribble_p_da = None
+    #: :class:`~Gtk.DrawingArea` above :attr:`~scribble_p_da`, where the pointer and zoom selection are drawn
+    scribble_p_da_layer = None
     #: :class:`~Gtk.EventBox` for the scribbling in the Content window, captures freehand drawing
     scribble_c_eb = None
     #: :class:`~Gtk.EventBox` for the scribbling in the Presenter window, captures freehand drawing
@@ -80,10 +259,29 @@ class Scribbler(builder.Builder):
 
     #: The position of the mouse on the slide as `tuple` of `float`
     mouse_pos = None
-    #: A :class:`~cairo.Surface` to hold drawn highlights
+    #: A :class:`~pympress.scribble.TiledLayer` to hold drawn highlights
     scribble_cache = None
     #: The next scribble to render (i.e. that is not rendered in cache)
     next_render = 0
+    #: A :class:`~pympress.scribble.TiledLayer` to hold the scribble being drawn
+    live_surface = None
+    #: `int` number of curves of the scribble being drawn that are already rendered in :attr:`live_surface`
+    live_rendered = 0
+    #: `dict` mapping the names of widgets other than :attr:`c_da` to a :class:`~pympress.scribble.TiledLayer` holding
+    #: the drawn highlights at the widget's resolution
+    output_layers = {}
+    #: `dict` mapping the names of widgets in :attr:`output_layers` to the number of scribbles rendered in their layer
+    output_rendered = {}
+    #: `int` number of outputs (i.e. widgets where scribbles are drawn) for which stroke outlines are cached
+    max_outputs = 3
+    #: `int` number of scribbles between two checkpoints of the scribble layers
+    checkpoint_interval = 16
+    #: :class:`~collections.OrderedDict` of copies of scribble layers, each keyed by the last
+    #: :class:`~pympress.strokes.Stroke` it contains and the size of the layer, and storing the number of scribbles
+    #: it contains and the layer, from least to most recently used
+    checkpoints = None
+    #: `int` maximum number of pixels of all checkpoints together
+    max_checkpoint_pixels = 4 * 3840 * 2160
 
     #: :class:`~Gtk.Button` for removing the last drawn scribble
     scribble_undo = None
@@ -104,6 +302,8 @@ class Scribbler(builder.Builder):
     resize_cache = lambda *args: None
     #: callback, to be connected to :func:`~pympress.ui.UI.on_draw`
     on_draw = lambda *args: None
+    #: callback, to be connected to :func:`~pympress.ui.UI.on_draw_layer`
+    on_draw_layer = lambda *args: None
     #: callback, to be connected to :func:`~pympress.ui.UI.track_motions`
     track_motions = lambda *args: None
     #: callback, to be connected to :func:`~pympress.ui.UI.track_clicks`
@@ -113,6 +313,10 @@ class Scribbler(builder.Builder):
     load_layout = lambda *args: None
     #: callback, to be connected to :func:`~pympress.ui.UI.redraw_current_slide`
     redraw_current_slide = lambda *args: None
+    #: callback, to be connected to :func:`~pympress.ui.UI.get_notes_mode`
+    get_notes_mode = lambda *args: None
+    #: callback, to be connected to :func:`~pympress.ui.UI.ask_save_uri`
+    ask_save_uri = lambda *args: None
 
     #: callback, to be connected to :func:`~pympress.extras.Zoom.get_slide_point`
     get_slide_point = lambda *args: None
@@ -148,6 +352,12 @@ class Scribbler(builder.Builder):
     remembered_scribbles = {}
     #: `tuple` of (`int`, `str`) indicating the current page number and label
     current_page = (None, None)
+    #: :class:`~pympress.strokes.ScribbleStore` where the scribbles of the current document are persisted, or `None`
+    store = None
+    #: The current :class:`~pympress.document.Document`
+    doc = None
+    #: `int` id of the :func:`~GLib.idle_add` source preparing the export of scribbles as ink annotations, or `None`
+    ink_export = None
 
     #: `str` indicating the current layout of the highlight toolbar
     tools_orientation = 'vertical'
@@ -167,10 +377,13 @@ class Scribbler(builder.Builder):
         self.get_application().add_window(self.scribble_off_render)
 
         self.on_draw = builder.get_callback_handler('on_draw')
+        self.on_draw_layer = builder.get_callback_handler('on_draw_layer')
         self.track_motions = builder.get_callback_handler('track_motions')
         self.track_clicks = builder.get_callback_handler('track_clicks')
         self.load_layout = builder.get_callback_handler('load_layout')
         self.redraw_current_slide = builder.get_callback_handler('redraw_current_slide')
+        self.get_notes_mode = builder.get_callback_handler('get_notes_mode')
+        self.ask_save_uri = builder.get_callback_handler('ask_save_uri')
         self.resize_cache = builder.get_callback_handler('cache.resize_widget')
         self.get_slide_point = builder.get_callback_handler('zoom.get_slide_point')
         self.start_zooming = builder.get_callback_handler('zoom.start_zooming')
@@ -178,6 +391,11 @@ class Scribbler(builder.Builder):
 
         self.connect_signals(self)
         self.config = config
+        self.checkpoints = collections.OrderedDict()
+        self.output_layers = {}
+        self.output_rendered = {}
+        self.scribble_erasures = []
+        self.stroke_index = StrokeIndex()
 
         # Prepare cairo surfaces for markers, with 3 different marker sizes, and for eraser
         ms = [1, 2, 3]
@@ -208,6 +426,7 @@ class Scribbler(builder.Builder):
             'highlight-clear':   dict(activate=self.clear_scribble),
             'highlight-redo':    dict(activate=self.redo_scribble),
             'highlight-undo':    dict(activate=self.pop_scribble),
+            'highlight-export':  dict(activate=self.export_ink_annotations),
             'highlight-mode':    dict(activate=self.set_mode, state=self.highlight_mode, parameter_type=str),
             'highlight-page-exit': dict(activate=self.page_change_action, state=self.page_change_exits),
             'highlight-tools-orientation': dict(activate=self.set_tools_orientation, state=self.tools_orientation,
@@ -249,13 +468,273 @@ class Scribbler(builder.Builder):
             return False
 
         self.get_application().lookup_action('highlight-mode').change_state(GLib.Variant.new_string(new_mode))
-        self.highlight_mode = new_mode
+        old_mode, self.highlight_mode = self.highlight_mode, new_mode
         self.config.set('highlight', 'mode', self.highlight_mode)
         self.remembered_scribbles.clear()
 
+        # Show the scribbles stored for the current page in the new mode, keeping the current scribbles if they
+        # are not stored anywhere, instead of overwriting what is stored with them.
+        page = self.current_page_key()
+        key = self.store_key(page)
+        if self.store is None or key is None or (page is None and new_mode != 'global'):
+            return True
+
+        unsaved = self.scribble_list if old_mode == 'single-page' else []
+        for stroke in unsaved:
+            self.store.add(key, stroke)
+
+        self.drop_checkpoints(self.scribble_list)
+        self.scribble_list = self.load_scribbles(page)
+        self.scribble_erasures.clear()
+        self.scribble_redo_list.clear()
+        self.stroke_index = StrokeIndex(self.scribble_list)
+
+        if self.c_da.get_window() is not None:
+            self.reset_scribble_cache()
+            self.prerender()
+        self.redraw_current_slide()
+        self.adjust_buttons()
+
         return True
 
 
+    def swap_document(self, doc, reloading=False):
+        """ Forget the scribbles of the previous document, and find those stored for the new document.
+
+        Args:
+            doc (:class:`~pympress.document.Document`): The new document
+            reloading (`bool`): Whether the document is the same one, reloaded, in which case scribbles are kept
+        """
+        if self.ink_export is not None:
+            GLib.source_remove(self.ink_export)
+            self.ink_export = None
+            if self.doc is not None:
+                self.doc.clear_ink_annotations()
+        self.doc = doc
+
+        if reloading:
+            return
+
+        self.store = None
+
+        if doc.path is not None:
+            try:
+                self.store = ScribbleStore(util.get_scribbles_path(doc.path))
+            except OSError:
+                logger.warning('Failed to open the stored scribbles for {}'.format(doc.path), exc_info=True)
+
+        self.remembered_scribbles.clear()
+        self.scribble_redo_list.clear()
+        self.scribble_erasures.clear()
+        self.current_page = (None, None)
+        self.drop_checkpoints(self.scribble_list)
+
+        # In per-page modes, the current page's scribbles are loaded on the next page change
+        self.scribble_list = self.load_scribbles(None) if self.highlight_mode == 'global' else []
+        self.stroke_index = StrokeIndex(self.scribble_list)
+        if self.c_da.get_window() is not None:
+            self.reset_scribble_cache()
+            self.prerender()
+        self.adjust_buttons()
+
+
+    def store_key(self, page):
+        """ Get the key identifying the scribbles of a page in the store, depending on the highlight mode.
+
+        Args:
+            page (`int` or `str`): The page number in per-page mode, the page label in per-label mode
+
+        Returns:
+            `str`: the key, or `None` if the scribbles are not stored in the current mode
+        """
+        if self.highlight_mode == 'per-page':
+            return 'page:{}'.format(page)
+        elif self.highlight_mode == 'per-label':
+            return 'label:{}'.format(page)
+        elif self.highlight_mode == 'global':
+            return 'global'
+        else:
+            return None
+
+
+    def load_scribbles(self, page):
+        """ Read the stored scribbles of a page.
+
+        Args:
+            page (`int` or `str`): The page number in per-page mode, the page label in per-label mode
+
+        Returns:
+            `list`: the :class:`~pympress.strokes.Stroke` of the page
+        """
+        key = self.store_key(page)
+        if self.store is None or key is None:
+            return []
+
+        return self.store.load(key)
+
+
+    def persist_scribbles(self, stroke=None):
+        """ Store the scribbles of the current page.
+
+        Args:
+            stroke (:class:`~pympress.strokes.Stroke`): The only scribble added since the last call, if any,
+                                                         otherwise all the scribbles are stored again
+        """
+        page = self.current_page[1 if self.highlight_mode == 'per-label' else 0]
+        key = self.store_key(page)
+        if self.store is None or key is None or (page is None and self.highlight_mode != 'global'):
+            return
+
+        if stroke is not None:
+            self.store.add(key, stroke)
+        else:
+            self.store.replace(key, self.scribble_list)
+
+
+    def current_page_key(self):
+        """ Get the identifier of the current page in the current highlight mode.
+
+        Returns:
+            `int` or `str`: The page number in per-page mode, the page label in per-label mode, `None` otherwise
+        """
+        if self.highlight_mode == 'per-page':
+            return self.current_page[0]
+        elif self.highlight_mode == 'per-label':
+            return self.current_page[1]
+        else:
+            return None
+
+
+    def scribbled_pages(self):
+        """ Iterate over the pages that have scribbles, loading them from the store as needed.
+
+        Returns:
+            generator: yields the identifier of each page (as in :meth:`current_page_key`), its number,
+            and the `list` of its :class:`~pympress.strokes.Stroke`
+        """
+        if self.highlight_mode not in {'per-page', 'per-label'}:
+            if self.current_page[0] is not None and self.scribble_list:
+                yield None, self.current_page[0], self.scribble_list
+            return
+
+        per_label = self.highlight_mode == 'per-label'
+        prefix = 'label:' if per_label else 'page:'
+        current = self.current_page_key()
+
+        pages = set(self.remembered_scribbles) | {current}
+        if self.store is not None:
+            pages.update(key[len(prefix):] if per_label else int(key[len(prefix):])
+                         for key in self.store.keys() if key.startswith(prefix))
+
+        for page in pages:
+            if page == current:
+                strokes = self.scribble_list
+            elif page in self.remembered_scribbles:
+                strokes = self.remembered_scribbles[page]
+            else:
+                strokes = self.load_scribbles(page)
+
+            if not strokes:
+                continue
+            elif per_label:
+                # Put the scribbles on the last page with that label, i.e. after all overlays
+                numbers = [number for number, label in enumerate(self.doc.page_labels) if label == page]
+                if numbers:
+                    yield page, numbers[-1], strokes
+            else:
+                yield page, page, strokes
+
+
+    def export_ink_annotations(self, *args):
+        """ Ask where to save the document, then add the scribbles to it as ink annotations during idle time.
+        """
+        if self.doc is None or self.ink_export is not None:
+            return
+
+        dest_uri = self.ask_save_uri(_('Export scribbles as...'))
+        if dest_uri is None:
+            return
+
+        job = self.prepare_ink_annotations(dest_uri)
+        self.ink_export = GLib.idle_add(next, job, False)
+
+
+    def prepare_ink_annotations(self, dest_uri):
+        """ Add the scribbles as ink annotations one page at a time, then save the document.
+
+        Scribbles of the same color and width are grouped into a single annotation.
+
+        Args:
+            dest_uri (`str`): The URI where to save the annotated document
+
+        Returns:
+            generator: yields `True` while there are pages left to annotate (:func:`~GLib.idle_add` convention)
+        """
+        dtype = self.get_notes_mode().complement()
+        exported = {}
+
+        for key, number, strokes in self.scribbled_pages():
+            page = self.doc.page(number)
+            if page is None:
+                continue
+
+            groups = collections.defaultdict(list)
+            for stroke in strokes:
+                groups[(tuple(stroke.color), stroke.width)].append(stroke.get_points(1, 1))
+
+            for (color, width), paths in groups.items():
+                # Stroke widths are relative to the largest side of the slide
+                if not page.new_ink_annotation(paths, color, width / 900, dtype):
+                    self.doc.clear_ink_annotations()
+                    self.ink_export = None
+                    return
+
+            exported[key] = {ScribbleStore.encode([stroke]) for stroke in strokes}
+            yield True
+
+        self.ink_export = None
+        if exported:
+            self.ink_saved(dest_uri, exported, self.doc.save_changes(dest_uri))
+        yield False
+
+
+    def ink_saved(self, dest_uri, exported, saved):
+        """ Once the scribbles are saved as ink annotations in the current document, drop them from the scribbles.
+
+        This avoids drawing them twice (as scribbles and as annotations), or exporting them again.
+
+        Args:
+            dest_uri (`str`): The URI where the current document was saved
+            exported (`dict`): Maps the exported pages (as in :meth:`current_page_key`) to the `set` of encoded strokes
+            saved (`bool`): Whether the document was successfully saved
+        """
+        if not saved or dest_uri not in {None, self.doc.uri}:
+            return
+
+        current = self.current_page_key()
+        for page, strokes in exported.items():
+            def keep(scribbles):
+                return [stroke for stroke in scribbles if ScribbleStore.encode([stroke]) not in strokes]
+
+            if page == current:
+                self.replace_scribbles(keep(self.scribble_list))
+                self.persist_scribbles()
+            elif page in self.remembered_scribbles:
+                self.remembered_scribbles[page] = keep(self.remembered_scribbles[page])
+                if self.store is not None:
+                    self.store.replace(self.store_key(page), self.remembered_scribbles[page])
+            elif self.store is not None:
+                self.store.replace(self.store_key(page), keep(self.load_scribbles(page)))
+
+        # Undoing an erasure could otherwise restore exported scribbles
+        self.scribble_erasures.clear()
+        if self.c_da.get_window() is not None:
+            self.reset_scribble_cache()
+            self.prerender()
+        self.redraw_current_slide()
+        self.adjust_buttons()
+
+
     def try_cancel(self):
         """ Cancel scribbling, if it is enabled.
 
@@ -284,7 +763,8 @@ class Scribbler(builder.Builder):
         return color
 
 
-    def points_to_curves(self, points):
+    @staticmethod
+    def points_to_curves(points):
         """ Transform a list of points from scribbles to bezier curves
 
         Returns:
@@ -319,16 +799,18 @@ class Scribbler(builder.Builder):
         pos = self.get_slide_point(widget, event) + ()
 
         if self.scribble_drawing:
-            self.scribble_list[-1][-2].append(pos)
             pressure = event.get_axis(Gdk.AxisUse.PRESSURE)
-            self.scribble_list[-1][-1].append(1. if pressure is None else pressure)
+            self.scribble_list[-1].append(*pos, 1. if pressure is None else pressure)
+            self.render_live_stroke()
             self.scribble_redo_list.clear()
 
             self.adjust_buttons()
+        elif self.scribble_erasing is not None:
+            self.erase(self.mouse_pos or pos, pos)
 
         self.mouse_pos = pos
         self.redraw_current_slide()
-        return self.scribble_drawing
+        return self.scribble_drawing or self.scribble_erasing is not None
 
 
     def key_event(self, widget, event):
@@ -383,12 +865,31 @@ class Scribbler(builder.Builder):
                 self.toggle_erase_source = 'modifier'
                 self.load_preset(target=0)
 
-            self.scribble_list.append((self.scribble_color, self.scribble_width, [], []))
-            self.scribble_drawing = True
+            if not self.scribble_color.alpha:
+                # alpha == 0 -> Eraser mode
+                self.scribble_erasing = self.scribble_list.copy()
+                self.mouse_pos = None
+            else:
+                self.scribble_list.append(Stroke(self.scribble_color, self.scribble_width))
+                self.scribble_drawing = True
+                self.reset_live_stroke()
 
             return self.track_scribble(widget, event)
         elif event.get_event_type() == Gdk.EventType.BUTTON_RELEASE:
+            if self.scribble_drawing:
+                self.commit_live_stroke()
+                scale = self.c_da.get_scale_factor()
+                self.scribble_list[-1].simplify(self.c_da.get_allocated_width() * scale,
+                                                self.c_da.get_allocated_height() * scale)
+                self.stroke_index.add(self.scribble_list[-1])
+                self.persist_scribbles(self.scribble_list[-1])
+            elif self.scribble_erasing is not None and self.scribble_erasing != self.scribble_list:
+                self.scribble_erasures.append((self.scribble_erasing, self.scribble_list.copy()))
+                self.persist_scribbles()
+                self.adjust_buttons()
+
             self.scribble_drawing = False
+            self.scribble_erasing = None
             self.prerender()
 
             if not self.active_preset and self.previous_preset and self.toggle_erase_source == 'modifier':
@@ -402,7 +903,7 @@ class Scribbler(builder.Builder):
 
 
     def reset_scribble_cache(self):
-        """ Clear the cached scribbles.
+        """ Clear the cached scribbles, of the content window and of all other outputs.
         """
         window = self.c_da.get_window()
 
@@ -412,25 +913,122 @@ class Scribbler(builder.Builder):
 
         scale = window.get_scale_factor()
         ww, wh = self.c_da.get_allocated_width() * scale, self.c_da.get_allocated_height() * scale
-        try:
-            self.scribble_cache = window.create_similar_image_surface(cairo.Format.ARGB32, ww, wh, scale)
-        except ValueError as e:
-            if e.args == ('invalid enum value: 5',):
-                # Just try again as this error seems to always happen at the first call but not later on
-                # This is the gi introspection of cairo not accepting the value Format.RGB30 (???)
-                try:
-                    self.scribble_cache = window.create_similar_image_surface(cairo.Format.ARGB32, ww, wh, scale)
-                except ValueError:
-                    logger.exception('Error creating highlight cache')
-                else:
-                    self.next_render = 0
-            else:
-                logger.exception('Error creating highlight cache')
-        except cairo.Error:
-            logger.warning('Failed creating an ARGB32 surface sized {}x{} scale {} for highlight cache'
-                           .format(ww, wh, scale), exc_info=True)
-        else:
-            self.next_render = 0
+        self.scribble_cache, self.next_render = self.restore_checkpoint(TiledLayer(ww, wh, scale))
+
+        for name, layer in self.output_layers.items():
+            empty = TiledLayer(layer.get_width(), layer.get_height(), layer.get_device_scale()[0])
+            self.output_layers[name], self.output_rendered[name] = self.restore_checkpoint(empty)
+
+        # Checkpoints of other sizes are useless now
+        sizes = {self.layer_size(layer) for layer in [self.scribble_cache, *self.output_layers.values()]}
+        for key in [key for key in self.checkpoints if key[1:] not in sizes]:
+            del self.checkpoints[key]
+
+
+    @staticmethod
+    def layer_size(layer):
+        """ Get the size of a layer, to identify its checkpoints.
+
+        Args:
+            layer (:class:`~pympress.scribble.TiledLayer`): The layer
+
+        Returns:
+            `tuple`: the width, height and device scale of the layer
+        """
+        return (layer.get_width(), layer.get_height(), layer.get_device_scale()[0])
+
+
+    def save_checkpoint(self, layer, count):
+        """ Keep a copy of a scribble layer if it contains a multiple of :attr:`checkpoint_interval` scribbles.
+
+        The least recently used checkpoints are dropped to stay within :attr:`max_checkpoint_pixels`.
+
+        Args:
+            layer (:class:`~pympress.scribble.TiledLayer`): The layer
+            count (`int`): The number of scribbles rendered in the layer
+        """
+        if not count or count % self.checkpoint_interval:
+            return
+
+        key = (self.scribble_list[count - 1], *self.layer_size(layer))
+        if key in self.checkpoints:
+            self.checkpoints.move_to_end(key)
+            return
+
+        checkpoint = layer.copy()
+        if checkpoint is None:
+            return
+
+        self.checkpoints[key] = (count, checkpoint)
+
+        pixels = sum(layer.get_pixels() for _, layer in self.checkpoints.values())
+        while pixels > self.max_checkpoint_pixels and len(self.checkpoints) > 1:
+            _, (_, layer) = self.checkpoints.popitem(last = False)
+            pixels -= layer.get_pixels()
+
+
+    def restore_checkpoint(self, layer):
+        """ Start an empty scribble layer from the latest checkpoint matching the current scribbles, if any.
+
+        Args:
+            layer (:class:`~pympress.scribble.TiledLayer`): The empty layer
+
+        Returns:
+            `tuple`: the layer to use, and the number of scribbles already rendered in it
+        """
+        size = self.layer_size(layer)
+        available = len(self.scribble_list) - (1 if self.scribble_drawing else 0)
+
+        for count in range(available - available % self.checkpoint_interval, 0, -self.checkpoint_interval):
+            key = (self.scribble_list[count - 1], *size)
+            if key not in self.checkpoints or self.checkpoints[key][0] != count:
+                continue
+
+            restored = self.checkpoints[key][1].copy()
+            if restored is None:
+                break
+
+            self.checkpoints.move_to_end(key)
+            return restored, count
+
+        return layer, 0
+
+
+    def drop_checkpoints(self, strokes):
+        """ Forget the checkpoints ending with any of the given scribbles.
+
+        Args:
+            strokes (`list`): The :class:`~pympress.strokes.Stroke` that are no longer drawn
+        """
+        strokes = set(strokes)
+        for key in [key for key in self.checkpoints if key[0] in strokes]:
+            del self.checkpoints[key]
+
+
+    def render_layer(self, layer, count):
+        """ Render the scribbles that are not yet in a layer.
+
+        Args:
+            layer (:class:`~pympress.scribble.TiledLayer`): The layer
+            count (`int`): The number of scribbles already rendered in the layer
+
+        Returns:
+            `int`: the number of scribbles rendered in the layer
+        """
+        scale = layer.get_device_scale()[0]
+        ww, wh = layer.get_width() / scale, layer.get_height() / scale
+        pen_scale_factor = max(ww / 900, wh / 900)  # or sqrt of product
+
+        strokes = self.scribble_list[count:-1 if self.scribble_drawing else None]
+        widths = [stroke.width * pen_scale_factor for stroke in strokes]
+
+        for stroke, width, geometry in zip(strokes, widths, self.outline_geometries(strokes, ww, wh, widths)):
+            for cairo_context in layer.get_contexts(stroke.get_extents(ww, wh, width / 2 + 1)):
+                self.render_scribble(cairo_context, stroke, ww, wh, width, geometry=geometry)
+            count += 1
+            self.save_checkpoint(layer, count)
+
+        return count
 
 
     def prerender(self):
@@ -443,63 +1041,360 @@ class Scribbler(builder.Builder):
             self.next_render = 0
             return
 
-        scale = self.c_da.get_window().get_scale_factor()
-        ww, wh = self.scribble_cache.get_width() / scale, self.scribble_cache.get_height() / scale
-        pen_scale_factor = max(ww / 900, wh / 900)  # or sqrt of product
+        self.next_render = self.render_layer(self.scribble_cache, self.next_render)
+
+        for name, layer in self.output_layers.items():
+            self.output_rendered[name] = self.render_layer(layer, self.output_rendered[name])
 
-        cairo_context = cairo.Context(self.scribble_cache)
-        cairo_context.set_line_cap(cairo.LINE_CAP_ROUND)
 
-        draw = slice(self.next_render, -1 if self.scribble_drawing else None)
+    def get_output_layer(self, widget):
+        """ Get the scribble layer of a widget, at the widget's resolution, with all scribbles rendered.
+
+        Args:
+            widget (:class:`~Gtk.Widget`): The widget where to draw the scribbles
+
+        Returns:
+            :class:`~pympress.scribble.TiledLayer`: the layer
+        """
+        if widget is self.c_da:
+            return self.scribble_cache
 
-        for color, width, points, pressure in self.scribble_list[draw]:
-            self.render_scribble(cairo_context, color, width * pen_scale_factor, [(x * ww, y * wh) for x, y in points],
-                                 pressure)
-        del cairo_context
+        name = widget.get_name()
+        scale = widget.get_scale_factor()
+        size = (widget.get_allocated_width() * scale, widget.get_allocated_height() * scale, scale)
 
-        self.next_render = draw.indices(len(self.scribble_list))[1]
+        if name not in self.output_layers or self.layer_size(self.output_layers[name]) != size:
+            self.output_layers[name], self.output_rendered[name] = self.restore_checkpoint(TiledLayer(*size))
 
+        self.output_rendered[name] = self.render_layer(self.output_layers[name], self.output_rendered[name])
+        return self.output_layers[name]
 
-    def render_scribble(self, cairo_context, color, width, points, pressures):
-        """ Draw a single scribble, i.e. a bezier curve, on the cairo context
+
+    def render_scribble(self, cairo_context, stroke, ww, wh, width, cache=True, geometry=None):
+        """ Draw a single scribble, i.e. a variable-width outline, filled in a single operation on the cairo context
 
         Args:
             cairo_context (:class:`~cairo.Context`): The canvas on which to render the drawings
-            color (:class:`~Gdk.RGBA`): The color of the scribble
+            stroke (:class:`~pympress.strokes.Stroke`): The scribble to draw
+            ww (`float`): The width of the surface
+            wh (`float`): The height of the surface
             width (`float`): The width of the curve
-            points (`list`): The control points of the curve, scaled to the surface.
-            pressures (`list`): The relative line width at each point as `float` values in 0..1
+            cache (`bool`): Whether to keep the outline of the scribble to draw it faster next time
+            geometry (`tuple`): The outline of the scribble if it is already computed, see :meth:`outline_geometry`
         """
-        if not points:
+        if not len(stroke):
             return
 
-        # Draw every stroke on a separate surface, then merge them all into the scribble cache
-        # Erasers do not have their own group as they are meant to interfere with strokes below
-        if color.alpha:
-            cairo_context.push_group()
-            cairo_context.set_operator(cairo.OPERATOR_SOURCE)
+        key = (ww, wh, width, len(stroke))
+        if key in stroke.outline:
+            cairo_context.append_path(stroke.outline[key])
         else:
-            # alpha == 0 -> Eraser mode
-            cairo_context.set_operator(cairo.OPERATOR_CLEAR)
-        cairo_context.set_source_rgba(*color)
+            if geometry is None:
+                radii = [width * pressure / 2 for pressure in stroke.get_pressures()]
+                geometry = self.outline_geometry(stroke.get_points(ww, wh), radii, 0, len(stroke) - 1)
+            self.append_outline(cairo_context, geometry)
+            if cache:
+                # Keep one outline per output, forgetting those of outdated sizes
+                if len(stroke.outline) >= self.max_outputs:
+                    stroke.outline.clear()
+                stroke.outline[key] = cairo_context.copy_path()
+
+        cairo_context.set_source_rgba(*stroke.color)
+        cairo_context.fill()
 
-        curves = self.points_to_curves(points)
-        curve_widths = [(a + b) / 2 for a, b in zip(pressures[:-1], pressures[1:])]
-        for curve, relwidth in zip(curves, curve_widths):
-            cairo_context.move_to(*curve[:2])
-            cairo_context.set_line_width(width * relwidth)
-            cairo_context.curve_to(*curve[2:])
-            cairo_context.stroke()
-
-        # Draw from last uneven-indexed point to last point
-        cairo_context.move_to(*points[-2 if len(points) % 2 and len(points) > 1 else -1])
-        cairo_context.set_line_width(width * (curve_widths[-1] if curve_widths else pressures[-1]))
-        cairo_context.line_to(*points[-1])
-        cairo_context.stroke()
 
-        if color.alpha:
-            cairo_context.pop_group_to_source()
-            cairo_context.paint()
+    def add_outline(self, cairo_context, points, radii, first=0, last=None):
+        """ Add the outline of (part of) a variable-width scribble to the current path of the cairo context.
+
+        Args:
+            cairo_context (:class:`~cairo.Context`): The canvas on which to render the drawings
+            points (`list`): The points of the scribble, scaled to the surface
+            radii (`list`): The half-width of the scribble at each point
+            first (`int`): The index of the first point of the part of the scribble to outline
+            last (`int`): The index of the last point of the part of the scribble to outline, or `None`
+        """
+        last = len(points) - 1 if last is None else min(last, len(points) - 1)
+        if last < first:
+            return
+
+        self.append_outline(cairo_context, self.outline_geometry(points, radii, first, last))
+
+
+    @classmethod
+    def outline_geometry(cls, points, radii, first, last):
+        """ Compute the outline of (part of) a variable-width scribble.
+
+        The outline is made of curves offset on each side of the scribble by the radius at each point, and of
+        circles making round caps and joins where the scribble turns sharply.
+
+        Args:
+            points (`list`): The points of the scribble, scaled to the surface
+            radii (`list`): The half-width of the scribble at each point
+            first (`int`): The index of the first point of the part of the scribble to outline
+            last (`int`): The index of the last point of the part of the scribble to outline
+
+        Returns:
+            `tuple`: the points and bezier curves of the left side, of the right side in reverse order,
+            and the (x, y, radius) of each circle, as expected by :meth:`append_outline`
+        """
+        # Normals, using neighbouring points (even outside of the outlined part) for continuity
+        left, right, circles = [], [], []
+        for index in range(first, last + 1):
+            (ax, ay), (x, y), (bx, by) = points[max(0, index - 1)], points[index], \
+                points[min(len(points) - 1, index + 1)]
+            dx, dy = bx - ax, by - ay
+            norm = math.hypot(dx, dy)
+            nx, ny = (-dy * radii[index] / norm, dx * radii[index] / norm) if norm else (0, 0)
+
+            left.append((x + nx, y + ny))
+            right.append((x - nx, y - ny))
+
+            if index == first or index == last or (x - ax) * (bx - x) + (y - ay) * (by - y) < 0:
+                circles.append((x, y, radii[index]))
+
+        right.reverse()
+        return (left, [curve[2:] for curve in cls.points_to_curves(left)],
+                right, [curve[2:] for curve in cls.points_to_curves(right)], circles)
+
+
+    @staticmethod
+    def batch_outline_geometry(strokes, ww, wh, widths):
+        """ Compute the outlines of full scribbles all at once, using numpy.
+
+        This computes the same geometry as :meth:`outline_geometry`, with array operations on the concatenated points
+        of all scribbles, each point's neighbours being clamped to its own scribble.
+
+        Args:
+            strokes (`list`): The :class:`~pympress.strokes.Stroke` to outline, none of them empty
+            ww (`float`): The width of the surface
+            wh (`float`): The height of the surface
+            widths (`list`): The width of each scribble on the surface
+
+        Returns:
+            `list`: the outline of each scribble, as expected by :meth:`append_outline`
+        """
+        lengths = numpy.array([len(stroke) for stroke in strokes])
+        ends = numpy.cumsum(lengths)
+        starts = ends - lengths
+
+        points = numpy.concatenate([numpy.frombuffer(stroke.points, dtype=numpy.float64) for stroke in strokes])
+        points = points.reshape(-1, 2) * (ww, wh)
+        radii = numpy.concatenate([numpy.frombuffer(stroke.pressures, dtype=numpy.uint8) * (width / 2 / 255)
+                                   for stroke, width in zip(strokes, widths)])
+
+        index = numpy.arange(len(points))
+        owner = numpy.repeat(numpy.arange(len(strokes)), lengths)
+        first, last = starts[owner], ends[owner] - 1
+
+        before, after = points[numpy.maximum(index - 1, first)], points[numpy.minimum(index + 1, last)]
+        delta = after - before
+        norm = numpy.hypot(delta[:, 0], delta[:, 1])
+        scale = numpy.divide(radii, norm, out=numpy.zeros_like(radii), where=norm > 0)
+        normals = numpy.stack((-delta[:, 1] * scale, delta[:, 0] * scale), axis=1)
+        left, right = points + normals, points - normals
+
+        sharp = ((points - before) * (after - points)).sum(axis=1) < 0
+        circles = numpy.column_stack((points, radii))[sharp | (index == first) | (index == last)]
+        circle_ends = numpy.cumsum(numpy.bincount(owner[sharp | (index == first) | (index == last)],
+                                                  minlength=len(strokes)))
+
+        # Segments from each point to the next of the same scribble, with the neighbours of their ends
+        seg = index[index != last]
+        seg_first, seg_last = first[seg], last[seg]
+        prev_seg, next_seg = numpy.maximum(seg - 1, seg_first), numpy.minimum(seg + 2, seg_last)
+
+        left_curves = numpy.hstack((left[seg] + (left[seg + 1] - left[prev_seg]) / 4,
+                                    left[seg + 1] + (left[seg] - left[next_seg]) / 4, left[seg + 1]))
+        # The right side goes backwards, from each point to the previous one
+        right_curves = numpy.hstack((right[seg + 1] + (right[seg] - right[next_seg]) / 4,
+                                     right[seg] + (right[seg + 1] - right[prev_seg]) / 4, right[seg]))
+
+        # Converting to lists once and slicing those is much faster than converting many small arrays
+        left, right, circles = left.tolist(), right.tolist(), circles.tolist()
+        left_curves, right_curves = left_curves.tolist(), right_curves.tolist()
+        starts, ends, circle_ends = starts.tolist(), ends.tolist(), [0] + circle_ends.tolist()
+
+        geometries = []
+        for num, (start, end) in enumerate(zip(starts, ends)):
+            seg_start, seg_end = start - num, end - num - 1
+            curved = end - start > 2
+            geometries.append((
+                left[start:end], left_curves[seg_start:seg_end] if curved else [],
+                right[start:end][::-1], right_curves[seg_start:seg_end][::-1] if curved else [],
+                circles[circle_ends[num]:circle_ends[num + 1]],
+            ))
+
+        return geometries
+
+
+    def outline_geometries(self, strokes, ww, wh, widths):
+        """ Compute the outlines of the scribbles that are not cached yet, batched with numpy if it is available.
+
+        Args:
+            strokes (`list`): The :class:`~pympress.strokes.Stroke` to outline
+            ww (`float`): The width of the surface
+            wh (`float`): The height of the surface
+            widths (`list`): The width of each scribble on the surface
+
+        Returns:
+            `list`: the outline of each scribble as expected by :meth:`append_outline`, or `None` if it is cached
+        """
+        todo = [num for num, (stroke, width) in enumerate(zip(strokes, widths))
+                if len(stroke) and (ww, wh, width, len(stroke)) not in stroke.outline]
+        geometries = [None] * len(strokes)
+
+        if numpy is not None and todo:
+            computed = self.batch_outline_geometry([strokes[num] for num in todo], ww, wh,
+                                                   [widths[num] for num in todo])
+        else:
+            computed = [self.outline_geometry(strokes[num].get_points(ww, wh),
+                                              [widths[num] * pressure / 2 for pressure in strokes[num].get_pressures()],
+                                              0, len(strokes[num]) - 1) for num in todo]
+
+        for num, geometry in zip(todo, computed):
+            geometries[num] = geometry
+
+        return geometries
+
+
+    def append_outline(self, cairo_context, geometry):
+        """ Add a computed outline to the current path of the cairo context.
+
+        All the parts of the outline have the same orientation, so that filling with the
+        :attr:`~cairo.FillRule.WINDING` rule draws their union.
+
+        Args:
+            cairo_context (:class:`~cairo.Context`): The canvas on which to render the drawings
+            geometry (`tuple`): The outline, as returned by :meth:`outline_geometry`
+        """
+        left, left_curves, right, right_curves, circles = geometry
+
+        if len(left) > 1:
+            cairo_context.move_to(*left[0])
+            for side, curves in [(left, left_curves), (right, right_curves)]:
+                cairo_context.line_to(*side[0])
+                if not curves:
+                    cairo_context.line_to(*side[-1])
+                for curve in curves:
+                    cairo_context.curve_to(*curve)
+            cairo_context.close_path()
+
+        # Outline goes clockwise, so the caps and joins do too
+        for x, y, radius in circles:
+            cairo_context.new_sub_path()
+            cairo_context.arc_negative(x, y, radius, 2 * math.pi, 0)
+
+
+    def reset_live_stroke(self):
+        """ Prepare an empty surface for the scribble that is being drawn.
+        """
+        self.live_rendered = 0
+        if self.scribble_cache is None:
+            self.live_surface = None
+            return
+
+        self.live_surface = TiledLayer(self.scribble_cache.get_width(), self.scribble_cache.get_height(),
+                                       self.scribble_cache.get_device_scale()[0])
+
+
+    def live_stroke_pieces(self):
+        """ Get the part of the scribble being drawn that is not yet rendered in :attr:`live_surface`.
+
+        Returns:
+            `tuple`: the points, radii, and index of the first point to draw, as expected by :meth:`add_outline`
+        """
+        stroke = self.scribble_list[-1]
+        scale = self.live_surface.get_device_scale()[0]
+        ww, wh = self.live_surface.get_width() / scale, self.live_surface.get_height() / scale
+
+        # Each curve depends on the point before its start, if any
+        start = max(0, self.live_rendered - 1)
+        points = stroke.get_points(ww, wh, start)
+        width = stroke.width * max(ww / 900, wh / 900)
+        radii = [width * pressure / 2 for pressure in stroke.get_pressures(start)]
+
+        return points, radii, self.live_rendered - start
+
+
+    def render_live_stroke(self, close=False):
+        """ Rasterize the curves of the scribble being drawn that will not change anymore into :attr:`live_surface`.
+
+        A curve is final once the point after its end is known. The scribble is drawn with the
+        :attr:`~cairo.Operator.SOURCE` operator, so that overlapping curves do not accumulate.
+
+        Args:
+            close (`bool`): Whether the scribble is finished, and all its curves should be rendered
+        """
+        if self.live_surface is None:
+            return
+
+        final = len(self.scribble_list[-1]) - 1 if close else len(self.scribble_list[-1]) - 2
+        if final <= self.live_rendered and not close:
+            return
+
+        points, radii, first = self.live_stroke_pieces()
+        # The slice of points starts just before the first curve to draw
+        last = None if close else final - (self.live_rendered - first)
+
+        end = len(points) if last is None else last + 1
+        if end <= first:
+            return
+
+        margin = max(radii[first:end]) + 1
+        xs, ys = [x for x, y in points[first:end]], [y for x, y in points[first:end]]
+        extents = (min(xs) - margin, min(ys) - margin, max(xs) + margin, max(ys) + margin)
+
+        color = self.scribble_list[-1].color
+        for cairo_context in self.live_surface.get_contexts(extents):
+            cairo_context.set_operator(cairo.OPERATOR_SOURCE)
+            cairo_context.set_source_rgba(*color)
+            self.add_outline(cairo_context, points, radii, first, last)
+            cairo_context.fill()
+
+        self.live_rendered = max(self.live_rendered, final)
+
+
+    def composite_live_stroke(self, cairo_context, tail=False):
+        """ Draw :attr:`live_surface` with the color of the scribble being drawn.
+
+        Args:
+            cairo_context (:class:`~cairo.Context`): The canvas on which to render the scribble, scaled as the cache
+            tail (`bool`): Whether to also draw the last curves, that are not yet in :attr:`live_surface`
+        """
+        color = self.scribble_list[-1].color
+
+        cairo_context.push_group()
+        cairo_context.set_operator(cairo.OPERATOR_SOURCE)
+        self.live_surface.paint(cairo_context)
+
+        if tail:
+            cairo_context.set_source_rgba(*color)
+            self.add_outline(cairo_context, *self.live_stroke_pieces())
+            cairo_context.fill()
+        cairo_context.pop_group_to_source()
+        cairo_context.paint()
+
+
+    def commit_live_stroke(self):
+        """ Finish rendering the scribble being drawn, and merge it into the scribble cache.
+        """
+        if self.live_surface is None or self.scribble_cache is None or \
+                self.next_render != len(self.scribble_list) - 1 or \
+                self.live_surface.get_width() != self.scribble_cache.get_width() or \
+                self.live_surface.get_height() != self.scribble_cache.get_height():
+            # Fall back to re-rendering the stroke from its points
+            return
+
+        self.render_live_stroke(close=True)
+
+        extents = self.live_surface.get_extents()
+        if extents is not None:
+            for cairo_context in self.scribble_cache.get_contexts(extents):
+                self.composite_live_stroke(cairo_context)
+
+        self.next_render = len(self.scribble_list)
+        self.live_surface = None
+        self.save_checkpoint(self.scribble_cache, self.next_render)
 
 
     def draw_scribble(self, widget, cairo_context):
@@ -511,27 +1406,25 @@ class Scribbler(builder.Builder):
         """
         scale = widget.get_window().get_scale_factor()
         ww, wh = widget.get_allocated_width(), widget.get_allocated_height()
-        cw, ch = self.scribble_cache.get_width(), self.scribble_cache.get_height()
-
-        cairo_context.push_group()
+        layer = self.get_output_layer(widget)
 
+        # Layers are at the widget's resolution, except the content layer while it is being resized
         cairo_context.save()
-
-        cairo_context.scale(ww * scale / cw, wh * scale / ch)
-        cairo_context.set_source_surface(self.scribble_cache)
-        cairo_context.paint()
-
+        if (layer.get_width(), layer.get_height()) != (ww * scale, wh * scale):
+            cairo_context.scale(ww * scale / layer.get_width(), wh * scale / layer.get_height())
+        layer.paint(cairo_context)
         cairo_context.restore()
 
         pen_scale_factor = max(ww / 900, wh / 900)  # or sqrt of product
-        if self.scribble_drawing:
-            cairo_context.set_line_cap(cairo.LINE_CAP_ROUND)
-            color, width, points, pressure = self.scribble_list[-1]
-            self.render_scribble(cairo_context, color, width * pen_scale_factor, [(x * ww, y * wh) for x, y in points],
-                                 pressure)
-
-        cairo_context.pop_group_to_source()
-        cairo_context.paint()
+        if self.scribble_drawing and self.live_surface is not None:
+            cairo_context.save()
+            lw, lh = self.live_surface.get_width(), self.live_surface.get_height()
+            cairo_context.scale(ww * scale / lw, wh * scale / lh)
+            self.composite_live_stroke(cairo_context, tail=True)
+            cairo_context.restore()
+        elif self.scribble_drawing:
+            stroke = self.scribble_list[-1]
+            self.render_scribble(cairo_context, stroke, ww, wh, stroke.width * pen_scale_factor, cache=False)
 
 
         if widget.get_name() == 'scribble_p_da' and self.mouse_pos is not None:
@@ -583,10 +1476,148 @@ class Scribbler(builder.Builder):
         self.config.set('highlight', 'width_{}'.format(pen), str(self.scribble_width))
 
 
+    def erase(self, start, end):
+        """ Remove the parts of scribbles touched by the eraser moving between two points.
+
+        Args:
+            start (`tuple`): The previous position of the eraser, in slide coordinates
+            end (`tuple`): The current position of the eraser, in slide coordinates
+        """
+        ww, wh = self.c_da.get_allocated_width(), self.c_da.get_allocated_height()
+        if not ww or not wh:
+            return
+
+        pen_scale_factor = max(ww / 900, wh / 900)
+        radius = self.scribble_width * pen_scale_factor / 2
+        (ax, ay), (bx, by) = (start[0] * ww, start[1] * wh), (end[0] * ww, end[1] * wh)
+        dx, dy = bx - ax, by - ay
+        norm = dx * dx + dy * dy
+
+        extents = (min(ax, bx) - radius) / ww, (min(ay, by) - radius) / wh, \
+                  (max(ax, bx) + radius) / ww, (max(ay, by) + radius) / wh
+        positions = {stroke: index for index, stroke in enumerate(self.scribble_list)}
+        erased = []
+
+        # Distance from a point to the segment AB travelled by the eraser
+        def distance(x, y):
+            t = max(0, min(1, ((x - ax) * dx + (y - ay) * dy) / norm)) if norm else 0
+            return math.hypot(x - ax - t * dx, y - ay - t * dy)
+
+        # Distance between the segments AB and PQ: 0 if they cross, otherwise the smallest end point to segment distance
+        def segments_distance(px, py, qx, qy):
+            ux, uy = qx - px, qy - py
+            if (dx * (py - ay) - dy * (px - ax)) * (dx * (qy - ay) - dy * (qx - ax)) < 0 and \
+                    (ux * (ay - py) - uy * (ax - px)) * (ux * (by - py) - uy * (bx - px)) < 0:
+                return 0
+
+            dists = [distance(px, py), distance(qx, qy)]
+            length = ux * ux + uy * uy
+            for ex, ey in ((ax, ay), (bx, by)):
+                t = max(0, min(1, ((ex - px) * ux + (ey - py) * uy) / length)) if length else 0
+                dists.append(math.hypot(ex - px - t * ux, ey - py - t * uy))
+            return min(dists)
+
+        for stroke in self.stroke_index.query(extents):
+            if stroke not in positions:
+                continue
+
+            points, pressures = stroke.get_points(ww, wh), stroke.get_pressures()
+            half_width = stroke.width * pen_scale_factor / 2
+
+            if len(points) == 1:
+                (x, y), pressure = points[0], pressures[0]
+                if distance(x, y) > radius + half_width * pressure:
+                    continue
+                spans = None
+            else:
+                spans = []
+                for (px, py), (qx, qy), pp, pq in zip(points, points[1:], pressures, pressures[1:]):
+                    if segments_distance(px, py, qx, qy) > radius + half_width * max(pp, pq):
+                        spans.append(None)
+                        continue
+
+                    # How far inside the eraser the stroke is at t along PQ: a convex function, so the erased part
+                    # of PQ is an interval around its minimum, found by ternary search, with bounds found by bisection.
+                    def overlap(t):
+                        return distance(px + t * (qx - px), py + t * (qy - py)) - radius - \
+                            half_width * (pp + t * (pq - pp))
+
+                    lo, hi = 0, 1
+                    for step in range(40):
+                        m1, m2 = lo + (hi - lo) / 3, hi - (hi - lo) / 3
+                        lo, hi = (lo, m2) if overlap(m1) < overlap(m2) else (m1, hi)
+
+                    middle = (lo + hi) / 2
+                    if overlap(middle) > 0:
+                        spans.append(None)
+                        continue
+
+                    bounds = []
+                    for inside, outside in ((middle, 0), (middle, 1)):
+                        if overlap(outside) <= 0:
+                            bounds.append(outside)
+                            continue
+                        for step in range(30):
+                            half = (inside + outside) / 2
+                            inside, outside = (half, outside) if overlap(half) <= 0 else (inside, half)
+                        bounds.append(inside)
+
+                    spans.append(tuple(bounds))
+
+                if not any(spans):
+                    continue
+
+            pieces = [] if spans is None else stroke.cut(spans)
+            index = positions[stroke]
+            self.scribble_list[index] = pieces
+            self.stroke_index.remove(stroke)
+            for piece in pieces:
+                self.stroke_index.add(piece)
+
+            erased.append(stroke)
+
+        if not erased:
+            return
+
+        # Checkpoints after the first erased scribble are outdated. Then flatten the split scribbles into the list.
+        first_change = min(positions[stroke] for stroke in erased)
+        self.drop_checkpoints(erased + [item for item in self.scribble_list[first_change:] if isinstance(item, Stroke)])
+        self.scribble_list[first_change:] = [piece for item in self.scribble_list[first_change:]
+                                             for piece in (item if isinstance(item, list) else [item])]
+        self.scribble_redo_list.clear()
+
+        self.reset_scribble_cache()
+        self.prerender()
+        self.adjust_buttons()
+
+
+    def undo_erasure(self):
+        """ Get the erasure that can be undone, if the scribbles have not changed since.
+
+        Returns:
+            `tuple`: the lists of scribbles before and after the erasure, or `None`
+        """
+        if self.scribble_erasures and self.scribble_erasures[-1][1] == self.scribble_list:
+            return self.scribble_erasures[-1]
+        else:
+            return None
+
+
+    def replace_scribbles(self, scribbles):
+        """ Replace all the scribbles of the current page, e.g. to undo or redo an erasure.
+
+        Args:
+            scribbles (`list`): The new :class:`~pympress.strokes.Stroke` list
+        """
+        self.drop_checkpoints(self.scribble_list)
+        self.scribble_list[:] = scribbles
+        self.stroke_index = StrokeIndex(self.scribble_list)
+
+
     def adjust_buttons(self):
         """ Properly enable and disable buttons based on scribblings lists.
         """
-        self.scribble_undo.set_sensitive(bool(self.scribble_list))
+        self.scribble_undo.set_sensitive(bool(self.scribble_list) or self.undo_erasure() is not None)
         self.scribble_clear.set_sensitive(bool(self.scribble_list))
         self.scribble_redo.set_sensitive(bool(self.scribble_redo_list))
 
@@ -594,7 +1625,11 @@ class Scribbler(builder.Builder):
     def clear_scribble(self, *args):
         """ Callback for the scribble clear button, to remove all scribbles.
         """
+        self.drop_checkpoints(self.scribble_list)
         self.scribble_list.clear()
+        self.scribble_erasures.clear()
+        self.stroke_index = StrokeIndex()
+        self.persist_scribbles()
 
         self.reset_scribble_cache()
         self.redraw_current_slide()
@@ -627,7 +1662,11 @@ class Scribbler(builder.Builder):
             if current_page is not None and self.scribble_list:
                 self.remembered_scribbles[current_page] = self.scribble_list.copy()
 
-            self.scribble_list = self.remembered_scribbles.pop(new_page, [])
+            self.scribble_list = self.remembered_scribbles.pop(new_page, None)
+            if self.scribble_list is None:
+                self.scribble_list = self.load_scribbles(new_page)
+            self.scribble_erasures.clear()
+            self.stroke_index = StrokeIndex(self.scribble_list)
 
             self.reset_scribble_cache()
             self.adjust_buttons()
@@ -636,11 +1675,18 @@ class Scribbler(builder.Builder):
 
 
     def pop_scribble(self, *args):
-        """ Callback for the scribble undo button, to undo the last scribble.
+        """ Callback for the scribble undo button, to undo the last scribble or erasure.
         """
-        if self.scribble_list:
+        erasure = self.undo_erasure()
+        if erasure is not None:
+            self.scribble_redo_list.append(self.scribble_erasures.pop())
+            self.replace_scribbles(erasure[0])
+        elif self.scribble_list:
             self.scribble_redo_list.append(self.scribble_list.pop())
+            self.drop_checkpoints(self.scribble_redo_list[-1:])
+            self.stroke_index.remove(self.scribble_redo_list[-1])
 
+        self.persist_scribbles()
         self.adjust_buttons()
         self.reset_scribble_cache()
         self.prerender()
@@ -648,10 +1694,19 @@ class Scribbler(builder.Builder):
 
 
     def redo_scribble(self, *args):
-        """ Callback for the scribble undo button, to undo the last scribble.
+        """ Callback for the scribble redo button, to redo the last undone scribble or erasure.
         """
-        if self.scribble_redo_list:
+        if self.scribble_redo_list and isinstance(self.scribble_redo_list[-1], tuple):
+            before, after = self.scribble_redo_list.pop()
+            if before == self.scribble_list:
+                self.scribble_erasures.append((before, after))
+                self.replace_scribbles(after)
+                self.reset_scribble_cache()
+                self.persist_scribbles()
+        elif self.scribble_redo_list:
             self.scribble_list.append(self.scribble_redo_list.pop())
+            self.stroke_index.add(self.scribble_list[-1])
+            self.persist_scribbles(self.scribble_list[-1])
 
         self.adjust_buttons()
         self.prerender()
@@ -669,7 +1724,7 @@ class Scribbler(builder.Builder):
         if not event.send_event:
             return
 
-        self.resize_cache(widget.get_name(), event.width, event.height)
+        self.resize_cache(widget.get_name(), event.width, event.height, widget.get_scale_factor())
 
 
     def set_tools_orientation(self, gaction, target):
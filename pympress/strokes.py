@@ -0,0 +1,529 @@
+# -*- coding: utf-8 -*-
+#
+#       strokes.py
+#
+#       Copyright 2017 Cimbali <me@cimba.li>
+#
+#       This program is free software; you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation; either version 2 of the License, or
+#       (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with this program; if not, write to the Free Software
+#       Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#       MA 02110-1301, USA.
+"""
+:mod:`pympress.strokes` -- Store and index the scribbles drawn on slides, independently of the display
+------------------------------------------------------------------------------------------------------
+"""
+
+import logging
+logger = logging.getLogger(__name__)
+
+import os
+import sys
+import array
+import struct
+import collections
+
+
+class Stroke(object):
+    """ A single scribble, storing its points and pressures compactly.
+
+    Points are stored in slide coordinates (i.e. between 0 and 1), interleaved in a flat array of floats,
+    and pressures are quantized to a byte per point.
+
+    Args:
+        color (:class:`~Gdk.RGBA` or `tuple`): The red, green, blue and alpha components of the color of the stroke
+        width (`float`): The width of the stroke
+    """
+    #: :class:`~Gdk.RGBA` or `tuple` of the `float` red, green, blue and alpha components of the color of the stroke
+    color = None
+    #: `float` width of the stroke
+    width = 1
+    #: :class:`~array.array` of `float` with interleaved x and y coordinates of the points of the stroke
+    points = None
+    #: :class:`~array.array` of the pressure at each point, quantized as an `int` from 0 to 255
+    pressures = None
+    #: `dict` mapping the parameters for which the outline was computed to the :class:`~cairo.Path` of the outline
+    outline = {}
+
+    def __init__(self, color, width):
+        self.color = color
+        self.width = width
+        self.points = array.array('d')
+        self.pressures = array.array('B')
+        self.outline = {}
+
+
+    def __len__(self):
+        return len(self.pressures)
+
+
+    def append(self, x, y, pressure):
+        """ Add a point to the stroke.
+
+        Args:
+            x (`float`): The horizontal position of the point, in slide coordinates
+            y (`float`): The vertical position of the point, in slide coordinates
+            pressure (`float`): The relative pressure at that point, between 0 and 1
+        """
+        self.points.extend((x, y))
+        self.pressures.append(max(0, min(255, round(pressure * 255))))
+
+
+    def get_points(self, ww, wh, start=0):
+        """ Get the points of the stroke, scaled to a surface.
+
+        Args:
+            ww (`float`): The width of the surface
+            wh (`float`): The height of the surface
+            start (`int`): The index of the first point to return
+
+        Returns:
+            `list`: the points of the stroke, as `tuple` of `float`
+        """
+        return list(zip((x * ww for x in self.points[2 * start::2]), (y * wh for y in self.points[2 * start + 1::2])))
+
+
+    def get_pressures(self, start=0):
+        """ Get the pressures of the stroke.
+
+        Args:
+            start (`int`): The index of the first point to return
+
+        Returns:
+            `list`: the relative pressure at each point, as `float` values in 0..1
+        """
+        return [p / 255 for p in self.pressures[start:]]
+
+
+    def simplify(self, ww, wh, tolerance=.5):
+        """ Remove the points that do not noticeably change the stroke, using the Ramer–Douglas–Peucker algorithm.
+
+        Pressure is taken into account as a third dimension, scaled to the change of the stroke outline it implies.
+
+        Args:
+            ww (`float`): The width in pixels of the surface on which the stroke is drawn
+            wh (`float`): The height in pixels of the surface on which the stroke is drawn
+            tolerance (`float`): The maximum deviation from the original stroke, in pixels
+        """
+        if len(self) <= 2:
+            return
+
+        pw = self.width * max(ww / 900, wh / 900) / 2 / 255
+        coords = [(x * ww, y * wh, p * pw) for x, y, p in zip(self.points[0::2], self.points[1::2], self.pressures)]
+        keep = [False] * len(coords)
+        keep[0] = keep[-1] = True
+
+        stack = [(0, len(coords) - 1)]
+        while stack:
+            first, last = stack.pop()
+            (ax, ay, ap), (bx, by, bp) = coords[first], coords[last]
+            dx, dy, dp = bx - ax, by - ay, bp - ap
+            norm = dx * dx + dy * dy + dp * dp
+
+            farthest, max_dist = None, tolerance * tolerance
+            for index in range(first + 1, last):
+                cx, cy, cp = coords[index]
+                t = max(0, min(1, ((cx - ax) * dx + (cy - ay) * dy + (cp - ap) * dp) / norm)) if norm else 0
+                ex, ey, ep = cx - ax - t * dx, cy - ay - t * dy, cp - ap - t * dp
+                dist = ex * ex + ey * ey + ep * ep
+                if dist > max_dist:
+                    farthest, max_dist = index, dist
+
+            if farthest is not None:
+                keep[farthest] = True
+                stack.extend(((first, farthest), (farthest, last)))
+
+        self.points = array.array('d', (c for point, k in zip(zip(self.points[0::2], self.points[1::2]), keep)
+                                        if k for c in point))
+        self.pressures = array.array('B', (p for p, k in zip(self.pressures, keep) if k))
+        self.outline = {}
+
+
+    def cut(self, spans):
+        """ Split the stroke into the parts that are not within the given spans of its segments.
+
+        Args:
+            spans (`list`): For each segment of the stroke, between consecutive points, `None` or the `tuple` of the
+                            start and end of the span to remove, as fractions of the segment between 0 and 1
+
+        Returns:
+            `list`: the new :class:`~pympress.strokes.Stroke`, one per remaining part of the stroke
+        """
+        pieces = []
+        current = None
+
+        def interpolate(index, t):
+            if t <= 0:
+                return self.points[2 * index], self.points[2 * index + 1], self.pressures[index]
+            elif t >= 1:
+                return self.points[2 * index + 2], self.points[2 * index + 3], self.pressures[index + 1]
+
+            x0, y0, x1, y1 = self.points[2 * index:2 * index + 4]
+            p0, p1 = self.pressures[index:index + 2]
+            return x0 + t * (x1 - x0), y0 + t * (y1 - y0), round(p0 + t * (p1 - p0))
+
+        for index, span in enumerate(spans):
+            parts = [(0, 1)] if span is None else [(0, span[0]), (span[1], 1)]
+            for start, end in parts:
+                if end - start <= 1e-6:
+                    continue
+                elif start > 0 or current is None:
+                    current = Stroke(self.color, self.width)
+                    pieces.append(current)
+                    x, y, pressure = interpolate(index, start)
+                    current.points.extend((x, y))
+                    current.pressures.append(pressure)
+
+                x, y, pressure = interpolate(index, end)
+                current.points.extend((x, y))
+                current.pressures.append(pressure)
+
+                if end < 1:
+                    current = None
+
+            if span is not None and span[1] >= 1:
+                current = None
+
+        return pieces
+
+
+    def get_extents(self, ww, wh, margin=0):
+        """ Get the bounding box of the stroke, scaled to a surface.
+
+        Args:
+            ww (`float`): The width of the surface
+            wh (`float`): The height of the surface
+            margin (`float`): The distance to add around the points, e.g. the half-width of the stroke
+
+        Returns:
+            `tuple`: the left, top, right and bottom coordinates of the bounding box
+        """
+        if not len(self):
+            return (0, 0, 0, 0)
+
+        xs, ys = self.points[0::2], self.points[1::2]
+        return (min(xs) * ww - margin, min(ys) * wh - margin, max(xs) * ww + margin, max(ys) * wh + margin)
+
+
+
+class StrokeIndex(object):
+    """ A spatial index of strokes, as a uniform grid over the slide of the cells overlapped by their bounding boxes.
+
+    Args:
+        strokes (`list`): The initial :class:`~pympress.strokes.Stroke` to index
+    """
+    #: `int` number of cells along each side of the slide
+    grid_size = 16
+    #: `dict` mapping the (column, row) of each cell to the `set` of strokes overlapping it
+    cells = {}
+
+    def __init__(self, strokes=[]):
+        self.cells = collections.defaultdict(set)
+        for stroke in strokes:
+            self.add(stroke)
+
+
+    def _cells(self, extents):
+        """ Get the cells overlapped by a region.
+
+        Args:
+            extents (`tuple`): The left, top, right and bottom coordinates of the region, in slide coordinates
+
+        Returns:
+            `list`: the (column, row) of each cell
+        """
+        x0, y0, x1, y1 = (max(0, min(self.grid_size - 1, int(c * self.grid_size))) for c in extents)
+        return [(col, row) for col in range(x0, x1 + 1) for row in range(y0, y1 + 1)]
+
+
+    def _stroke_cells(self, stroke):
+        """ Get the cells overlapped by a stroke, with a generous margin for its width.
+
+        Args:
+            stroke (:class:`~pympress.strokes.Stroke`): The stroke
+
+        Returns:
+            `list`: the (column, row) of each cell
+        """
+        # The width is relative to the largest side of the slide, which is at most twice the other
+        return self._cells(stroke.get_extents(1, 1, stroke.width / 900))
+
+
+    def add(self, stroke):
+        """ Add a stroke to the index.
+
+        Args:
+            stroke (:class:`~pympress.strokes.Stroke`): The stroke to add
+        """
+        for cell in self._stroke_cells(stroke):
+            self.cells[cell].add(stroke)
+
+
+    def remove(self, stroke):
+        """ Remove a stroke from the index.
+
+        Args:
+            stroke (:class:`~pympress.strokes.Stroke`): The stroke to remove
+        """
+        for cell in self._stroke_cells(stroke):
+            self.cells[cell].discard(stroke)
+
+
+    def query(self, extents):
+        """ Get the strokes that might overlap a region.
+
+        Args:
+            extents (`tuple`): The left, top, right and bottom coordinates of the region, in slide coordinates
+
+        Returns:
+            `set`: the :class:`~pympress.strokes.Stroke` in the cells overlapped by the region
+        """
+        return set().union(*(self.cells.get(cell, ()) for cell in self._cells(extents)))
+
+
+
+class ScribbleStore(object):
+    """ An append-only file of the scribbles drawn on a document, indexed when opened and decoded lazily per page.
+
+    The file is a sequence of records, each made of a header (record type, length of the key and of the payload),
+    the key as utf-8 and the payload. A :attr:`SET` record replaces all the scribbles of a key, an :attr:`ADD` record
+    appends a single scribble to them. Each scribble is stored as its color, width and number of points, followed by
+    the points as 32-bit floats and the pressures as bytes.
+
+    Args:
+        path (:class:`~pathlib.Path`): The path to the file
+    """
+    #: `bytes` at the start of the file, identifying its format
+    magic = b'PYMPSCR\x01'
+    #: :class:`~struct.Struct` for the header of each record: type, key length, payload length
+    record_header = struct.Struct('<BHI')
+    #: :class:`~struct.Struct` for the header of each scribble: color, width, number of points
+    stroke_header = struct.Struct('<4ffI')
+    #: `int` record type replacing all scribbles of a key
+    SET = 1
+    #: `int` record type adding a scribble to a key
+    ADD = 2
+    #: `int` minimum size in bytes of outdated records before the file is compacted
+    compact_threshold = 1 << 20
+
+    #: :class:`~pathlib.Path` to the file
+    path = None
+    #: `dict` mapping each key to the `list` of (offset, length) of the payloads of its current records
+    index = {}
+    #: `int` size of the file up to the last complete record
+    size = 0
+
+    def __init__(self, path):
+        self.path = path
+        self.index = {}
+        self.size = 0
+
+        try:
+            self.scan()
+        except OSError:
+            logger.warning('Failed reading stored scribbles from {}'.format(self.path), exc_info=True)
+            self.index.clear()
+            self.size = 0
+
+
+    def scan(self):
+        """ Index the records of the file, without decoding their payloads.
+        """
+        if not self.path.exists():
+            return
+
+        with open(self.path, 'rb') as f:
+            if f.read(len(self.magic)) != self.magic:
+                logger.warning('Ignoring scribbles file {} in an unknown format'.format(self.path))
+                return
+
+            offset = len(self.magic)
+            while True:
+                header = f.read(self.record_header.size)
+                if len(header) < self.record_header.size:
+                    break
+
+                record_type, key_length, length = self.record_header.unpack(header)
+                key = f.read(key_length)
+                payload_offset = offset + self.record_header.size + key_length
+                f.seek(length, os.SEEK_CUR)
+
+                # A record truncated by a crash ends the usable part of the file
+                if len(key) < key_length or f.tell() > os.fstat(f.fileno()).st_size:
+                    break
+
+                key = key.decode('utf-8')
+                if record_type == self.SET:
+                    self.index[key] = [(payload_offset, length)]
+                elif record_type == self.ADD:
+                    self.index.setdefault(key, []).append((payload_offset, length))
+
+                offset = payload_offset + length
+
+            self.size = offset
+
+        live = sum(length for records in self.index.values() for _, length in records)
+        if self.size - live > max(live, self.compact_threshold):
+            self.compact()
+
+
+    def compact(self):
+        """ Rewrite the file with a single record per key.
+        """
+        scribbles = {key: self.load(key) for key in self.index}
+
+        temp_path = self.path.with_suffix('.tmp')
+        with open(temp_path, 'wb') as f:
+            f.write(self.magic)
+        self.path, path = temp_path, self.path
+        self.index.clear()
+        self.size = len(self.magic)
+
+        for key, strokes in scribbles.items():
+            self.replace(key, strokes)
+
+        temp_path.replace(path)
+        self.path = path
+
+
+    def keys(self):
+        """ Get the keys for which scribbles are stored.
+
+        Returns:
+            `list`: the `str` keys
+        """
+        return [key for key, records in self.index.items() if records]
+
+
+    def load(self, key):
+        """ Read the scribbles stored for a key.
+
+        Args:
+            key (`str`): The key, identifying e.g. a page
+
+        Returns:
+            `list`: the stored :class:`~pympress.strokes.Stroke`, empty if there are none
+        """
+        strokes = []
+        try:
+            with open(self.path, 'rb') as f:
+                for offset, length in self.index.get(key, []):
+                    f.seek(offset)
+                    strokes.extend(self.decode(f.read(length)))
+        except (OSError, struct.error):
+            logger.warning('Failed reading stored scribbles for {} from {}'.format(key, self.path), exc_info=True)
+
+        return strokes
+
+
+    def add(self, key, stroke):
+        """ Store a scribble in addition to those already stored for a key.
+
+        Args:
+            key (`str`): The key, identifying e.g. a page
+            stroke (:class:`~pympress.strokes.Stroke`): The new scribble
+        """
+        self.write(self.ADD, key, self.encode([stroke]))
+
+
+    def replace(self, key, strokes):
+        """ Store the scribbles of a key, instead of those previously stored.
+
+        Args:
+            key (`str`): The key, identifying e.g. a page
+            strokes (`list`): The :class:`~pympress.strokes.Stroke` to store
+        """
+        self.write(self.SET, key, self.encode(strokes))
+
+
+    def write(self, record_type, key, payload):
+        """ Append a record to the file.
+
+        Args:
+            record_type (`int`): The type of record, :attr:`SET` or :attr:`ADD`
+            key (`str`): The key, identifying e.g. a page
+            payload (`bytes`): The encoded scribbles
+        """
+        key_bytes = key.encode('utf-8')
+        try:
+            with open(self.path, 'r+b' if self.size else 'wb') as f:
+                if not self.size:
+                    f.write(self.magic)
+                    self.size = len(self.magic)
+
+                # Overwrite anything after the last complete record
+                f.seek(self.size)
+                f.truncate()
+                f.write(self.record_header.pack(record_type, len(key_bytes), len(payload)) + key_bytes + payload)
+        except OSError:
+            logger.warning('Failed storing scribbles to {}'.format(self.path), exc_info=True)
+            return
+
+        offset = self.size + self.record_header.size + len(key_bytes)
+        if record_type == self.SET:
+            self.index[key] = [(offset, len(payload))]
+        else:
+            self.index.setdefault(key, []).append((offset, len(payload)))
+        self.size = offset + len(payload)
+
+
+    @classmethod
+    def encode(cls, strokes):
+        """ Serialize scribbles.
+
+        Args:
+            strokes (`list`): The :class:`~pympress.strokes.Stroke` to serialize
+
+        Returns:
+            `bytes`: the serialized scribbles
+        """
+        data = []
+        for stroke in strokes:
+            points = array.array('f', stroke.points)
+            if sys.byteorder != 'little':
+                points.byteswap()
+
+            data.extend((cls.stroke_header.pack(*stroke.color, stroke.width, len(stroke)),
+                         points.tobytes(), stroke.pressures.tobytes()))
+
+        return b''.join(data)
+
+
+    @classmethod
+    def decode(cls, data):
+        """ Deserialize scribbles.
+
+        Args:
+            data (`bytes`): The serialized scribbles
+
+        Returns:
+            `list`: the :class:`~pympress.strokes.Stroke` deserialized
+        """
+        strokes = []
+        offset = 0
+        while offset < len(data):
+            *color, width, count = cls.stroke_header.unpack_from(data, offset)
+            offset += cls.stroke_header.size
+
+            points = array.array('f', data[offset:offset + 8 * count])
+            if sys.byteorder != 'little':
+                points.byteswap()
+            offset += 8 * count
+
+            stroke = Stroke(tuple(color), width)
+            stroke.points = array.array('d', points)
+            stroke.pressures = array.array('B', data[offset:offset + count])
+            offset += count
+
+            strokes.append(stroke)
+
+        return strokes
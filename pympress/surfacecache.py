@@ -35,6 +35,7 @@ scheduled on the main thread at idle times using GLib.idle_add().
 import logging
 logger = logging.getLogger(__name__)
 
+import math
 import threading
 import functools
 import collections
@@ -44,6 +45,90 @@ import cairo
 gi.require_version('Gtk', '3.0')
 from gi.repository import GLib
 
+try:
+    gi.require_version('GdkX11', '3.0')
+    from gi.repository import GdkX11
+except (ImportError, ValueError):
+    GdkX11 = None
+
+
+class SurfaceAtlas(object):
+    """ Surfaces of identical sizes, e.g. thumbnails, packed as tiles into a few large surfaces.
+
+    Tiles are handed out as sub-surfaces, so that they can be drawn into and painted like any other surface,
+    while the memory is allocated (and released) a whole sheet at a time.
+
+    Args:
+        width (`int`):  width of each tile
+        height (`int`):  height of each tile
+        scale (`int`):  scale factor of the surfaces
+    """
+    #: `int` maximum width or height of a sheet, in device pixels
+    max_sheet_size = 4096
+    #: `int` maximum number of tiles in each row and column of a sheet, to avoid large unused sheets for small decks
+    max_sheet_tiles = 8
+
+    #: `list` of the :class:`~cairo.ImageSurface` sheets in which the tiles are packed
+    sheets = []
+    #: `tuple` of the size of each tile
+    tile_size = (0, 0)
+    #: `int` scale factor of the sheets
+    scale = 1
+    #: `tuple` of the number of columns and rows of tiles in a sheet
+    grid = (1, 1)
+    #: `list` of the unused tiles, as `(sheet index, x, y)` tuples
+    free = []
+    #: `dict` mapping each allocated tile surface to its position, as a `(sheet index, x, y)` tuple
+    used = {}
+
+    def __init__(self, width, height, scale):
+        self.tile_size = (width, height)
+        self.scale = scale
+        self.grid = (max(1, min(self.max_sheet_tiles, self.max_sheet_size // (width * scale))),
+                     max(1, min(self.max_sheet_tiles, self.max_sheet_size // (height * scale))))
+        self.sheets = []
+        self.free = []
+        self.used = {}
+
+
+    def _add_sheet(self):
+        """ Allocate a new sheet and add its tiles to the free ones.
+        """
+        (tw, th), (cols, rows) = self.tile_size, self.grid
+        sheet = cairo.ImageSurface(cairo.Format.RGB24, cols * tw * self.scale, rows * th * self.scale)
+        sheet.set_device_scale(self.scale, self.scale)
+
+        num = len(self.sheets)
+        self.sheets.append(sheet)
+        self.free.extend((num, col * tw, row * th) for row in reversed(range(rows)) for col in reversed(range(cols)))
+
+
+    def allocate(self):
+        """ Get an unused tile.
+
+        Returns:
+            :class:`~cairo.Surface`: a sub-surface of one of the sheets, of the size of a tile
+        """
+        if not self.free:
+            self._add_sheet()
+
+        num, x, y = slot = self.free.pop()
+        tile = self.sheets[num].create_for_rectangle(x, y, *self.tile_size)
+        self.used[tile] = slot
+        return tile
+
+
+    def release(self, tile):
+        """ Return a tile that is no longer used.
+
+        Args:
+            tile (:class:`~cairo.Surface`):  a tile obtained from :meth:`allocate`
+        """
+        slot = self.used.pop(tile, None)
+        if slot is not None:
+            self.free.append(slot)
+
+
 
 class SurfaceCache(object):
     """ Pages caching and prerendering made (almost) easy.
@@ -53,21 +138,29 @@ class SurfaceCache(object):
         max_pages (`int`): The maximum page number.
     """
 
-    #: The actual cache. The `dict`s keys are widget names and its values are
-    #: :class:`~collections.OrderedDict`, whose keys are page numbers
-    #: and values are instances of :class:`~cairo.ImageSurface`.
+    #: The actual cache. The `dict`s keys are widget names and its values are `dict`s, whose keys are
+    #: `(document type, scale factor)` tuples and values are :class:`~collections.OrderedDict`,
+    #: whose keys are page numbers and values are instances of :class:`~cairo.ImageSurface`.
     #: In each :class:`~collections.OrderedDict` keys are ordered by
     #: Least Recently Used (get or set), when the size is beyond
-    #: :attr:`max_pages`, pages are popped from the start of the cache.
+    #: :attr:`max_pages`, pages are popped from the start of the cache,
+    #: starting with the document types and scale factors that are not currently in use.
     surface_cache = {}
 
     #: `dict` containing functions that return a :class:`~cairo.Surface` given a :class:`~cairo.Format`,
     #: width `int` and height `int`, see :meth:`~Gtk.Window.create_similar_image_surface`
     surface_factory = {}
 
-    #: Size of the different managed widgets, as a `dict` of tuples
+    #: Size of the different managed widgets, as a `dict` of `dict`s mapping the same keys as in
+    #: :attr:`surface_cache` to tuples
     surface_size = {}
 
+    #: Last size given to each managed widget by :meth:`resize_widget`, as a `dict` of tuples, whichever bucket is used
+    widget_size = {}
+
+    #: Current scale factor of the different managed widgets, as a `dict` of `int`
+    surface_scale = {}
+
     #: Type of document handled by each widget. It is a `dict`: its keys are
     #: widget names and its values are document types from ui.
     surface_type = {}
@@ -79,6 +172,10 @@ class SurfaceCache(object):
     #: Set of widgets for which we ignore the max
     unlimited = set()
 
+    #: `dict` whose keys are names of widgets whose pages are packed in atlases and values are `dict`s,
+    #: mapping the same keys as in :attr:`surface_cache` to :class:`~pympress.surfacecache.SurfaceAtlas`.
+    atlases = {}
+
     #: The current :class:`~pympress.document.Document`.
     doc = None
 
@@ -88,16 +185,68 @@ class SurfaceCache(object):
     #: Set of active widgets
     active_widgets = set()
 
+    #: `dict` whose keys are widget names and values are `list`s of functions, called with the widget name
+    #: and page number whenever a page is rendered in the cache for that widget
+    subscribers = {}
+
     #: maximum number of pages we keep in cache
     max_pages = 200
 
+    #: Full pages rasterized once and shared by all widgets displaying a part of the same page, as an
+    #: :class:`~collections.OrderedDict` whose keys are page numbers and values are tuples of a resolution
+    #: (in device pixels per point) and a :class:`~cairo.ImageSurface`. Only used in split notes modes.
+    page_rasters = collections.OrderedDict()
+
+    #: maximum number of full page rasters we keep in :attr:`page_rasters`
+    max_rasters = 2
+
+    #: :class:`~threading.Lock` used to manage conccurent accesses to :attr:`page_rasters` and :attr:`lens_rasters`.
+    raster_lock = None
+
+    #: Full pages rasterized at a high resolution, from which the magnifier lens samples at every position. An
+    #: :class:`~collections.OrderedDict` whose keys are page numbers and values are tuples of a resolution
+    #: (in device pixels per point) and a :class:`~cairo.ImageSurface`.
+    lens_rasters = collections.OrderedDict()
+
+    #: maximum number of full page rasters we keep in :attr:`lens_rasters`
+    max_lens_rasters = 2
+
+    #: maximum number of pixels of each of the :attr:`lens_rasters`
+    max_lens_pixels = 2 * 3840 * 2160
+
+    #: maximum number of pixels of :attr:`lens_rasters` rendered in a single main loop iteration
+    lens_band_pixels = 3840 * 256
+
+    #: `set` of the page numbers for which a lens raster is queued for rendering
+    lens_pending = set()
+
+    #: Server-side copies of the most recently drawn cache entries, to avoid transferring pixels on each expose.
+    #: An :class:`~collections.OrderedDict` whose keys are `(widget name, page number)` tuples and values are
+    #: tuples of the source :class:`~cairo.ImageSurface` and its copy as a :class:`~cairo.Surface`.
+    device_surfaces = collections.OrderedDict()
+
+    #: maximum number of pixels in the server-side surfaces we keep in :attr:`device_surfaces`,
+    #: i.e. a few full-screen slides at 4K or many small deck overview thumbnails
+    max_device_pixels = 4 * 3840 * 2160
+
+    #: number of pixels currently in :attr:`device_surfaces`
+    device_pixels = 0
+
+    #: `bool` whether to use server-side surfaces, or `None` if we do not know the display type yet
+    use_device_surfaces = None
+
+    #: :class:`~threading.Lock` used to manage conccurent accesses to :attr:`device_surfaces`.
+    device_lock = None
+
     def __init__(self, doc, max_pages):
         self.max_pages = max_pages
         self.doc = doc
         self.doc_lock = threading.Lock()
+        self.raster_lock = threading.Lock()
+        self.device_lock = threading.Lock()
 
 
-    def add_widget(self, widget, wtype, prerender_enabled = True, zoomed = False, ignore_max = False):
+    def add_widget(self, widget, wtype, prerender_enabled = True, zoomed = False, ignore_max = False, atlas = False):
         """ Add a widget to the list of widgets that have to be managed (for caching and prerendering).
 
         This creates new entries for ``widget_name`` in the needed internal data
@@ -109,17 +258,161 @@ class SurfaceCache(object):
             prerender_enabled (`bool`):  whether this widget is initially in the list of widgets to prerender
             zoomed (`bool`): whether we will cache a zoomed portion of the widget
             ignore_max (`bool`): whether we will cache an unlimited number of slides
+            atlas (`bool`): whether to pack the cached slides into large surfaces, see
+                            :class:`~pympress.surfacecache.SurfaceAtlas`
         """
         widget_name = widget.get_name().rstrip('0123456789') + ('_zoomed' if zoomed else '')
         with self.locks.setdefault(widget_name, threading.Lock()):
-            self.surface_cache[widget_name] = collections.OrderedDict()
-            self.surface_size[widget_name] = (-1, -1)
+            self.surface_cache[widget_name] = {}
+            self.surface_size[widget_name] = {}
+            self.surface_scale[widget_name] = widget.get_scale_factor()
             self.surface_type[widget_name] = wtype
             self.surface_factory[widget_name] = functools.partial(self._create_surface, widget)
             if prerender_enabled and not zoomed:
                 self.enable_prerender(widget_name)
             if ignore_max:
                 self.unlimited.add(widget_name)
+            if atlas:
+                self.atlases[widget_name] = {}
+
+        widget.connect('notify::scale-factor', self._on_scale_change, widget_name)
+
+
+    def _on_scale_change(self, widget, pspec, widget_name):
+        """ Track scale factor changes of a widget, e.g. when its window moves to a monitor with a different DPI.
+
+        Args:
+            widget (:class:`~Gtk.Widget`):  The widget whose scale factor changed
+            pspec (:class:`~GObject.ParamSpec`):  The property that changed
+            widget_name (`str`):  string used to identify a widget
+        """
+        with self.locks[widget_name]:
+            self.surface_scale[widget_name] = widget.get_scale_factor()
+            self._sync_size(widget_name)
+
+        widget.queue_draw()
+
+
+    def _bucket(self, widget_name, scale=None):
+        """ Get the key of the cache bucket currently in use by a widget. Must be called while holding the widget lock.
+
+        Args:
+            widget_name (`str`):  string used to identify a widget
+            scale (`int`): the scale factor of the cached pages, or `None` for the current scale of the widget
+
+        Returns:
+            `tuple`: the document type and scale factor of the bucket
+        """
+        return (self.surface_type[widget_name], self.surface_scale[widget_name] if scale is None else scale)
+
+
+    def _sync_size(self, widget_name):
+        """ Invalidate the current bucket of a widget if its pages were cached for another size than the widget's.
+
+        This happens when switching back to a bucket, of another document type or scale factor, after the widget was
+        resized while using another one. The widget size is unchanged unless a configure event tells us otherwise.
+        Must be called while holding the widget lock.
+
+        Args:
+            widget_name (`str`):  string used to identify a widget
+        """
+        size = self.widget_size.get(widget_name)
+        bucket = self._bucket(widget_name)
+        if size is not None and size != self.surface_size[widget_name].get(bucket):
+            self._pages(widget_name).clear()
+            self.surface_size[widget_name][bucket] = size
+            if widget_name in self.atlases:
+                self.atlases[widget_name].pop(bucket, None)
+            self._drop_device_surfaces(widget_name)
+
+
+    def _pages(self, widget_name, scale=None):
+        """ Get the cached pages of a widget at a given scale factor. Must be called while holding the widget lock.
+
+        Args:
+            widget_name (`str`):  string used to identify a widget
+            scale (`int`): the scale factor of the cached pages, or `None` for the current scale of the widget
+
+        Returns:
+            :class:`~collections.OrderedDict`: the cached pages, mapping page numbers to surfaces
+        """
+        return self.surface_cache[widget_name].setdefault(self._bucket(widget_name, scale), collections.OrderedDict())
+
+
+    def _trim(self, widget_name):
+        """ Evict pages of a widget beyond the maximum, pages of unused document types or scale factors first.
+
+        Must be called while holding the widget lock.
+
+        Args:
+            widget_name (`str`):  string used to identify a widget
+        """
+        bucket = self._bucket(widget_name)
+        caches = self.surface_cache[widget_name]
+        current = self._pages(widget_name)
+        cached = sum(map(len, caches.values()))
+
+        for cache_bucket, pc in caches.items():
+            if cache_bucket != bucket and pc and cached > self.max_pages and widget_name in self.atlases:
+                # Atlases are dropped as a unit
+                cached -= len(pc)
+                pc.clear()
+                self.atlases[widget_name].pop(cache_bucket, None)
+
+            while cache_bucket != bucket and pc and cached > self.max_pages:
+                pc.popitem(False)
+                cached -= 1
+
+        if widget_name not in self.unlimited:
+            while cached > self.max_pages:
+                current.popitem(False)
+                cached -= 1
+
+        self._drop_device_surfaces(widget_name)
+
+
+    def _drop_device_surfaces(self, widget_name):
+        """ Forget the server-side copies of the pages of a widget that are no longer in its cache.
+
+        Must be called while holding the widget lock.
+
+        Args:
+            widget_name (`str`):  string used to identify a widget
+        """
+        with self.device_lock:
+            keys = [key for key in self.device_surfaces if key[0] == widget_name]
+            if not keys:
+                return
+
+            cached = {id(page) for pc in self.surface_cache[widget_name].values() for page in pc.values()}
+            for key in keys:
+                source, surface = self.device_surfaces[key]
+                if id(source) not in cached:
+                    del self.device_surfaces[key]
+                    self.device_pixels -= source.get_width() * source.get_height()
+
+
+    def subscribe(self, widget_name, callback):
+        """ Be notified whenever a page becomes available in the cache of a widget.
+
+        Args:
+            widget_name (`str`):  string used to identify a widget
+            callback (`function`):  called with the widget name and page number when a page is rendered
+        """
+        self.subscribers.setdefault(widget_name, []).append(callback)
+
+
+    def unsubscribe(self, widget_name, callback):
+        """ Stop being notified of pages becoming available in the cache of a widget.
+
+        Args:
+            widget_name (`str`):  string used to identify a widget
+            callback (`function`):  the function that was passed to :meth:`subscribe`
+        """
+        try:
+            self.subscribers[widget_name].remove(callback)
+        except (KeyError, ValueError):
+            logger.warning('Callback {} was not subscribed to widget {}'.format(callback, widget_name))
 
 
     def swap_document(self, new_doc):
@@ -157,6 +450,8 @@ class SurfaceCache(object):
     def set_widget_type(self, widget_name, wtype):
         """ Set the document type of a widget.
 
+        Pages cached for the previous document type are kept, so that switching back to it is instant.
+
         Args:
             widget_name (`str`):  string used to identify a widget
             wtype (`int`):  type of document handled by the widget (see :attr:`surface_type`)
@@ -164,7 +459,7 @@ class SurfaceCache(object):
         with self.locks[widget_name]:
             if self.surface_type[widget_name] != wtype:
                 self.surface_type[widget_name] = wtype
-                self.surface_cache[widget_name].clear()
+                self._sync_size(widget_name)
 
 
     def get_widget_type(self, widget_name):
@@ -188,20 +483,39 @@ class SurfaceCache(object):
         for widget in [widget_name] if widget_name is not None else self.locks:
             with self.locks[widget]:
                 self.surface_cache[widget].clear()
+                if widget in self.atlases:
+                    self.atlases[widget].clear()
+
+        if widget_name is None:
+            with self.raster_lock:
+                self.page_rasters.clear()
+                self.lens_rasters.clear()
+
+        with self.device_lock:
+            for key in [key for key in self.device_surfaces if widget_name is None or key[0] == widget_name]:
+                source, surface = self.device_surfaces.pop(key)
+                self.device_pixels -= source.get_width() * source.get_height()
 
 
-    def resize_widget(self, widget_name, width, height):
-        """ Change the size of a registered widget, thus invalidating all the cached pages.
+    def resize_widget(self, widget_name, width, height, scale=None):
+        """ Change the size of a registered widget, thus invalidating the cached pages in its current bucket.
+
+        Cached pages at other scale factors or document types are kept, along with the size they were rendered for,
+        so that moving a window back to a monitor with the previous scale factor, or switching back to the previous
+        notes mode, does not require re-rendering.
 
         Args:
             widget_name (`str`):  name of the widget that is resized
             width (`int`):  new width of the widget
             height (`int`):  new height of the widget
+            scale (`int`):  new scale factor of the widget, or `None` to keep the current one
         """
         with self.locks[widget_name]:
-            if (width, height) != self.surface_size[widget_name]:
-                self.surface_cache[widget_name].clear()
-                self.surface_size[widget_name] = (width, height)
+            if scale is not None:
+                self.surface_scale[widget_name] = scale
+
+            self.widget_size[widget_name] = (width, height)
+            self._sync_size(widget_name)
 
 
     def get(self, widget_name, page_nb):
@@ -215,7 +529,7 @@ class SurfaceCache(object):
             :class:`~cairo.ImageSurface`: the cached page if available, or `None` otherwise
         """
         with self.locks[widget_name]:
-            pc = self.surface_cache[widget_name]
+            pc = self._pages(widget_name)
             if page_nb in pc:
                 pc.move_to_end(page_nb)
                 return pc[page_nb]
@@ -223,24 +537,87 @@ class SurfaceCache(object):
                 return None
 
 
+    def get_device(self, widget_name, page_nb, window):
+        """ Fetch a cached page for the specified widget, in the form that is fastest to paint repeatedly.
+
+        On X11, painting an image surface transfers all its pixels to the X server on each expose. For the most
+        recently used entries, we thus keep a server-side copy, made with :meth:`~Gdk.Window.create_similar_surface`.
+        The image surface remains the source of truth: the copy is only returned while the cached image is unchanged.
+
+        Args:
+            widget_name (`str`):  name of the concerned widget
+            page_nb (`int`):  number of the page to fetch in the cache
+            window (:class:`~Gdk.Window`):  the window on which the page will be painted
+
+        Returns:
+            :class:`~cairo.Surface`: the cached page if available, or `None` otherwise
+        """
+        image = self.get(widget_name, page_nb)
+        if image is None:
+            return None
+
+        if self.use_device_surfaces is None:
+            self.use_device_surfaces = GdkX11 is not None and isinstance(window.get_display(), GdkX11.X11Display)
+
+        # Atlas tiles are sub-surfaces of shared sheets, of which we would need to keep server-side copies as a whole
+        if not self.use_device_surfaces or widget_name in self.atlases:
+            return image
+
+        key = (widget_name, page_nb)
+        with self.device_lock:
+            source, surface = self.device_surfaces.get(key, (None, None))
+            if source is image:
+                self.device_surfaces.move_to_end(key)
+                return surface
+
+        scale = image.get_device_scale()[0]
+        try:
+            surface = window.create_similar_surface(cairo.Content.COLOR, int(image.get_width() / scale),
+                                                    int(image.get_height() / scale))
+        except cairo.Error:
+            logger.warning('Failed creating a server-side surface for widget {}'.format(widget_name), exc_info=True)
+            return image
+
+        context = cairo.Context(surface)
+        context.set_source_surface(image, 0, 0)
+        context.paint()
+        del context
+
+        with self.device_lock:
+            if key in self.device_surfaces:
+                source, _ = self.device_surfaces[key]
+                self.device_pixels -= source.get_width() * source.get_height()
+            self.device_surfaces[key] = (image, surface)
+            self.device_surfaces.move_to_end(key)
+            self.device_pixels += image.get_width() * image.get_height()
+
+            while self.device_pixels > self.max_device_pixels and len(self.device_surfaces) > 1:
+                _, (source, _) = self.device_surfaces.popitem(False)
+                self.device_pixels -= source.get_width() * source.get_height()
+
+        return surface
+
+
     def put(self, widget_name, page_nb, val):
         """ Store a rendered page in the cache.
 
+        The page is cached for the scale factor of the surface, which is normally the current scale of the widget.
+
         Args:
             widget_name (`str`):  name of the concerned widget
             page_nb (`int`):  number of the page to store in the cache
             val (:class:`~cairo.ImageSurface`):  content to store in the cache
         """
+        scale = int(val.get_device_scale()[0])
         with self.locks[widget_name]:
-            pc = self.surface_cache[widget_name]
+            pc = self._pages(widget_name, scale)
             pc[page_nb] = val
             pc.move_to_end(page_nb)
 
-            while len(pc) > self.max_pages:
-                pc.popitem(False)
+            self._trim(widget_name)
 
 
-    def _create_surface(self, widget, fmt, width, height):
+    def _create_surface(self, widget, fmt, width, height, scale):
         """ Given a widget, create a cairo Image surface with appropriate size and scaling.
 
         Args:
@@ -248,12 +625,12 @@ class SurfaceCache(object):
             fmt (:class:`~cairo.Format`): the format for the new surface
             width (`int`): width of the new surface
             height (`int`): height of the new surface
+            scale (`int`): scale factor of the new surface
 
         Returns:
             :class:`~cairo.ImageSurface`: a new image surface
         """
         window = widget.get_window()
-        scale = window.get_scale_factor()
         try:
             return window.create_similar_image_surface(fmt, width * scale, height * scale, scale)
         except cairo.Error:
@@ -263,6 +640,235 @@ class SurfaceCache(object):
             raise
 
 
+    @staticmethod
+    def _widget_resolution(page, wtype, ww, wh, scale):
+        """ Get the resolution at which a widget displays a page.
+
+        Args:
+            page (:class:`~pympress.document.Page`):  the page displayed
+            wtype (:class:`~pympress.document.PdfPage`):  the type of document displayed by the widget
+            ww (`int`):  widget width in pixels
+            wh (`int`):  widget height in pixels
+            scale (`int`):  the scale factor of the widget
+
+        Returns:
+            `float`: the resolution in device pixels per point
+        """
+        pw, ph = page.get_size(wtype)
+        return min(ww / pw, wh / ph) * scale
+
+
+    def _page_raster(self, page, scale):
+        """ Get the full page rasterized at the resolution shared by the widgets showing a part of it.
+
+        The raster is only worth rendering if it maps exactly to the pixels of at least two widgets, i.e. if
+        they display the page at the same resolution, as widgets at any other resolution render the page directly.
+
+        Args:
+            page (:class:`~pympress.document.Page`):  the page to rasterize
+            scale (`int`):  the scale factor of the widgets
+
+        Returns:
+            `tuple`: the resolution in device pixels per point and the :class:`~cairo.ImageSurface`, or `None`
+        """
+        resolutions = collections.Counter()
+        for widget_name, wtype in list(self.surface_type.items()):
+            if widget_name.endswith('_zoomed') or wtype.direction() not in {'horizontal', 'vertical'}:
+                continue
+
+            ww, wh = self.surface_size[widget_name].get((wtype, scale), (-1, -1))
+            if ww > 0 and wh > 0:
+                resolutions[self._widget_resolution(page, wtype, ww, wh, scale)] += 1
+
+        shared = [resolution for resolution, count in resolutions.items() if count > 1]
+        if not shared:
+            return None
+        resolution = max(shared)
+
+        with self.raster_lock:
+            raster = self.page_rasters.get(page.page_nb)
+            if raster is not None and raster[0] == resolution:
+                self.page_rasters.move_to_end(page.page_nb)
+                return raster
+
+        pw, ph = page.get_size()
+        width, height = int(math.ceil(pw * resolution)), int(math.ceil(ph * resolution))
+        try:
+            surface = cairo.ImageSurface(cairo.Format.RGB24, width, height)
+        except cairo.Error:
+            logger.warning('Failed creating a page raster sized {}x{}'.format(width, height), exc_info=True)
+            return None
+
+        # Scale exactly by the resolution, to get the same pixels as rendering the page for the widgets directly
+        context = cairo.Context(surface)
+        context.scale(resolution, resolution)
+        page.render_cairo(context, pw, ph)
+        del context
+
+        raster = (resolution, surface)
+        with self.raster_lock:
+            self.page_rasters[page.page_nb] = raster
+            self.page_rasters.move_to_end(page.page_nb)
+            while len(self.page_rasters) > self.max_rasters:
+                self.page_rasters.popitem(False)
+
+        return raster
+
+
+    def _raster_region(self, page, wtype, ww, wh, scale):
+        """ Get the region of the shared page raster that contains exactly the pixels of a widget.
+
+        Args:
+            page (:class:`~pympress.document.Page`):  the page to render
+            wtype (:class:`~pympress.document.PdfPage`):  the type of document that should be rendered
+            ww (`int`):  target width in pixels
+            wh (`int`):  target height in pixels
+            scale (`int`):  the scale factor of the target surface
+
+        Returns:
+            :class:`~cairo.Surface`: the region of the raster, or `None` if the widget does not display the page at
+            the resolution of the raster or at a whole pixel offset in it
+        """
+        raster = self._page_raster(page, scale)
+        if raster is None:
+            return None
+
+        resolution, surface = raster
+        if resolution != self._widget_resolution(page, wtype, ww, wh, scale):
+            return None
+
+        pw, ph = page.get_size()
+        fx, fy = wtype.from_screen(0, 0)
+        x, y = fx * pw * resolution, fy * ph * resolution
+        if abs(x - round(x)) > 1e-6 or abs(y - round(y)) > 1e-6:
+            return None
+
+        x, y = int(round(x)), int(round(y))
+        width, height = (int(math.ceil(size * resolution)) for size in page.get_size(wtype))
+        width, height = min(width, surface.get_width() - x), min(height, surface.get_height() - y)
+        return surface.create_for_rectangle(x, y, width, height)
+
+
+    def _lens_resolution(self, page, resolution):
+        """ Limit the resolution of a lens raster so that it does not exceed :attr:`max_lens_pixels`.
+
+        Args:
+            page (:class:`~pympress.document.Page`):  the page to rasterize
+            resolution (`float`):  the requested resolution, in device pixels per point
+
+        Returns:
+            `float`: the resolution at which the page is rasterized
+        """
+        pw, ph = page.get_size()
+        return min(resolution, math.sqrt(self.max_lens_pixels / (pw * ph)))
+
+
+    def get_lens_raster(self, page, resolution):
+        """ Get the full page rasterized for the magnifier lens, if it is available at a sufficient resolution.
+
+        Args:
+            page (:class:`~pympress.document.Page`):  the page that is magnified
+            resolution (`float`):  the resolution needed, in device pixels per point
+
+        Returns:
+            `tuple`: the resolution in device pixels per point and the :class:`~cairo.ImageSurface`, or `None`
+        """
+        resolution = self._lens_resolution(page, resolution)
+        with self.raster_lock:
+            raster = self.lens_rasters.get(page.page_nb)
+            if raster is not None and raster[0] >= resolution:
+                self.lens_rasters.move_to_end(page.page_nb)
+                return raster
+        return None
+
+
+    def prerender_lens(self, page, resolution, callback):
+        """ Queue rasterizing a full page for the magnifier lens.
+
+        Args:
+            page (:class:`~pympress.document.Page`):  the page that is magnified
+            resolution (`float`):  the resolution needed, in device pixels per point
+            callback (`function`):  called without arguments once the raster is available
+        """
+        if page.page_nb not in self.lens_pending:
+            self.lens_pending.add(page.page_nb)
+            GLib.idle_add(next, self.lens_renderer(page, resolution, callback), False)
+
+
+    def lens_renderer(self, page, resolution, callback):
+        """ Rasterize a full page for the magnifier lens, one band of :attr:`lens_band_pixels` at a time.
+
+        Meant to be scheduled on the GLib main loop, so that the main loop runs between bands of large rasters.
+
+        Args:
+            page (:class:`~pympress.document.Page`):  the page that is magnified
+            resolution (`float`):  the resolution needed, in device pixels per point
+            callback (`function`):  called without arguments once the raster is available
+
+        Returns:
+            generator: yields `True` while there are bands left to render (:func:`~GLib.idle_add` convention)
+        """
+        doc = self.doc
+        try:
+            if self.get_lens_raster(page, resolution) is not None:
+                return
+
+            resolution = self._lens_resolution(page, resolution)
+            pw, ph = page.get_size()
+            width, height = int(math.ceil(pw * resolution)), int(math.ceil(ph * resolution))
+            try:
+                surface = cairo.ImageSurface(cairo.Format.RGB24, width, height)
+            except cairo.Error:
+                logger.warning('Failed creating a lens raster sized {}x{}'.format(width, height), exc_info=True)
+                return
+
+            band = max(1, self.lens_band_pixels // width)
+            for top in range(0, height, band):
+                context = cairo.Context(surface)
+                context.rectangle(0, top, width, min(band, height - top))
+                context.clip()
+                context.scale(resolution, resolution)
+                page.render_cairo(context, pw, ph)
+                del context
+                yield True
+
+            # The document changed while rendering
+            if self.doc is not doc:
+                return
+
+            with self.raster_lock:
+                self.lens_rasters[page.page_nb] = (resolution, surface)
+                self.lens_rasters.move_to_end(page.page_nb)
+                while len(self.lens_rasters) > self.max_lens_rasters:
+                    self.lens_rasters.popitem(False)
+        finally:
+            self.lens_pending.discard(page.page_nb)
+
+        callback()
+
+
+    def render_page(self, widget_name, page, context, ww, wh, wtype, scale):
+        """ Render a page for a widget, sharing a single rasterization of the page when it is split in halves.
+
+        In split notes modes, the slide and notes halves of a page are displayed by different widgets, so the page
+        is rasterized once and the relevant regions are sliced out of the same buffer for each widget.
+
+        Args:
+            widget_name (`str`):  name of the concerned widget
+            page (:class:`~pympress.document.Page`):  the page to render
+            context (:class:`~cairo.Context`):  the context to render into
+            ww (`int`):  target width in pixels
+            wh (`int`):  target height in pixels
+            wtype (:class:`~pympress.document.PdfPage`):  the type of document that should be rendered
+            scale (`int`):  the scale factor of the target surface
+        """
+        raster = None
+        if not widget_name.endswith('_zoomed') and wtype.direction() in {'horizontal', 'vertical'}:
+            raster = self._raster_region(page, wtype, ww, wh, scale)
+
+        page.render_cairo(context, ww, wh, wtype, raster)
+
+
     def prerender(self, page_nb):
         """ Queue a page for prerendering.
 
@@ -291,11 +897,12 @@ class SurfaceCache(object):
             page_nb (`int`):  number of the page to store in the cache
         """
         with self.locks[widget_name]:
-            if page_nb in self.surface_cache[widget_name]:
+            bucket = self._bucket(widget_name)
+            if page_nb in self._pages(widget_name):
                 # Already in cache
                 return GLib.SOURCE_REMOVE
-            ww, wh = self.surface_size[widget_name]
-            wtype = self.surface_type[widget_name]
+            ww, wh = self.surface_size[widget_name].get(bucket, (-1, -1))
+            wtype, scale = bucket
 
         if ww < 0 or wh < 0:
             logger.warning('Widget {} with invalid size {}x{} when rendering'.format(widget_name, ww, wh))
@@ -308,7 +915,7 @@ class SurfaceCache(object):
 
         # Render to a ImageSurface
         try:
-            surface = self.surface_factory[widget_name](cairo.Format.RGB24, ww, wh)
+            surface = self._create_page_surface(widget_name, bucket, ww, wh)
         except AttributeError:
             logger.warning('Widget {} was not mapped when rendering'.format(widget_name), exc_info = True)
             return GLib.SOURCE_REMOVE
@@ -316,22 +923,169 @@ class SurfaceCache(object):
             return GLib.SOURCE_REMOVE
 
         context = cairo.Context(surface)
-        page.render_cairo(context, ww, wh, wtype)
+        self.render_page(widget_name, page, context, ww, wh, wtype, scale)
         del context
 
         # Save if possible and necessary − using PDF page numbering
-        page_nb = page.page_nb
+        self._store(widget_name, bucket, (ww, wh), page.page_nb, surface)
+
+        return GLib.SOURCE_REMOVE
+
+
+    def _create_page_surface(self, widget_name, bucket, width, height):
+        """ Create a surface on which to render a page for a widget, possibly as a tile of an atlas.
+
+        Args:
+            widget_name (`str`):  name of the concerned widget
+            bucket (`tuple`):  the key of the bucket for which the page is rendered
+            width (`int`): width of the new surface
+            height (`int`): height of the new surface
+
+        Returns:
+            :class:`~cairo.Surface`: a new surface
+        """
+        if widget_name not in self.atlases:
+            return self.surface_factory[widget_name](cairo.Format.RGB24, width, height, bucket[1])
+
         with self.locks[widget_name]:
-            pc = self.surface_cache[widget_name]
-            if (ww, wh) == self.surface_size[widget_name] and page_nb not in pc:
-                pc[page_nb] = surface
+            atlas = self.atlases[widget_name].get(bucket)
+            if atlas is None or atlas.tile_size != (width, height):
+                atlas = self.atlases[widget_name][bucket] = SurfaceAtlas(width, height, bucket[1])
+            return atlas.allocate()
+
+
+    def _store(self, widget_name, bucket, size, page_nb, surface):
+        """ Store a page rendered in the background, if the widget configuration is still valid, and notify subscribers.
+
+        Args:
+            widget_name (`str`):  name of the concerned widget
+            bucket (`tuple`):  the key of the bucket for which the page was rendered
+            size (`tuple`):  the size for which the page was rendered
+            page_nb (`int`):  number of the page to store in the cache
+            surface (:class:`~cairo.ImageSurface`):  the rendered page
 
-            if widget_name not in self.unlimited:
+        Returns:
+            `bool`: whether the page was stored in the cache
+        """
+        with self.locks[widget_name]:
+            pc = self.surface_cache[widget_name].setdefault(bucket, collections.OrderedDict())
+            stored = size == self.surface_size[widget_name].get(bucket) and page_nb not in pc
+            if stored:
+                pc[page_nb] = surface
                 pc.move_to_end(page_nb)
-                while len(pc) > self.max_pages:
-                    pc.popitem(False)
+            elif bucket in self.atlases.get(widget_name, {}):
+                self.atlases[widget_name][bucket].release(surface)
 
-        return GLib.SOURCE_REMOVE
+            self._trim(widget_name)
+
+        if stored and bucket == self._bucket(widget_name):
+            for callback in self.subscribers.get(widget_name, []):
+                callback(widget_name, page_nb)
+
+        return stored
+
+
+    @staticmethod
+    def _halve(surface):
+        """ Downscale a surface by a factor 2, averaging each block of 2x2 pixels into one.
+
+        Bilinear filtering at exactly half the size samples each pixel in the middle of 4 source pixels,
+        which makes it a box filter.
+
+        Args:
+            surface (:class:`~cairo.ImageSurface`):  the surface to downscale
+
+        Returns:
+            :class:`~cairo.ImageSurface`: a new surface, half the size of the original
+        """
+        half = cairo.ImageSurface(cairo.Format.RGB24, (surface.get_width() + 1) // 2, (surface.get_height() + 1) // 2)
+        half.set_device_scale(*surface.get_device_scale())
+
+        context = cairo.Context(half)
+        context.scale(.5, .5)
+        context.set_source_surface(surface, 0, 0)
+        context.get_source().set_filter(cairo.Filter.BILINEAR)
+        context.paint()
+        del context
+
+        return half
+
+
+    def derive(self, widget_name, page_nb):
+        """ Build a page for a widget by downscaling a larger render of the same page, cached for another widget.
+
+        The larger render is halved repeatedly with a box filter, then scaled to the exact target size.
+        This is much cheaper than rendering with Poppler, and is meant for thumbnails.
+
+        Args:
+            widget_name (`str`):  name of the concerned widget
+            page_nb (`int`):  number of the page to store in the cache
+
+        Returns:
+            `bool`: whether the page is available in the cache of the widget, `False` if it needs to be rendered
+        """
+        with self.locks[widget_name]:
+            bucket = self._bucket(widget_name)
+            if page_nb in self._pages(widget_name):
+                # Already in cache
+                return True
+            ww, wh = self.surface_size[widget_name].get(bucket, (-1, -1))
+            wtype, scale = bucket
+
+        if ww <= 0 or wh <= 0:
+            return False
+
+        with self.doc_lock:
+            page = self.doc.page(page_nb)
+            if page is None or not page.can_render():
+                return False
+
+        pw, ph = page.get_size(wtype)
+        target_scale = min(ww / pw, wh / ph)
+
+        # Find the smallest render of the page that is at least as large as we need, with the same type and scale
+        source, source_scale = None, None
+        for name in list(self.surface_cache):
+            if name == widget_name or name.endswith('_zoomed'):
+                continue
+
+            with self.locks[name]:
+                candidate = self.surface_cache[name].get(bucket, {}).get(page.page_nb)
+                size = self.surface_size[name].get(bucket)
+
+            if candidate is None or size is None:
+                continue
+
+            candidate_scale = min(size[0] / pw, size[1] / ph)
+            if candidate_scale >= target_scale and (source is None or candidate_scale < source_scale):
+                source, source_scale = candidate, candidate_scale
+
+        if source is None:
+            return False
+
+        ratio = target_scale / source_scale
+        try:
+            while ratio <= .5:
+                source = self._halve(source)
+                ratio *= 2
+
+            surface = self._create_page_surface(widget_name, bucket, ww, wh)
+        except AttributeError:
+            logger.warning('Widget {} was not mapped when rendering'.format(widget_name), exc_info = True)
+            return False
+        except cairo.Error:
+            return False
+
+        context = cairo.Context(surface)
+        context.rectangle(0, 0, pw * target_scale, ph * target_scale)
+        context.clip()
+        context.scale(ratio, ratio)
+        context.set_source_surface(source, 0, 0)
+        context.get_source().set_filter(cairo.Filter.GOOD)
+        context.paint()
+        del context
+
+        return self._store(widget_name, bucket, (ww, wh), page.page_nb, surface)
 
 
 ##
@@ -36,6 +36,7 @@ logger = logging.getLogger(__name__)
 
 import pathlib
 import math
+import time
 import sys
 import gc
 from urllib.request import url2pathname
@@ -63,6 +64,8 @@ class UI(builder.Builder):
     c_frame = None
     #: :class:`~Gtk.DrawingArea` for the Content window.
     c_da = None
+    #: :class:`~Gtk.DrawingArea` above :attr:`~c_da`, where the pointer and zoom selection are drawn
+    c_da_layer = None
 
     #: Presenter window, as a :class:`~Gtk.Window` instance.
     p_win = None
@@ -85,6 +88,12 @@ class UI(builder.Builder):
     p_frame_cur = None
     #: :class:`~Gtk.DrawingArea` for the current slide copy in the Presenter window.
     p_da_cur = None
+    #: :class:`~Gtk.DrawingArea` above :attr:`~p_da_cur`, where the pointer and zoom selection are drawn
+    p_da_cur_layer = None
+    #: `dict` mapping each layer above a current slide to the rectangles last drawn on it
+    layer_extents = {}
+    #: `set` of the names of current slide widgets whose zoomed slide is waiting to be rendered
+    zoom_renders = set()
 
     #: :class:`~Gtk.Frame` for the annotations in the Presenter window.
     p_frame_annot = None
@@ -120,6 +129,11 @@ class UI(builder.Builder):
     #: track whether we blank the screen
     blanked = False
 
+    #: `int` incremented at each page change, so that the delayed stages of a superseded page change are skipped
+    page_change_serial = 0
+    #: `int` serial number of the latest page change that was not a preview, i.e. that changed the media to show
+    media_change_serial = 0
+
     #: Dictionary of :class:`~Gtk.Widget` from the presenter window that can be dynamically rearranged
     placeable_widgets = {}
     #: Map of :class:`~Gtk.Paned` to the relative position (`float` between 0 and 1) of its handle
@@ -385,7 +399,10 @@ class UI(builder.Builder):
         self.cache.add_widget(self.p_da_notes, self.notes_mode, prerender_enabled = bool(self.notes_mode))
         self.cache.add_widget(self.scribbler.scribble_p_da, slide_type, prerender_enabled = False)
         self.cache.add_widget(self.scribbler.scribble_p_da, slide_type, zoomed = True)
-        self.cache.add_widget(self.deck.deck0, slide_type, prerender_enabled = False, ignore_max = True)
+        self.cache.add_widget(self.deck.deck_da, slide_type, prerender_enabled = False, ignore_max = True, atlas = True)
+
+        for name in ['c_da', 'p_da_cur', 'p_da_next', 'p_da_notes']:
+            self.cache.subscribe(name, self.on_page_rendered)
 
         # set default value
         self.page_number.set_last(self.doc.pages_number())
@@ -629,7 +646,8 @@ class UI(builder.Builder):
         if not event.send_event:
             return
 
-        self.cache.resize_widget(widget.get_name().rstrip('0123456789'), event.width, event.height)
+        self.cache.resize_widget(widget.get_name().rstrip('0123456789'), event.width, event.height,
+                                 widget.get_scale_factor())
 
         if widget is self.c_da:
             self.medias.resize('content')
@@ -821,6 +839,7 @@ class UI(builder.Builder):
 
         # Some things that need updating
         self.cache.swap_document(self.doc)
+        self.scribbler.swap_document(self.doc, reloading)
         self.page_number.set_last(self.doc.pages_number())
         self.page_number.enable_labels(self.doc.has_labels())
         self.autoplay.set_doc_pages(self.doc.pages_number())
@@ -942,15 +961,25 @@ class UI(builder.Builder):
         return response == Gtk.ResponseType.CANCEL or (reload and Gtk.ResponseType == Gtk.ResponseType.YES)
 
 
-    def save_file_as(self, *args):
-        """ Remove the current document.
+    def ask_save_uri(self, title=None):
+        """ Ask the user where to save the current document.
+
+        Args:
+            title (`str` or `None`): The title of the dialog, defaults to “Save as...”
+
+        Returns:
+            `str` or `None`: The URI picked by the user, or `None` if the dialog was cancelled
         """
         # Use a GTK file dialog to choose file
-        dialog = Gtk.FileChooserDialog(title = _('Save as...'), transient_for = self.p_win,
+        dialog = Gtk.FileChooserDialog(title = title or _('Save as...'), transient_for = self.p_win,
                                        action = Gtk.FileChooserAction.SAVE)
         dialog.add_buttons(Gtk.STOCK_SAVE_AS, Gtk.ResponseType.OK)
         dialog.set_default_response(Gtk.ResponseType.OK)
         dialog.set_position(Gtk.WindowPosition.CENTER)
+        dialog.set_do_overwrite_confirmation(True)
+
+        if self.doc.uri is not None:
+            dialog.set_uri(self.doc.uri)
 
         file_filter = Gtk.FileFilter()
         file_filter.set_name(_('PDF files'))
@@ -964,11 +993,18 @@ class UI(builder.Builder):
         dialog.add_filter(file_filter)
 
         response = dialog.run()
+        uri = dialog.get_uri() if response == Gtk.ResponseType.OK else None
+        dialog.destroy()
 
-        if response == Gtk.ResponseType.OK:
-            self.doc.save_changes(dialog.get_uri())
+        return uri
 
-        dialog.destroy()
+
+    def save_file_as(self, *args):
+        """ Save the current document under a new name.
+        """
+        uri = self.ask_save_uri()
+        if uri is not None:
+            self.doc.save_changes(uri)
 
 
     def pick_file(self, *args):
@@ -1043,6 +1079,15 @@ class UI(builder.Builder):
         self.swap_document(target.get_string())
 
 
+    def get_current_page(self):
+        """ Simple getter.
+
+        Returns:
+             `int`: The number of the page currently displayed in the content window
+        """
+        return self.current_page
+
+
     def get_notes_mode(self):
         """ Simple getter.
 
@@ -1180,25 +1225,102 @@ class UI(builder.Builder):
         This is a kind of event which is supposed to be called only from the
         :class:`~pympress.document.Document` class.
 
+        The work is split in stages of decreasing priority: the content window is updated immediately, then the
+        presenter slides, the annotations and page numbers, media and timing bookkeeping, and finally the prerendering.
+        The presenter stage has a lower priority than GTK redraws, so the content window is usually painted first,
+        though that is not guaranteed, e.g. if its frame clock is waiting for the next frame.
+        Stages of a page change that is superseded by a newer one are skipped, except for the timing bookkeeping
+        and for the media of the latest page change that is not a preview, since its media were removed.
+
         Args:
             is_preview (`bool`):  `True` if the page change should not update the content
             unpause (`bool`):  `True` if the page change should unpause the timer, `False` otherwise
             autoplay (`bool`):  `True` if the page change is triggered automatically, otherwise cancel auto play
         """
+        start = time.perf_counter()
+        self.page_change_serial += 1
+        serial = self.page_change_serial
+
         is_preview = self.page_number.editing
         if not is_preview:
+            self.media_change_serial = serial
             self.preview_page = self.current_page
             self.app.set_action_state('page', self.current_page + 1)
 
+            self.update_content_page()
+
+            # Remove scribbles and scribbling/zooming modes
+            if self.scribbler.page_change_exits:
+                self.scribbler.disable_scribbling()
+            self.scribbler.page_change(self.preview_page, self.doc.page(self.preview_page).label())
+            self.zoom.stop_zooming(animate=False)
+
+            # Hide medias now, the new ones are added later
+            self.medias.remove_media_overlays()
+
+            # Start counter if needed
+            if unpause:
+                self.talk_time.unpause()
+            if not autoplay:
+                self.autoplay.stop_looping()
+
+            transition_time = self.talk_time.current_time()
+
+        logger.debug('Page change stage content took {:.1f}ms'.format((time.perf_counter() - start) * 1000))
+
+        GLib.idle_add(self.page_change_stage, serial, 'presenter', self.update_presenter_pages,
+                      priority=GLib.PRIORITY_HIGH_IDLE + 30)
+        GLib.idle_add(self.page_change_stage, serial, 'details', self.update_page_details)
+        if not is_preview:
+            GLib.idle_add(self.page_change_stage, None, 'media', self.update_medias, serial)
+            GLib.idle_add(self.page_change_stage, None, 'timing', self.timing.transition,
+                          self.preview_page, transition_time)
+        GLib.idle_add(self.page_change_stage, serial, 'prerender', self.prerender_pages, priority=GLib.PRIORITY_LOW)
+
+
+    def page_change_stage(self, serial, name, stage, *args):
+        """ Run a stage of a page change, unless a more recent page change happened since, and log its duration.
+
+        Args:
+            serial (`int`):  the serial number of the page change, or `None` if the stage must always run
+            name (`str`):  the name of the stage, for logging purposes
+            stage (`function`):  the function performing the stage
+            *args:  the arguments to pass to the stage function
+
+        Returns:
+            `bool`: `False`, to remove the function from the idle callbacks (:func:`~GLib.idle_add` convention)
+        """
+        if serial is not None and serial != self.page_change_serial:
+            logger.debug('Page change stage {} skipped, superseded by a newer page change'.format(name))
+            return GLib.SOURCE_REMOVE
+
+        start = time.perf_counter()
+        stage(*args)
+        logger.debug('Page change stage {} took {:.1f}ms'.format(name, (time.perf_counter() - start) * 1000))
+        return GLib.SOURCE_REMOVE
+
+
+    def update_content_page(self):
+        """ Set aspect ratios and queue redraws of the widgets showing the current page.
+        """
+        content_pr = self.doc.page(self.current_page).get_aspect_ratio(self.notes_mode.complement())
+        self.c_frame.set_property('ratio', content_pr)
+        self.c_da.queue_draw()
+
+        self.scribbler.scribble_p_frame.set_property('ratio', content_pr)
+        self.scribbler.scribble_p_frame.queue_draw()
+
+
+    def update_presenter_pages(self):
+        """ Set aspect ratios and queue redraws of the widgets showing the preview, next, and notes pages.
+        """
         draw_notes = self.notes_mode
         draw_page = draw_notes.complement()
 
-        page_content = self.doc.page(self.current_page)
         page_preview = self.doc.page(self.preview_page)
         pages_next = [self.doc.page(self.preview_page + n + 1) for n in range(self.next_frames_count)]
         page_notes = self.doc.notes_page(self.preview_page)
 
-        # Aspect ratios and queue redraws
         if draw_notes and page_notes is not None:
             note_pr = page_notes.get_aspect_ratio(draw_notes)
             self.p_frame_notes.set_property('ratio', note_pr)
@@ -1209,14 +1331,6 @@ class UI(builder.Builder):
         self.p_frame_cur.set_property('ratio', preview_pr)
         self.p_da_cur.queue_draw()
 
-        if not is_preview:
-            content_pr = page_content.get_aspect_ratio(draw_page)
-            self.c_frame.set_property('ratio', content_pr)
-            self.c_da.queue_draw()
-
-            self.scribbler.scribble_p_frame.set_property('ratio', content_pr)
-            self.scribbler.scribble_p_frame.queue_draw()
-
         next_pr = preview_pr  # A default page ratio
         for page, frame, da in zip(pages_next, self.p_frames_next, self.p_das_next):
             if page is not None:
@@ -1224,36 +1338,65 @@ class UI(builder.Builder):
             frame.set_property('ratio', next_pr)
             da.queue_draw()
 
+
+    def update_page_details(self):
+        """ Update the annotations and page numbers for the preview page.
+        """
+        page_preview = self.doc.page(self.preview_page)
         self.annotations.load_annotations(page_preview)
 
         # Update display -- needs to be different ?
         self.page_number.update_page_numbers(self.preview_page, page_preview.label())
 
+
+    def update_medias(self, serial):
+        """ Show the medias of the current page, and preroll those of the next pages.
+
+        Args:
+            serial (`int`):  the serial number of the page change, medias are only updated for the latest one that
+                             was not a preview
+        """
+        if serial == self.media_change_serial:
+            self.medias.replace_media_overlays(self.doc.page(self.current_page), self.notes_mode.complement())
+            self.medias.preroll_media_overlays([self.doc.page(self.current_page + offset)
+                                                for offset in range(1, 1 + self.medias.preroll_pages)],
+                                               self.notes_mode.complement())
+
+
+    def prerender_pages(self):
+        """ Queue prerendering of the pages around the preview page.
+        """
         # Prerender the 4 next pages and the 2 previous ones
         page_max = min(self.doc.pages_number(), self.preview_page + self.next_frames_count + 4)
         page_min = max(0, self.preview_page - 2)
         for p in list(range(self.preview_page + 1, page_max)) + list(range(self.preview_page, page_min, -1)):
             self.cache.prerender(p)
 
-        if is_preview:
-            return
 
-        # Remove scribbles and scribbling/zooming modes
-        if self.scribbler.page_change_exits:
-            self.scribbler.disable_scribbling()
-        self.scribbler.page_change(self.preview_page, page_preview.label())
-        self.zoom.stop_zooming()
+    def on_page_rendered(self, widget_name, page_nb):
+        """ Redraw the widgets displaying a page, once it has been rendered in the cache.
 
-        # Update medias
-        self.medias.replace_media_overlays(self.doc.page(self.current_page), draw_page)
+        This is how widgets that skipped drawing on a cache miss, e.g. while resizing panes, get repainted.
 
-        # Start counter if needed
-        if unpause:
-            self.talk_time.unpause()
-        if not autoplay:
-            self.autoplay.stop_looping()
+        Args:
+            widget_name (`str`):  name of the widget for which the page was rendered
+            page_nb (`int`):  number of the page that was rendered, using PDF page numbering
+        """
+        if widget_name == 'c_da':
+            displayed = [(self.c_da, self.doc.page(self.current_page))]
+        elif widget_name == 'p_da_cur':
+            displayed = [(self.p_da_cur, self.doc.page(self.preview_page))]
+        elif widget_name == 'p_da_notes':
+            displayed = [(self.p_da_notes, self.doc.notes_page(self.preview_page))]
+        elif widget_name == 'p_da_next':
+            displayed = [(da, self.doc.page(self.preview_page + n + 1))
+                         for n, da in enumerate(self.p_das_next[:self.next_frames_count])]
+        else:
+            return
 
-        self.timing.transition(self.preview_page, self.talk_time.current_time())
+        for widget, page in displayed:
+            if page is not None and page.number() == page_nb:
+                widget.queue_draw()
 
 
     def on_draw(self, widget, cairo_context):
@@ -1303,14 +1446,17 @@ class UI(builder.Builder):
         window = widget.get_window()
         scale = window.get_scale_factor()
 
-        if self.zoom.scale != 1. and (widget is self.p_da_cur or widget is self.c_da or
-                                      widget is self.scribbler.scribble_p_da):
+        # While the zoom is animated or rendered, scale the unzoomed page instead of rendering it at each frame
+        interpolate = False
+        if widget is self.p_da_cur or widget is self.c_da or widget is self.scribbler.scribble_p_da:
             zoom_matrix = self.zoom.get_matrix(ww, wh)
-            name += '_zoomed'
+            interpolate = self.zoom.animating() or widget.get_name() in self.zoom_renders
+            if self.zoom.scale != 1. and not interpolate:
+                name += '_zoomed'
         else:
             zoom_matrix = cairo.Matrix()
 
-        pb = self.cache.get(name, nb)
+        pb = self.cache.get_device(name, nb, window)
         if pb is None:
             if self.resize_panes and widget in self.p_das_next + [self.p_da_cur, self.p_da_notes]:
                 # too slow to render here when resize_panes things
@@ -1331,15 +1477,22 @@ class UI(builder.Builder):
                 return
 
             cairo_prerender = cairo.Context(pb)
-            cairo_prerender.transform(zoom_matrix)
-            page.render_cairo(cairo_prerender, ww, wh, wtype)
+            if not interpolate:
+                cairo_prerender.transform(zoom_matrix)
+            self.cache.render_page(name, page, cairo_prerender, ww, wh, wtype, scale)
 
             self.cache.put(name, nb, pb)
 
+        if interpolate:
+            # Draw the unzoomed page with the intermediate zoom
+            cairo_context.save()
+            cairo_context.transform(zoom_matrix)
             cairo_context.set_source_surface(pb, 0, 0)
+            cairo_context.get_source().set_filter(cairo.Filter.BILINEAR)
             cairo_context.paint()
+            cairo_context.restore()
         else:
-            # Cache hit: draw the surface from the cache to the widget
+            # Draw the surface from the cache to the widget
             cairo_context.set_source_surface(pb, 0, 0)
             cairo_context.paint()
 
@@ -1348,13 +1501,105 @@ class UI(builder.Builder):
             cairo_context.transform(zoom_matrix)
 
             self.scribbler.draw_scribble(widget, cairo_context)
-            self.zoom.draw_zoom_target(widget, cairo_context)
 
             cairo_context.restore()
 
-        if widget is self.c_da or widget is self.p_da_cur or widget is self.scribbler.scribble_p_da:
-            # do not use the zoom matrix for the pointer, it is relative to the screen not the slide
-            self.laser.render_pointer(cairo_context, widget, ww, wh)
+
+    def get_layer_extents(self, layer):
+        """ Get the areas of a layer above a current slide that need to be drawn.
+
+        Args:
+            layer (:class:`~Gtk.DrawingArea`):  the layer widget
+
+        Returns:
+            `list`: the (x, y, width, height) rectangles covered by the pointer and zoom selection
+        """
+        ww, wh = layer.get_allocated_width(), layer.get_allocated_height()
+        extents = [self.zoom.get_extents(ww, wh), self.zoom.get_lens_extents(ww, wh), self.laser.get_extents(ww, wh)]
+        return [rect for rect in extents if rect is not None]
+
+
+    def on_draw_layer(self, widget, cairo_context):
+        """ Draw the pointer and zoom selection in the transparent layers above the current slides.
+
+        Drawing these in a separate layer means moving them only redraws the small areas that they cover.
+
+        Args:
+            widget (:class:`~Gtk.Widget`):  the layer to update
+            cairo_context (:class:`~cairo.Context`):  the Cairo context
+        """
+        self.layer_extents[widget] = self.get_layer_extents(widget)
+        if widget is self.c_da_layer and self.blanked:
+            return
+
+        ww, wh = widget.get_allocated_width(), widget.get_allocated_height()
+
+        cairo_context.save()
+        cairo_context.transform(self.zoom.get_matrix(ww, wh))
+        self.zoom.draw_zoom_target(widget, cairo_context)
+        cairo_context.restore()
+
+        self.draw_lens(widget, cairo_context, ww, wh)
+
+        # do not use the zoom matrix for the pointer, it is relative to the screen not the slide
+        self.laser.render_pointer(cairo_context, widget, ww, wh)
+
+
+    def draw_lens(self, layer, cairo_context, ww, wh):
+        """ Draw the magnifier lens in a layer above a current slide.
+
+        The lens samples a rasterization of the full page at a high resolution, that is rendered once per page at idle
+        time. Until it is available, the lens scales up the page as it is cached for the slide widget.
+
+        Args:
+            layer (:class:`~Gtk.Widget`):  the layer on which to draw
+            cairo_context (:class:`~cairo.Context`):  the Cairo context
+            ww (`int`): The widget width
+            wh (`int`): The widget height
+        """
+        lens = self.zoom.get_lens(ww, wh)
+        page = self.doc.page(self.current_page if layer is self.c_da_layer else self.preview_page)
+        if lens is None or page is None or not page.can_render():
+            return
+
+        cx, cy, radius, lens_matrix = lens
+        name = layer.get_name()[:-len('_layer')]
+        wtype = self.cache.get_widget_type(name)
+        pw, ph = page.get_size(wtype)
+        page_scale = min(ww / pw, wh / ph)
+        resolution = self.zoom.magnification * self.zoom.scale * page_scale * layer.get_scale_factor()
+
+        cairo_context.save()
+        cairo_context.arc(cx, cy, radius, 0, 2 * math.pi)
+        cairo_context.clip()
+        cairo_context.set_source_rgb(0, 0, 0)
+        cairo_context.paint()
+        cairo_context.transform(lens_matrix)
+
+        raster = self.cache.get_lens_raster(page, resolution)
+        if raster is not None:
+            raster_resolution, raster_surface = raster
+            # same transformations as Page.render_cairo, from the widget to the raster pixels
+            cairo_context.scale(page_scale, page_scale)
+            if wtype == document.PdfPage.RIGHT:
+                cairo_context.translate(-pw, 0)
+            elif wtype == document.PdfPage.BOTTOM:
+                cairo_context.translate(0, -ph)
+            cairo_context.scale(1 / raster_resolution, 1 / raster_resolution)
+            cairo_context.set_source_surface(raster_surface, 0, 0)
+            cairo_context.paint()
+        else:
+            self.cache.prerender_lens(page, resolution, self.redraw_layers)
+            pb = self.cache.get(name, page.number())
+            if pb is not None:
+                cairo_context.set_source_surface(pb, 0, 0)
+                cairo_context.paint()
+        cairo_context.restore()
+
+        cairo_context.arc(cx, cy, radius, 0, 2 * math.pi)
+        cairo_context.set_line_width(2)
+        cairo_context.set_source_rgba(.2, .2, .2, .8)
+        cairo_context.stroke()
 
 
     def clear_zoom_cache(self):
@@ -1365,6 +1610,57 @@ class UI(builder.Builder):
         self.cache.clear_cache(self.scribbler.scribble_p_da.get_name() + '_zoomed')
 
 
+    def prerender_zoom(self):
+        """ Callback to render the zoomed current slides at idle time, while the zoom is animated.
+        """
+        for widget in [self.c_da, self.p_da_cur, self.scribbler.scribble_p_da]:
+            if widget.get_name() not in self.zoom_renders:
+                self.zoom_renders.add(widget.get_name())
+                GLib.idle_add(self.render_zoomed, widget)
+
+
+    def render_zoomed(self, widget):
+        """ Render the current slide of a widget to the zoomed cache, with the zoom that is the target of the animation.
+
+        Until this is done, drawing the widget scales its unzoomed page.
+
+        Args:
+            widget (:class:`~Gtk.Widget`):  the widget for which to render the zoomed slide
+
+        Returns:
+            `bool`: `False`, to run only once (:func:`~GLib.idle_add` convention)
+        """
+        self.zoom_renders.discard(widget.get_name())
+        widget.queue_draw()
+
+        page = self.doc.page(self.current_page if widget is self.c_da else self.preview_page)
+        window = widget.get_window()
+        zoom_scale = self.zoom.get_target()[0]
+        if page is None or not page.can_render() or window is None or zoom_scale == 1. or not widget.get_mapped():
+            return GLib.SOURCE_REMOVE
+
+        name = widget.get_name() + '_zoomed'
+        nb = page.number()
+        if self.cache.get(name, nb) is not None:
+            return GLib.SOURCE_REMOVE
+
+        ww, wh = widget.get_allocated_width(), widget.get_allocated_height()
+        scale = window.get_scale_factor()
+        try:
+            pb = window.create_similar_image_surface(cairo.Format.RGB24, ww * scale, wh * scale, scale)
+        except cairo.Error:
+            logger.warning('Failed creating an RGB24 surface sized {}x{} scale {} for widget {}'
+                           .format(ww * scale, wh * scale, scale, name), exc_info=True)
+            return GLib.SOURCE_REMOVE
+
+        cairo_prerender = cairo.Context(pb)
+        cairo_prerender.transform(self.zoom.get_matrix(ww, wh, target=True))
+        self.cache.render_page(name, page, cairo_prerender, ww, wh, self.cache.get_widget_type(name), scale)
+        self.cache.put(name, nb, pb)
+
+        return GLib.SOURCE_REMOVE
+
+
     def redraw_current_slide(self):
         """ Callback to queue a redraw of the current slides (in both winows).
         """
@@ -1373,6 +1669,16 @@ class UI(builder.Builder):
         self.scribbler.scribble_p_da.queue_draw()
 
 
+    def redraw_layers(self):
+        """ Callback to queue a redraw of the pointer and zoom selection above the current slides (in both windows).
+
+        Only the areas where they were last drawn and where they are now are redrawn.
+        """
+        for layer in [self.c_da_layer, self.p_da_cur_layer, self.scribbler.scribble_p_da_layer]:
+            for x, y, width, height in self.layer_extents.pop(layer, []) + self.get_layer_extents(layer):
+                layer.queue_draw_area(x, y, width, height)
+
+
     ##############################################################################
     ############################     User inputs      ############################
     ##############################################################################
@@ -1468,6 +1774,8 @@ class UI(builder.Builder):
             return True
         elif self.scribbler.track_scribble(widget, event):
             return True
+        elif widget in [self.c_da, self.p_da_cur] and self.zoom.track_lens(widget, event):
+            return True
         elif self.laser.track_pointer(widget, event):
             return True
         else:
@@ -35,6 +35,7 @@ import os
 import sys
 import ctypes
 import pathlib
+import hashlib
 
 if sys.version_info >= (3, 9):
     # Using parts introduced in 3.9
@@ -251,6 +252,44 @@ def get_log_path():
     return base_dir.joinpath('pympress.log')
 
 
+def get_scribbles_path(doc_path):
+    """ Returns the appropriate path to the file storing the scribbles of a document in the user data dirs.
+
+    Scribbles previously stored in the user cache dirs are moved to the data dirs.
+
+    Args:
+        doc_path (:class:`~pathlib.Path`): The path to the document
+
+    Returns:
+        :class:`~pathlib.Path`: path to the scribbles file.
+    """
+    if IS_WINDOWS:
+        base_dir = pathlib.Path(os.getenv('APPDATA'))
+        cache_dir = pathlib.Path(os.getenv('LOCALAPPDATA', os.getenv('APPDATA')))
+    elif IS_MAC_OS:
+        base_dir = pathlib.Path('~/Library/Application Support').expanduser()
+        cache_dir = pathlib.Path('~/Library/Caches').expanduser()
+    else:
+        base_dir = pathlib.Path(os.getenv('XDG_DATA_HOME', '~/.local/share')).expanduser()
+        cache_dir = pathlib.Path(os.getenv('XDG_CACHE_HOME', '~/.cache')).expanduser()
+
+    base_dir = base_dir.joinpath('pympress', 'scribbles')
+    if not base_dir.exists():
+        base_dir.mkdir(parents=True)
+
+    file_name = hashlib.sha1(str(doc_path.resolve()).encode('utf-8')).hexdigest() + '.scribbles'
+    path = base_dir.joinpath(file_name)
+
+    old_path = cache_dir.joinpath('pympress', 'scribbles', file_name)
+    if not path.exists() and old_path.exists() and old_path != path:
+        try:
+            old_path.replace(path)
+        except OSError:
+            logger.warning('Failed moving scribbles from {} to {}'.format(old_path, path), exc_info=True)
+
+    return path
+
+
 def fileopen(f):
     """ Call the right function to open files, based on the platform.
 
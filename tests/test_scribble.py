@@ -0,0 +1,49 @@
+""" Tests for the parts of :mod:`pympress.scribble` that do not need a display.
+"""
+
+import math
+import random
+
+import pytest
+
+pytest.importorskip('gi')
+scribble = pytest.importorskip('pympress.scribble')
+Stroke, Scribbler = scribble.Stroke, scribble.Scribbler
+
+
+def make_stroke(points, pressures=None, color=(1., 0., 0., 1.), width=3.):
+    stroke = Stroke(color, width)
+    for (x, y), pressure in zip(points, pressures or [1.] * len(points)):
+        stroke.append(x, y, pressure)
+    return stroke
+
+
+def flat(points):
+    return [coord for point in points for coord in point]
+
+
+def test_batch_outline_matches_outline():
+    pytest.importorskip('numpy')
+
+    random.seed(0)
+    strokes, widths = [], []
+    for n in (1, 2, 3, 10, 50):
+        angles = [random.uniform(0, 2 * math.pi) for _ in range(n)]
+        points, x, y = [], .5, .5
+        for angle in angles:
+            x, y = x + .02 * math.cos(angle), y + .02 * math.sin(angle)
+            points.append((x, y))
+        strokes.append(make_stroke(points, [random.random() for _ in range(n)]))
+        widths.append(random.uniform(1, 20))
+
+    ww, wh = 1280, 720
+    batched = Scribbler.batch_outline_geometry(strokes, ww, wh, widths)
+
+    for stroke, width, geometry in zip(strokes, widths, batched):
+        expected = Scribbler.outline_geometry(stroke.get_points(ww, wh),
+                                              [width * pressure / 2 for pressure in stroke.get_pressures()],
+                                              0, len(stroke) - 1)
+        assert len(geometry) == len(expected)
+        for got, part in zip(geometry, expected):
+            assert len(got) == len(part)
+            assert flat(got) == pytest.approx(flat(part))
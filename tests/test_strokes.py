@@ -0,0 +1,124 @@
+""" Tests for :mod:`pympress.strokes`, which does not need a display.
+"""
+
+import random
+
+import pytest
+
+from pympress.strokes import Stroke, StrokeIndex, ScribbleStore
+
+
+def make_stroke(points, pressures=None, color=(1., 0., 0., 1.), width=3.):
+    stroke = Stroke(color, width)
+    for (x, y), pressure in zip(points, pressures or [1.] * len(points)):
+        stroke.append(x, y, pressure)
+    return stroke
+
+
+def flat(points):
+    return [coord for point in points for coord in point]
+
+
+def assert_same_strokes(loaded, strokes):
+    assert len(loaded) == len(strokes)
+    for got, expected in zip(loaded, strokes):
+        assert tuple(got.color) == pytest.approx(tuple(expected.color))
+        assert got.width == pytest.approx(expected.width)
+        assert list(got.points) == pytest.approx(list(expected.points), abs=1e-6)
+        assert list(got.pressures) == list(expected.pressures)
+
+
+def test_simplify_straight_line():
+    stroke = make_stroke([(i / 100, i / 100) for i in range(50)])
+    stroke.simplify(900, 900)
+
+    assert len(stroke) == 2
+    assert list(stroke.points) == pytest.approx([0, 0, .49, .49])
+
+
+def test_simplify_keeps_corners_and_pressure_changes():
+    corner = make_stroke([(i / 100, .1) for i in range(20)] + [(.19, .1 + i / 100) for i in range(1, 20)])
+    corner.simplify(900, 900)
+    assert flat(corner.get_points(1, 1)) == pytest.approx([0, .1, .19, .1, .19, .29])
+
+    pressures = [1.] * 10 + [.1] * 10
+    pressed = make_stroke([(i / 100, .1) for i in range(20)], pressures, width=30)
+    pressed.simplify(900, 900)
+    assert len(pressed) > 2
+    assert {pressed.pressures[0], pressed.pressures[-1]} == {255, 26}
+
+
+def test_cut_interpolates_at_span_bounds():
+    stroke = make_stroke([(0., .5), (1., .5)], [1., 0.])
+    left, right = stroke.cut([(.25, .75)])
+
+    assert flat(left.get_points(1, 1)) == pytest.approx([0, .5, .25, .5])
+    assert flat(right.get_points(1, 1)) == pytest.approx([.75, .5, 1, .5])
+    assert list(left.pressures) == [255, 191] and list(right.pressures) == [64, 0]
+
+    assert stroke.cut([(0, 1)]) == []
+    assert len(stroke.cut([None])) == 1
+
+
+def test_store_round_trip(tmp_path):
+    path = tmp_path / 'slides.pdf.scribbles'
+    first, second, third = (make_stroke([(random.random(), random.random()) for _ in range(n)],
+                                        [random.random() for _ in range(n)], (.1, .2, .3, .4), n) for n in (1, 5, 40))
+
+    store = ScribbleStore(path)
+    store.add('page:0', first)
+    store.add('page:0', second)
+    store.replace('page:3', [third])
+    store.add('label:ü', first)
+    assert_same_strokes(store.load('page:0'), [first, second])
+
+    reopened = ScribbleStore(path)
+    assert sorted(reopened.keys()) == ['label:ü', 'page:0', 'page:3']
+    assert_same_strokes(reopened.load('page:0'), [first, second])
+    assert_same_strokes(reopened.load('page:3'), [third])
+    assert_same_strokes(reopened.load('label:ü'), [first])
+
+    reopened.replace('page:0', [])
+    assert ScribbleStore(path).load('page:0') == []
+
+
+def test_store_recovers_truncated_file(tmp_path):
+    path = tmp_path / 'slides.pdf.scribbles'
+    kept, lost, added = (make_stroke([(.1 * n, .2), (.3, .1 * n)]) for n in range(1, 4))
+
+    store = ScribbleStore(path)
+    store.add('page:1', kept)
+    store.add('page:1', lost)
+
+    with open(path, 'r+b') as f:
+        f.truncate(path.stat().st_size - 3)
+
+    recovered = ScribbleStore(path)
+    assert_same_strokes(recovered.load('page:1'), [kept])
+
+    # The truncated record is overwritten by the next one
+    recovered.add('page:1', added)
+    assert_same_strokes(ScribbleStore(path).load('page:1'), [kept, added])
+
+
+def test_store_ignores_unknown_format(tmp_path):
+    path = tmp_path / 'slides.pdf.scribbles'
+    path.write_bytes(b'not scribbles')
+
+    assert ScribbleStore(path).keys() == []
+
+
+def test_stroke_index():
+    top_left = make_stroke([(.05, .05), (.1, .1)])
+    bottom_right = make_stroke([(.9, .9), (.95, .92)])
+    across = make_stroke([(.05, .5), (.95, .5)])
+    index = StrokeIndex([top_left, bottom_right, across])
+
+    assert index.query((0, 0, .12, .12)) == {top_left}
+    assert index.query((.85, .85, 1, 1)) == {bottom_right}
+    assert index.query((.45, .45, .55, .55)) == {across}
+    assert index.query((0, 0, 1, 1)) == {top_left, bottom_right, across}
+
+    index.remove(across)
+    assert index.query((.45, .45, .55, .55)) == set()
+    assert index.query((0, 0, 1, 1)) == {top_left, bottom_right}